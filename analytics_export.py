@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Analytics Export - xuất payments / handovers / buildings ra Parquet cho phân tích offline
+Thay cho việc lấy số liệu từ file backup JSON.
+
+- payments/ và handovers/ chia partition kiểu Hive: month=YYYY-MM/building_id=N/*.parquet
+  (building_id = 0 khi giao dịch không thuộc tòa nhà nào)
+- Kiểu dữ liệu: tiền là số nguyên VND (int64), thời gian timestamp, payment_method/status
+  dictionary-encoded
+- Đọc database theo batch (yield_per, server-side cursor trên PostgreSQL) và ghi từng batch:
+  bộ nhớ tối đa ~ số partition × batch_size dòng (row group đang ghi dở), không phụ thuộc tổng số dòng
+- Cần pyarrow (requirements-analytics.txt, tùy chọn)
+
+Cách dùng:
+    python analytics_export.py --output export/                     # thư mục Parquet
+    python analytics_export.py --output export/ --zip export.zip    # kèm file nén để gửi kế toán
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zipfile
+
+from sqlalchemy import select
+
+from database_production import Building, Handover, Payment, engine, get_vietnam_time
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+EXPORT_FORMAT_VERSION = 1
+
+def _money(value):
+    return None if value is None else int(round(value))
+
+def _month(created_at):
+    return created_at.strftime("%Y-%m") if created_at else "unknown"
+
+def table_specs():
+    """(tên, cột SQLAlchemy, schema Arrow, hàm chuyển giá trị theo cột, partitioned)"""
+    method = pa.dictionary(pa.int8(), pa.string())
+    status = pa.dictionary(pa.int8(), pa.string())
+    return [
+        ("payments", Payment, [
+            ("id", pa.int64(), None),
+            ("building_id", pa.int32(), lambda value: value or 0),
+            ("booking_id", pa.string(), None),
+            ("guest_name", pa.string(), None),
+            ("room_number", pa.string(), None),
+            ("amount_due", pa.int64(), _money),
+            ("amount_collected", pa.int64(), _money),
+            ("payment_method", method, None),
+            ("collected_by", pa.string(), None),
+            ("notes", pa.string(), None),
+            ("status", status, None),
+            ("added_by_user_id", pa.int32(), None),
+            ("created_at", pa.timestamp("us"), None),
+            ("updated_at", pa.timestamp("us"), None),
+        ], True),
+        ("handovers", Handover, [
+            ("id", pa.int64(), None),
+            ("building_id", pa.int32(), lambda value: value or 0),
+            ("from_person", pa.string(), None),
+            ("to_person", pa.string(), None),
+            ("amount", pa.int64(), _money),
+            ("notes", pa.string(), None),
+            ("status", status, None),
+            ("handover_by_user_id", pa.int32(), None),
+            ("created_at", pa.timestamp("us"), None),
+            ("updated_at", pa.timestamp("us"), None),
+        ], True),
+        ("buildings", Building, [
+            ("id", pa.int32(), None),
+            ("name", pa.string(), None),
+            ("address", pa.string(), None),
+            ("description", pa.string(), None),
+            ("is_active", pa.bool_(), None),
+            ("created_at", pa.timestamp("us"), None),
+        ], False),
+    ]
+
+def arrow_schema(columns, partitioned):
+    fields = [pa.field(name, arrow_type) for name, arrow_type, _ in columns]
+    if partitioned:
+        fields.append(pa.field("month", pa.string()))
+    return pa.schema(fields)
+
+def record_batches(conn, model, columns, partitioned, batch_size):
+    """RecordBatch theo từng batch dòng đọc từ database (thêm cột partition `month` nếu cần)"""
+    names = [name for name, _, _ in columns]
+    schema = arrow_schema(columns, partitioned)
+
+    query = select(*(getattr(model, name) for name in names)).order_by(model.id)
+    result = conn.execution_options(yield_per=batch_size).execute(query)
+    for rows in result.partitions():
+        arrays = []
+        for index, (_, arrow_type, convert) in enumerate(columns):
+            values = [row[index] for row in rows]
+            if convert:
+                values = [convert(value) for value in values]
+            arrays.append(pa.array(values, type=arrow_type))
+        if partitioned:
+            created_at = names.index("created_at")
+            arrays.append(pa.array([_month(row[created_at]) for row in rows], type=pa.string()))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def export_parquet(output_dir, target_engine=None, batch_size=None, verbose=True):
+    """Ghi Parquet vào output_dir, trả về manifest (số dòng theo bảng, thời gian chạy)"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("Cần cài pyarrow để xuất Parquet")
+    target_engine = target_engine or engine
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {
+        "format_version": EXPORT_FORMAT_VERSION,
+        "exported_at": get_vietnam_time().isoformat(),
+        "money_unit": "VND (integer)",
+        "tables": {},
+    }
+    for name, model, columns, partitioned in table_specs():
+        counted = {"rows": 0}
+
+        def counting(batches):
+            for batch in batches:
+                counted["rows"] += batch.num_rows
+                yield batch
+
+        with target_engine.connect() as conn:
+            data = counting(record_batches(conn, model, columns, partitioned, batch_size))
+            options = {}
+            if partitioned:
+                options["partitioning"] = ds.partitioning(
+                    pa.schema([("month", pa.string()), ("building_id", pa.int32())]), flavor="hive"
+                )
+            ds.write_dataset(
+                data, os.path.join(output_dir, name), schema=arrow_schema(columns, partitioned), format="parquet",
+                basename_template="part-{i}.parquet", existing_data_behavior="delete_matching",
+                max_rows_per_group=batch_size, **options
+            )
+        manifest["tables"][name] = {
+            "rows": counted["rows"],
+            "partitioning": ["month", "building_id"] if partitioned else [],
+        }
+        if verbose:
+            print(f"   {name}: {counted['rows']:,} dòng")
+
+    manifest["seconds"] = round(time.perf_counter() - started, 2)
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def zip_directory(source_dir, zip_path):
+    """Nén thư mục export (Parquet đã nén sẵn -> chỉ lưu, không nén lại)"""
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for root, _, files in os.walk(source_dir):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                archive.write(path, os.path.relpath(path, source_dir))
+    return zip_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất dữ liệu ra Parquet cho phân tích offline")
+    parser.add_argument("--output", default="export", help="Thư mục đích")
+    parser.add_argument("--zip", help="Ghi thêm file zip")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--clean", action="store_true", help="Xóa thư mục đích trước khi xuất")
+    args = parser.parse_args()
+
+    if not PYARROW_AVAILABLE:
+        print("❌ Cần cài pyarrow: pip install pyarrow")
+        return 1
+    if args.clean and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+
+    print(f"📦 Xuất Parquet vào {args.output}/")
+    manifest = export_parquet(args.output, batch_size=args.batch_size)
+    if args.zip:
+        zip_directory(args.output, args.zip)
+        print(f"🗜️ Đã nén: {args.zip}")
+    print(f"✅ Xong sau {manifest['seconds']}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Analytics SQL - truy vấn ad-hoc (chỉ đọc) cho owner bằng DuckDB trên snapshot dữ liệu
+Thay cho việc viết endpoint riêng cho từng báo cáo một lần hoặc chạy truy vấn nặng trên database chính.
+
+- Snapshot = file DuckDB dựng từ export Parquet (analytics_export.py): bảng payments, handovers, buildings
+  (cột partition month, building_id có sẵn). Tự dựng lại khi cũ hơn ANALYTICS_SNAPSHOT_MAX_AGE giây
+- Truy vấn mở snapshot read_only, tắt truy cập file (enable_external_access) và khóa cấu hình
+  -> chỉ đọc được bảng trong snapshot, không ghi/không đọc file khác
+- Giới hạn: ANALYTICS_QUERY_TIMEOUT giây (interrupt), ANALYTICS_MAX_ROWS dòng trả về,
+  ANALYTICS_THREADS / ANALYTICS_MEMORY_LIMIT cho DuckDB
+- Cần duckdb + pyarrow (requirements-analytics.txt, tùy chọn)
+
+Cách dùng:
+    python analytics_sql.py refresh
+    python analytics_sql.py "SELECT month, sum(amount_collected) FROM payments GROUP BY 1 ORDER BY 1"
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import analytics_export
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = analytics_export.PYARROW_AVAILABLE
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+ANALYTICS_SNAPSHOT_FILE = os.getenv("ANALYTICS_SNAPSHOT_FILE", "analytics_snapshot.duckdb")
+ANALYTICS_SNAPSHOT_MAX_AGE = int(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", "3600"))
+ANALYTICS_QUERY_TIMEOUT = float(os.getenv("ANALYTICS_QUERY_TIMEOUT", "10"))
+ANALYTICS_MAX_ROWS = int(os.getenv("ANALYTICS_MAX_ROWS", "1000"))
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", "2"))
+ANALYTICS_MEMORY_LIMIT = os.getenv("ANALYTICS_MEMORY_LIMIT", "256MB")
+
+SNAPSHOT_TABLES = ("payments", "handovers", "buildings")
+_READ_ONLY_START = re.compile(r"^\s*(SELECT|WITH|FROM)\b", re.IGNORECASE)
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+class AnalyticsError(Exception):
+    """Truy vấn không hợp lệ / lỗi khi chạy"""
+
+class AnalyticsTimeout(AnalyticsError):
+    """Truy vấn chạy quá ANALYTICS_QUERY_TIMEOUT"""
+
+class Snapshot:
+    """File DuckDB chỉ đọc, dựng lại từ database khi quá hạn"""
+
+    def __init__(self, path=None, max_age=None, target_engine=None):
+        self.path = path or ANALYTICS_SNAPSHOT_FILE
+        self.max_age = ANALYTICS_SNAPSHOT_MAX_AGE if max_age is None else max_age
+        self.target_engine = target_engine
+        self._lock = threading.Lock()
+
+    def built_at(self):
+        """Thời điểm dựng snapshot (epoch) hoặc None"""
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def is_stale(self, now=None):
+        built_at = self.built_at()
+        return built_at is None or (now or time.time()) - built_at > self.max_age
+
+    def refresh(self, if_stale=False):
+        """Export Parquet -> bảng DuckDB trong file tạm -> thay file snapshot (atomic)
+
+        if_stale=True: bỏ qua nếu request khác vừa dựng xong trong lúc chờ lock (trả về None).
+        """
+        with self._lock:
+            if if_stale and not self.is_stale():
+                return None
+            work_dir = tempfile.mkdtemp(prefix="analytics_snapshot_")
+            try:
+                export_dir = os.path.join(work_dir, "export")
+                manifest = analytics_export.export_parquet(export_dir, self.target_engine, verbose=False)
+                building_path = os.path.join(work_dir, "snapshot.duckdb")
+                conn = duckdb.connect(building_path)
+                try:
+                    for table in SNAPSHOT_TABLES:
+                        source = os.path.join(export_dir, table)
+                        if manifest["tables"][table]["rows"]:
+                            conn.execute(
+                                f"CREATE TABLE {table} AS SELECT * FROM read_parquet(?, hive_partitioning = true)",
+                                [os.path.join(source, "**", "*.parquet")],
+                            )
+                        else:
+                            # Bảng rỗng: vẫn tạo với đúng cột để truy vấn không lỗi
+                            conn.register("empty_source", self._empty_table(table))
+                            conn.execute(f"CREATE TABLE {table} AS SELECT * FROM empty_source")
+                            conn.unregister("empty_source")
+                finally:
+                    conn.close()
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                shutil.move(building_path, self.path + ".tmp")
+                os.replace(self.path + ".tmp", self.path)
+                return manifest
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def ensure_fresh(self):
+        if self.is_stale():
+            self.refresh(if_stale=True)
+
+    @staticmethod
+    def _empty_table(table):
+        for name, _, columns, partitioned in analytics_export.table_specs():
+            if name == table:
+                schema = analytics_export.arrow_schema(columns, partitioned)
+                if partitioned:
+                    # building_id nằm trong đường dẫn partition, đặt lại vào cuối như khi đọc hive
+                    schema = schema.remove(schema.get_field_index("building_id")).append(schema.field("building_id"))
+                return schema.empty_table()
+        raise KeyError(table)
+
+def validate_sql(sql):
+    """SQL đã bỏ comment và dấu ; cuối - chỉ nhận một câu SELECT / WITH"""
+    cleaned = _COMMENTS.sub(" ", sql or "").strip().rstrip(";").strip()
+    if not cleaned:
+        raise AnalyticsError("SQL rỗng")
+    if not _READ_ONLY_START.match(cleaned):
+        raise AnalyticsError("Chỉ cho phép truy vấn SELECT / WITH")
+    if ";" in cleaned:
+        raise AnalyticsError("Chỉ cho phép một câu lệnh")
+    return cleaned
+
+def _json_value(value):
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def run_query(sql, snapshot, max_rows=None, timeout=None):
+    """Chạy SQL trên snapshot: {columns, rows, row_count, truncated, seconds, snapshot_at}"""
+    if not DUCKDB_AVAILABLE:
+        raise AnalyticsError("Cần cài duckdb và pyarrow")
+    max_rows = max_rows or ANALYTICS_MAX_ROWS
+    timeout = timeout or ANALYTICS_QUERY_TIMEOUT
+    cleaned = validate_sql(sql)
+    snapshot.ensure_fresh()
+
+    conn = duckdb.connect(snapshot.path, read_only=True, config={
+        "enable_external_access": False,
+        "threads": ANALYTICS_THREADS,
+        "memory_limit": ANALYTICS_MEMORY_LIMIT,
+        "lock_configuration": True,
+    })
+    timer = threading.Timer(timeout, conn.interrupt)
+    started = time.perf_counter()
+    timer.start()
+    try:
+        # Bọc trong subquery: chặn câu lệnh thứ hai và để DuckDB tự dừng sau max_rows + 1 dòng
+        result = conn.execute(f"SELECT * FROM ({cleaned}) AS q LIMIT {max_rows + 1}")
+        columns = [column[0] for column in result.description]
+        rows = result.fetchall()
+    except duckdb.InterruptException:
+        raise AnalyticsTimeout(f"Truy vấn vượt quá {timeout:g}s")
+    except duckdb.Error as e:
+        raise AnalyticsError(str(e).splitlines()[0])
+    finally:
+        timer.cancel()
+        conn.close()
+
+    truncated = len(rows) > max_rows
+    rows = rows[:max_rows]
+    return {
+        "columns": columns,
+        "rows": [[_json_value(value) for value in row] for row in rows],
+        "row_count": len(rows),
+        "truncated": truncated,
+        "seconds": round(time.perf_counter() - started, 3),
+        "snapshot_at": datetime.fromtimestamp(snapshot.built_at()).isoformat(timespec="seconds"),
+    }
+
+snapshot = Snapshot()
+
+def main():
+    if not DUCKDB_AVAILABLE:
+        print("❌ Cần cài duckdb và pyarrow: pip install -r requirements-analytics.txt")
+        return 1
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 2
+    if sys.argv[1] == "refresh":
+        manifest = snapshot.refresh()
+        print(f"✅ Snapshot {snapshot.path}: " + ", ".join(
+            f"{name} {table['rows']:,}" for name, table in manifest["tables"].items()))
+        return 0
+    try:
+        result = run_query(sys.argv[1], snapshot)
+    except AnalyticsError as e:
+        print(f"❌ {e}")
+        return 1
+    print(" | ".join(result["columns"]))
+    for row in result["rows"]:
+        print(" | ".join(str(value) for value in row))
+    print(f"({result['row_count']} dòng{', đã cắt' if result['truncated'] else ''}, {result['seconds']}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
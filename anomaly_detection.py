@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Anomaly Detection - job phân tích hàng đêm tìm khoản thu đáng ngờ
+Đọc payments trong ANOMALY_WINDOW_DAYS ngày gần nhất thành mảng NumPy theo cột, tính toàn bộ
+bằng phép toán vector (không lặp Python theo dòng) rồi ghi kết quả vào bảng anomaly_findings.
+
+Các loại bất thường:
+- shortfall: thu thiếu nhiều so với phải thu - tỷ lệ thiếu có robust z-score cao trong tòa nhà
+- room_amount: số tiền lệch hẳn so với các lần thu khác của cùng phòng - robust z-score theo
+  (tòa nhà, phòng) VÀ lệch so với trung bình trượt ANOMALY_ROLLING_WINDOW lần thu liền trước
+  (theo thứ tự nhập - id; không đổi datetime sang NumPy, phần chậm nhất khi đọc 1 triệu dòng)
+  (phòng đổi giá thì chỉ vài lần đầu bị đánh dấu, sau đó trung bình trượt bắt kịp)
+- collector_cash_share: người thu có tỷ lệ tiền mặt khác thường so với người thu khác cùng tòa nhà
+
+Robust z-score = (x - median) / (1.4826 × MAD); MAD = 0 -> dùng 1.2533 × trung bình |x - median|.
+Mỗi loại giữ tối đa ANOMALY_MAX_FINDINGS kết quả điểm cao nhất. Mỗi lần chạy thay toàn bộ bảng.
+Cần numpy (requirements-analytics.txt, tùy chọn).
+
+Lịch chạy: main.py chạy job hàng ngày trong process lúc ANOMALY_SCHEDULE_TIME (giờ Việt Nam,
+mặc định 02:30, rỗng = tắt) qua job_scheduler.DailyJob - không cần cron.
+
+Chạy tay một lần:
+    python anomaly_detection.py run
+    python anomaly_detection.py run --days 30
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, insert, select
+
+from database_production import AnomalyFinding, Payment, engine, get_vietnam_time
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+ANOMALY_WINDOW_DAYS = int(os.getenv("ANOMALY_WINDOW_DAYS", "90"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+ANOMALY_MIN_SHORTFALL = float(os.getenv("ANOMALY_MIN_SHORTFALL", "0.3"))  # thiếu >= 30% phải thu
+ANOMALY_ROLLING_WINDOW = int(os.getenv("ANOMALY_ROLLING_WINDOW", "20"))
+ANOMALY_MIN_GROUP_SIZE = int(os.getenv("ANOMALY_MIN_GROUP_SIZE", "5"))
+ANOMALY_MIN_COLLECTOR_PAYMENTS = int(os.getenv("ANOMALY_MIN_COLLECTOR_PAYMENTS", "20"))
+ANOMALY_MAX_FINDINGS = int(os.getenv("ANOMALY_MAX_FINDINGS", "500"))  # mỗi loại
+
+KINDS = ("shortfall", "room_amount", "collector_cash_share")
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+findings_table = AnomalyFinding.__table__
+
+# --- Đọc dữ liệu theo cột ---
+
+def _encode(values, names, codes):
+    """Mã số nguyên cho chuỗi (dictionary encoding) - mã 0 = rỗng"""
+    def code(value):
+        value = (value or "").strip()
+        if value not in codes:
+            codes[value] = len(names)
+            names.append(value)
+        return codes[value]
+    return np.fromiter((code(value) for value in values), dtype=np.int32, count=len(values))
+
+def load_payments(conn, since, batch_size=50000):
+    """dict cột -> mảng NumPy, đọc theo batch
+
+    room_number / collected_by lưu dạng mã số (tên trong room_names / collector_names):
+    1 triệu dòng chỉ tốn vài chục MB thay vì giữ hàng triệu tuple/chuỗi Python.
+    """
+    query = select(
+        Payment.id, Payment.building_id, Payment.room_number, Payment.collected_by, Payment.payment_method,
+        Payment.amount_due, Payment.amount_collected,
+    ).where(Payment.created_at >= since)
+    names = {"room_number": [""], "collected_by": [""]}
+    codes = {"room_number": {"": 0}, "collected_by": {"": 0}}
+    chunks = {column: [] for column in ("id", "building_id", "room_number", "collected_by", "cash",
+                                        "amount_due", "amount_collected")}
+
+    result = conn.execution_options(yield_per=batch_size).execute(query)
+    for rows in result.partitions():
+        count = len(rows)
+        ids, buildings, rooms, collectors, methods, due, collected = zip(*rows)
+        chunks["id"].append(np.fromiter(ids, dtype=np.int64, count=count))
+        chunks["building_id"].append(np.fromiter((value or 0 for value in buildings), dtype=np.int64, count=count))
+        chunks["room_number"].append(_encode(rooms, names["room_number"], codes["room_number"]))
+        chunks["collected_by"].append(_encode(collectors, names["collected_by"], codes["collected_by"]))
+        chunks["cash"].append(np.fromiter((value == "cash" for value in methods), dtype=bool, count=count))
+        chunks["amount_due"].append(np.fromiter((value or 0 for value in due), dtype=np.float64, count=count))
+        chunks["amount_collected"].append(np.fromiter((value or 0 for value in collected), dtype=np.float64, count=count))
+
+    dtypes = {"id": np.int64, "building_id": np.int64, "room_number": np.int32, "collected_by": np.int32,
+              "cash": bool, "amount_due": np.float64, "amount_collected": np.float64}
+    data = {column: np.concatenate(parts) if parts else np.zeros(0, dtype=dtypes[column])
+            for column, parts in chunks.items()}
+    data["room_names"] = names["room_number"]
+    data["collector_names"] = names["collected_by"]
+    return data
+
+# --- Thống kê theo nhóm (vector hóa) ---
+
+def group_codes(*keys):
+    """Mã nhóm 0..n-1 cho tổ hợp các cột khóa, và số nhóm"""
+    codes = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        _, inverse = np.unique(key, return_inverse=True)
+        codes = codes * (inverse.max(initial=0) + 1) + inverse.reshape(-1)
+    _, codes = np.unique(codes, return_inverse=True)
+    codes = codes.reshape(-1)
+    return codes, int(codes.max(initial=-1)) + 1
+
+def group_median(groups, values, n_groups):
+    """Median theo nhóm (NaN với nhóm rỗng) và số phần tử mỗi nhóm"""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    median = np.full(n_groups, np.nan)
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    median[present] = (ordered[low] + ordered[high]) / 2
+    return median, counts
+
+def robust_z(groups, values, n_groups):
+    """(robust z-score, median của nhóm, số phần tử nhóm) cho từng phần tử"""
+    median, counts = group_median(groups, values, n_groups)
+    deviation = np.abs(values - median[groups])
+    mad, _ = group_median(groups, deviation, n_groups)
+    mean_ad = np.bincount(groups, weights=deviation, minlength=n_groups) / np.maximum(counts, 1)
+    scale = np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * mean_ad)[groups]
+    z = np.divide(values - median[groups], scale, out=np.zeros_like(values), where=scale > 0)
+    return z, median[groups], counts[groups]
+
+def rolling_stats(groups, values, order_key, window):
+    """Trung bình, độ lệch chuẩn, số phần tử của tối đa `window` giá trị liền trước trong cùng nhóm"""
+    order = np.lexsort((order_key, groups))
+    ordered_groups = groups[order]
+    ordered = values[order]
+    position = np.arange(len(ordered))
+    window_start = np.maximum(np.searchsorted(ordered_groups, ordered_groups, side="left"), position - window)
+    count = position - window_start
+
+    cumulative = np.concatenate(([0.0], np.cumsum(ordered)))
+    cumulative_sq = np.concatenate(([0.0], np.cumsum(ordered * ordered)))
+    total = cumulative[position] - cumulative[window_start]
+    total_sq = cumulative_sq[position] - cumulative_sq[window_start]
+    mean = np.divide(total, count, out=np.full(len(ordered), np.nan), where=count > 0)
+    mean_sq = np.divide(total_sq, count, out=np.full(len(ordered), np.nan), where=count > 0)
+    std = np.sqrt(np.clip(mean_sq - mean * mean, 0, None))
+
+    result = [np.empty_like(mean), np.empty_like(std), np.empty_like(count)]
+    for target, source in zip(result, (mean, std, count)):
+        target[order] = source
+    return tuple(result)
+
+# --- Các phép phát hiện: mỗi hàm trả về list dict dòng anomaly_findings ---
+
+def _top(flagged, z):
+    """Vị trí các phần tử bị đánh dấu, giữ ANOMALY_MAX_FINDINGS điểm |z| cao nhất"""
+    positions = np.flatnonzero(flagged)
+    return positions[np.argsort(-np.abs(z[positions]), kind="stable")[:ANOMALY_MAX_FINDINGS]]
+
+def detect_shortfalls(data):
+    due = data["amount_due"]
+    candidates = np.flatnonzero(due > 0)
+    ratio = np.clip((due[candidates] - data["amount_collected"][candidates]) / due[candidates], 0, 1)
+    groups, n_groups = group_codes(data["building_id"][candidates])
+    z, _, counts = robust_z(groups, ratio, n_groups)
+    flagged = (ratio >= ANOMALY_MIN_SHORTFALL) & (z >= ANOMALY_Z_THRESHOLD) & (counts >= ANOMALY_MIN_GROUP_SIZE)
+    top = _top(flagged, z)
+    return [
+        _payment_finding(data, index, "shortfall", score, data["amount_collected"][index], data["amount_due"][index],
+                         f"Thiếu {shortfall:.0%} so với phải thu")
+        for index, shortfall, score in zip(candidates[top], ratio[top], z[top])
+    ]
+
+def detect_room_amounts(data):
+    candidates = np.flatnonzero((data["amount_collected"] > 0) & (data["room_number"] != 0))
+    # Tiền theo thang log: lệch 2 lần ở phòng rẻ hay phòng đắt đều như nhau, cumsum không mất chính xác
+    amounts = np.log(data["amount_collected"][candidates])
+    groups, n_groups = group_codes(data["building_id"][candidates], data["room_number"][candidates])
+    z, median, counts = robust_z(groups, amounts, n_groups)
+    rolling_mean, rolling_std, rolling_count = rolling_stats(
+        groups, amounts, data["id"][candidates], ANOMALY_ROLLING_WINDOW)
+    rolling_scale = np.maximum(rolling_std, 0.05)
+    rolling_z = np.divide(amounts - rolling_mean, rolling_scale, out=np.zeros_like(amounts), where=rolling_count > 0)
+    # Chưa đủ lịch sử trượt -> chỉ dựa vào robust z của cả nhóm
+    recent_outlier = (rolling_count < ANOMALY_MIN_GROUP_SIZE) | (np.abs(rolling_z) >= ANOMALY_Z_THRESHOLD)
+    flagged = (np.abs(z) >= ANOMALY_Z_THRESHOLD) & recent_outlier & (counts >= ANOMALY_MIN_GROUP_SIZE)
+    top = _top(flagged, z)
+    return [
+        _payment_finding(data, index, "room_amount", score, data["amount_collected"][index], typical,
+                         f"Phòng thường thu ~{typical:,.0f}, lần này {data['amount_collected'][index]:,.0f}")
+        for index, score, typical in zip(candidates[top], z[top], np.exp(median[top]))
+    ]
+
+def detect_collector_cash_share(data):
+    pairs, n_pairs = group_codes(data["building_id"], data["collected_by"])
+    if not n_pairs:
+        return []
+    amounts = data["amount_collected"]
+    total = np.bincount(pairs, weights=amounts, minlength=n_pairs)
+    cash = np.bincount(pairs, weights=np.where(data["cash"], amounts, 0), minlength=n_pairs)
+    payment_count = np.bincount(pairs, minlength=n_pairs)
+    # Một dòng đại diện cho mỗi cặp (tòa nhà, người thu)
+    _, first = np.unique(pairs, return_index=True)
+    building_ids = data["building_id"][first]
+    collectors = data["collected_by"][first]
+
+    eligible = np.flatnonzero((payment_count >= ANOMALY_MIN_COLLECTOR_PAYMENTS) & (total > 0) & (collectors != 0))
+    share = cash[eligible] / total[eligible]
+    groups, n_groups = group_codes(building_ids[eligible])
+    z, median, counts = robust_z(groups, share, n_groups)
+    flagged = (np.abs(z) >= ANOMALY_Z_THRESHOLD) & (counts >= 3)
+    top = _top(flagged, z)
+    return [{
+        "kind": "collector_cash_share", "score": float(score), "building_id": int(building_ids[pair]),
+        "payment_id": None, "room_number": None, "collected_by": data["collector_names"][collectors[pair]],
+        "value": float(value), "baseline": float(typical),
+        "details": f"Tiền mặt {value:.0%} tổng thu ({payment_count[pair]} lần), người thu khác ~{typical:.0%}",
+    } for pair, score, value, typical in zip(eligible[top], z[top], share[top], median[top])]
+
+def _payment_finding(data, index, kind, score, value, baseline, details):
+    return {
+        "kind": kind, "score": float(score), "building_id": int(data["building_id"][index]),
+        "payment_id": int(data["id"][index]), "room_number": data["room_names"][data["room_number"][index]] or None,
+        "collected_by": data["collector_names"][data["collected_by"][index]] or None,
+        "value": round(float(value), 2), "baseline": round(float(baseline), 2), "details": details,
+    }
+
+DETECTORS = {
+    "shortfall": detect_shortfalls,
+    "room_amount": detect_room_amounts,
+    "collector_cash_share": detect_collector_cash_share,
+}
+
+def detect(data):
+    """Chạy mọi phép phát hiện trên dữ liệu dạng cột"""
+    findings = []
+    for kind in KINDS:
+        findings.extend(DETECTORS[kind](data))
+    return findings
+
+def run(target_engine=None, days=None, verbose=True):
+    """Đọc payments, phát hiện bất thường, thay nội dung anomaly_findings; trả về tóm tắt lần chạy"""
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("Cần cài numpy để phân tích bất thường")
+    target_engine = target_engine or engine
+    days = days or ANOMALY_WINDOW_DAYS
+    run_at = get_vietnam_time().replace(tzinfo=None, microsecond=0)
+    started = time.perf_counter()
+
+    with target_engine.connect() as conn:
+        data = load_payments(conn, run_at - timedelta(days=days))
+    loaded = time.perf_counter()
+    findings = detect(data)
+    analyzed = time.perf_counter()
+
+    with target_engine.begin() as conn:
+        conn.execute(findings_table.delete())
+        if findings:
+            conn.execute(insert(findings_table), [dict(row, run_at=run_at) for row in findings])
+
+    summary = {
+        "run_at": run_at.isoformat(),
+        "payments": len(data["id"]),
+        "findings": {kind: sum(1 for row in findings if row["kind"] == kind) for kind in KINDS},
+        "load_seconds": round(loaded - started, 2),
+        "analyze_seconds": round(analyzed - loaded, 2),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    if verbose:
+        print(f"🔎 {summary['payments']:,} payments / {days} ngày: đọc {summary['load_seconds']}s, "
+              f"phân tích {summary['analyze_seconds']}s")
+        for kind, count in summary["findings"].items():
+            print(f"   {kind}: {count}")
+    return summary
+
+# --- Tra cứu cho owner ---
+
+def latest_findings(db, kind=None, building_id=None, limit=100):
+    """Kết quả lần chạy gần nhất, điểm cao nhất trước, kèm số lượng theo loại"""
+    query = select(findings_table)
+    if kind:
+        query = query.where(findings_table.c.kind == kind)
+    if building_id is not None:
+        query = query.where(findings_table.c.building_id == building_id)
+    query = query.order_by(func.abs(findings_table.c.score).desc(), findings_table.c.id).limit(limit)
+    findings = []
+    for row in db.execute(query).mappings():
+        finding = dict(row)
+        finding["run_at"] = finding["run_at"].isoformat()
+        finding["score"] = round(finding["score"], 2)
+        findings.append(finding)
+
+    counts = {kind_name: 0 for kind_name in KINDS}
+    run_at = None
+    summary = select(findings_table.c.kind, func.count(), func.max(findings_table.c.run_at)).group_by(
+        findings_table.c.kind)
+    for kind_name, count, kind_run_at in db.execute(summary):
+        counts[kind_name] = count
+        run_at = max(filter(None, (run_at, kind_run_at)), default=None)
+    return {"run_at": run_at.isoformat() if run_at else None, "counts": counts, "findings": findings}
+
+def main():
+    parser = argparse.ArgumentParser(description="Phân tích bất thường khoản thu (job hàng đêm)")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--days", type=int, default=ANOMALY_WINDOW_DAYS, help="Số ngày dữ liệu gần nhất")
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        print("❌ Cần cài numpy: pip install -r requirements-analytics.txt")
+        return 1
+    summary = run(days=args.days)
+    print(f"✅ Xong sau {summary['seconds']}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
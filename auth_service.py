@@ -3,7 +3,6 @@ Authentication và User Management Service
 Xử lý đăng nhập, đăng ký, quản lý người dùng
 """
 
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
@@ -16,16 +15,24 @@ SECRET_KEY = os.getenv("SECRET_KEY", "payment-secret-2025-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 giờ
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing - passlib/bcrypt chỉ import khi cần
+_pwd_context = None
+
+def get_pwd_context():
+    """Tạo CryptContext bcrypt lần đầu sử dụng"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Xác minh mật khẩu"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash mật khẩu"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Tạo JWT token"""
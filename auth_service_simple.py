@@ -5,11 +5,15 @@ Sử dụng SHA256 thay vì bcrypt để tránh compatibility issues
 
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
 from database_production import User, get_db
 import hashlib
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Secret key cho JWT - lấy từ environment hoặc default
 SECRET_KEY = os.getenv("SECRET_KEY", "payment-secret-2025-production")
 ALGORITHM = "HS256"
@@ -43,17 +47,20 @@ def authenticate_user_simple(db: Session, username: str, password: str):
     try:
         user = db.query(User).filter(User.username == username, User.is_active == True).first()
         if not user:
-            print(f"❌ User not found: {username}")
+            logger.info("User not found", extra={"username": username})
             return False
         
         if not verify_password_simple(password, user.password_hash):
-            print(f"❌ Password verification failed for: {username}")
+            logger.info("Password verification failed", extra={"username": username})
             return False
         
-        print(f"✅ Authentication successful for: {username}")
+        logger.debug("Authentication successful", extra={"username": username})
         return user
+    except PoolTimeoutError:
+        # Hết connection không phải sai mật khẩu -> để main trả 503
+        raise
     except Exception as e:
-        print(f"❌ Authentication error: {e}")
+        logger.exception("Authentication error")
         return False
 
 # Alias for compatibility
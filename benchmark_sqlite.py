@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+SQLite Concurrency Benchmark
+So sánh throughput đọc/ghi đồng thời: SQLite mặc định vs performance profile (WAL + pragmas)
+
+Cách dùng:
+    python benchmark_sqlite.py --readers 8 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from database_production import Base, Payment, build_sqlite_engine, run_sqlite_maintenance
+
+SEED_PAYMENTS = 5000
+
+def seed(engine):
+    """Tạo bảng và dữ liệu ban đầu"""
+    Base.metadata.create_all(bind=engine)
+    rows = [{
+        "building_id": random.randint(1, 5),
+        "booking_id": f"BK{i:06d}",
+        "guest_name": f"Khách {i}",
+        "room_number": str(random.randint(101, 520)),
+        "amount_due": 1_000_000,
+        "amount_collected": 1_000_000,
+        "payment_method": random.choice(["cash", "bank_transfer"]),
+        "collected_by": "Benchmark",
+        "status": "completed",
+        "added_by_user_id": random.randint(1, 4),
+    } for i in range(SEED_PAYMENTS)]
+    with engine.begin() as conn:
+        conn.execute(Payment.__table__.insert(), rows)
+
+def run_workload(engine, readers, seconds):
+    """Chạy N reader + 1 writer trong `seconds` giây, trả về số thao tác"""
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        done = errors = 0
+        while not stop.is_set():
+            db = Session()
+            try:
+                user_id = random.randint(1, 4)
+                db.execute(text(
+                    "SELECT count(*), sum(amount_collected) FROM payments WHERE added_by_user_id = :uid"
+                ), {"uid": user_id}).fetchone()
+                done += 1
+            except Exception:
+                errors += 1
+            finally:
+                db.close()
+        with lock:
+            counts["reads"] += done
+            counts["errors"] += errors
+
+    def writer():
+        done = errors = 0
+        while not stop.is_set():
+            db = Session()
+            try:
+                db.add(Payment(
+                    booking_id=f"BW{done:06d}", guest_name="Writer", amount_due=500_000,
+                    amount_collected=500_000, payment_method="cash", collected_by="Benchmark",
+                    added_by_user_id=1
+                ))
+                db.commit()
+                done += 1
+            except Exception:
+                db.rollback()
+                errors += 1
+            finally:
+                db.close()
+        with lock:
+            counts["writes"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return counts
+
+def benchmark(readers=8, seconds=5):
+    """Chạy benchmark cho cả 2 cấu hình"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, tuned in (("default", False), ("tuned", True)):
+            url = f"sqlite:///{os.path.join(tmp, label + '.db')}"
+            engine = build_sqlite_engine(url, tuned=tuned)
+            seed(engine)
+            counts = run_workload(engine, readers, seconds)
+            if tuned:
+                run_sqlite_maintenance(engine)
+            engine.dispose()
+            counts["reads_per_sec"] = counts["reads"] / seconds
+            counts["writes_per_sec"] = counts["writes"] / seconds
+            results[label] = counts
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite concurrent read/write benchmark")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"🏁 SQLite benchmark: {args.readers} readers + 1 writer, {args.seconds}s mỗi cấu hình")
+    results = benchmark(args.readers, args.seconds)
+
+    print(f"\n{'Cấu hình':<10} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    for label, counts in results.items():
+        print(f"{label:<10} {counts['reads_per_sec']:>10.0f} {counts['writes_per_sec']:>10.0f} {counts['errors']:>8}")
+
+    default, tuned = results["default"], results["tuned"]
+    if default["writes_per_sec"] and default["reads_per_sec"]:
+        print(f"\n📈 Reads: x{tuned['reads_per_sec'] / default['reads_per_sec']:.2f}  "
+              f"Writes: x{tuned['writes_per_sec'] / default['writes_per_sec']:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+In-memory Cache - LRU có giới hạn + TTL cho dữ liệu tham chiếu (tòa nhà, người dùng)
+Dữ liệu ít thay đổi nhưng được gọi lại mỗi lần mở admin_payments / admin_handovers.
+
+- Key = (namespace, key): namespace theo entity (buildings, users, recipients),
+  key theo phạm vi quyền (role, user id) để không trả nhầm dữ liệu giữa các vai trò
+- Ghi thành công -> handler gọi invalidation_bus.publish("building" | "user"): xóa các namespace
+  liên quan ở worker này và báo cho worker khác (invalidation_bus.py)
+- Generation theo namespace: kết quả đọc DB bắt đầu trước khi invalidate sẽ không được lưu lại
+- Số liệu hit/miss/eviction theo namespace xuất ra /metrics (cache_hits_total, cache_hit_ratio...)
+
+Cấu hình: CACHE_MAX_ENTRIES (mặc định 1000), CACHE_TTL_SECONDS (mặc định 300, 0 = tắt cache)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+# Entity thay đổi -> các namespace cần xóa
+ENTITY_NAMESPACES = {
+    "building": ("buildings",),
+    "user": ("users", "recipients"),
+}
+
+_MISSING = object()
+_STAT_FIELDS = ("hits", "misses", "sets", "evictions", "expirations", "invalidations")
+
+class TTLCache:
+    """LRU thread-safe có TTL cho từng entry"""
+
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = CACHE_TTL_SECONDS if ttl is None else ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (namespace, key) -> (expires_at, value)
+        self._generations = {}          # namespace -> số lần bị invalidate
+        self._stats = {}                # namespace -> {hits, misses, ...}
+
+    def _count(self, namespace, field, amount=1):
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = dict.fromkeys(_STAT_FIELDS, 0)
+        stats[field] += amount
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self._entries.move_to_end((namespace, key))
+                    self._count(namespace, "hits")
+                    return entry[1]
+                del self._entries[(namespace, key)]
+                self._count(namespace, "expirations")
+            self._count(namespace, "misses")
+            return default
+
+    def set(self, namespace, key, value, ttl=None, generation=None):
+        """Lưu value; bỏ qua nếu namespace đã bị invalidate kể từ `generation`"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return False
+        with self._lock:
+            if generation is not None and generation != self._generations.get(namespace, 0):
+                return False
+            self._entries[(namespace, key)] = (self.clock() + ttl, value)
+            self._entries.move_to_end((namespace, key))
+            self._count(namespace, "sets")
+            while len(self._entries) > self.max_entries:
+                (evicted_namespace, _), _ = self._entries.popitem(last=False)
+                self._count(evicted_namespace, "evictions")
+            return True
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """Giá trị trong cache, hoặc gọi loader() rồi lưu lại
+
+        Giá trị trả về dùng chung giữa các request - caller không được sửa.
+        """
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self.generation(namespace)
+        value = loader()
+        self.set(namespace, key, value, ttl=ttl, generation=generation)
+        return value
+
+    def invalidate(self, namespace, key=None):
+        """Xóa một key, hoặc cả namespace nếu key=None; trả về số entry đã xóa"""
+        with self._lock:
+            if key is not None:
+                removed = 1 if self._entries.pop((namespace, key), None) is not None else 0
+            else:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+                stale = [entry_key for entry_key in self._entries if entry_key[0] == namespace]
+                for entry_key in stale:
+                    del self._entries[entry_key]
+                removed = len(stale)
+            self._count(namespace, "invalidations")
+            return removed
+
+    def invalidate_entity(self, entity):
+        """Gọi sau khi ghi thành công một entity (building, user)"""
+        return sum(self.invalidate(namespace) for namespace in ENTITY_NAMESPACES.get(entity, ()))
+
+    def clear(self):
+        with self._lock:
+            for namespace in {namespace for namespace, _ in self._entries}:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._entries.clear()
+
+    def stats(self):
+        """{namespace: {hits, misses, ..., entries, hit_ratio}}"""
+        with self._lock:
+            entries = {}
+            for namespace, _ in self._entries:
+                entries[namespace] = entries.get(namespace, 0) + 1
+            result = {}
+            for namespace in sorted(set(self._stats) | set(entries)):
+                stats = dict(self._stats.get(namespace) or dict.fromkeys(_STAT_FIELDS, 0))
+                stats["entries"] = entries.get(namespace, 0)
+                lookups = stats["hits"] + stats["misses"]
+                stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+                result[namespace] = stats
+            return result
+
+    def collector(self):
+        """Dòng Prometheus cho metrics.registry.register_collector"""
+        stats = self.stats()
+        lines = []
+        for field in ("hits", "misses", "evictions", "expirations", "invalidations"):
+            lines.append(f"# TYPE cache_{field}_total counter")
+            lines += [f'cache_{field}_total{{namespace="{namespace}"}} {values[field]}'
+                      for namespace, values in stats.items()]
+        for field in ("entries", "hit_ratio"):
+            lines.append(f"# TYPE cache_{field} gauge")
+            lines += [f'cache_{field}{{namespace="{namespace}"}} {values[field]}'
+                      for namespace, values in stats.items()]
+        return lines
+
+cache = TTLCache()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Cash Reconciliation - số dư tiền mặt đang giữ theo người và tòa nhà
+Mỗi dòng = (người, tòa nhà): tiền mặt đã thu (payments cash, collected_by), đã bàn giao đi
+(handovers from_person), đã nhận (handovers to_person). Số dư = thu - giao + nhận.
+
+- Cập nhật cùng transaction với payments/handovers (session event after_flush trong
+  database_production.py, dùng chung cơ chế upsert của ledger_summary.py)
+- Chỉ bàn giao status "completed" được tính
+- Tên người được strip() - "Lan" và "Lan " là một người
+- Tra số dư một người ở một tòa nhà = 1 lần đọc theo primary key
+
+Cách dùng:
+    python cash_reconciliation.py verify     # đối chiếu với payments/handovers, exit 1 nếu lệch
+    python cash_reconciliation.py rebuild    # tính lại toàn bộ
+"""
+
+import sys
+
+from sqlalchemy import func, literal_column, select
+
+import ledger_summary
+from database_production import CashBalance, Handover, Payment, engine
+
+KEY_COLUMNS = ("person", "building_id")
+SUM_COLUMNS = ("payment_count", "cash_collected", "handover_out_count", "handed_out", "handover_in_count", "received")
+COUNT_COLUMNS = ("payment_count", "handover_out_count", "handover_in_count")
+
+balance_table = CashBalance.__table__
+
+def normalize_person(name):
+    return (name or "").strip()
+
+def payment_contribution(get):
+    """[(key, giá trị)] - chỉ payment tiền mặt làm thay đổi số dư người thu"""
+    person = normalize_person(get("collected_by"))
+    if get("payment_method") != "cash" or not person:
+        return []
+    return [((person, get("building_id") or 0), {"payment_count": 1, "cash_collected": get("amount_collected") or 0})]
+
+def handover_contribution(get):
+    """[(key, giá trị)] - bàn giao completed: trừ người giao, cộng người nhận"""
+    if get("status") != "completed":
+        return []
+    building_id = get("building_id") or 0
+    amount = get("amount") or 0
+    contributions = []
+    from_person = normalize_person(get("from_person"))
+    to_person = normalize_person(get("to_person"))
+    if from_person:
+        contributions.append(((from_person, building_id), {"handover_out_count": 1, "handed_out": amount}))
+    if to_person:
+        contributions.append(((to_person, building_id), {"handover_in_count": 1, "received": amount}))
+    return contributions
+
+CONTRIBUTIONS = {Payment: payment_contribution, Handover: handover_contribution}
+
+def apply_deltas(conn, deltas):
+    return ledger_summary.apply_deltas(conn, deltas, balance_table, KEY_COLUMNS, SUM_COLUMNS, COUNT_COLUMNS)
+
+def apply_session_changes(session):
+    """Gọi trong after_flush: cộng thay đổi payments/handovers của session vào bảng số dư"""
+    deltas = ledger_summary.collect_session_changes(session, CONTRIBUTIONS, SUM_COLUMNS)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def apply_rows(conn, model, rows):
+    """Cộng dồn các dòng insert thẳng bằng Core (generate_data)"""
+    deltas = {}
+    contribute = CONTRIBUTIONS[model]
+    for row in rows:
+        ledger_summary.add_contributions(deltas, contribute(row.get), 1, SUM_COLUMNS)
+    return apply_deltas(conn, deltas)
+
+# --- Đối chiếu với dữ liệu gốc ---
+
+def aggregate_source(conn):
+    """{(người, tòa nhà): giá trị} tính trực tiếp từ payments + handovers"""
+    zero = literal_column("0")
+    expected = {}
+
+    def merge(query, count_column, amount_column):
+        for person, building_id, count, amount in conn.execute(query):
+            row = expected.setdefault((person, building_id), dict.fromkeys(SUM_COLUMNS, 0))
+            row[count_column] += count
+            row[amount_column] += amount or 0
+
+    def grouped(model, person_column, amount_column, *conditions):
+        person = func.trim(person_column)
+        building = func.coalesce(model.building_id, zero)
+        return select(person, building, func.count(), func.sum(amount_column)).where(
+            person != "", *conditions).group_by(person, building)
+
+    merge(grouped(Payment, Payment.collected_by, Payment.amount_collected, Payment.payment_method == "cash"),
+          "payment_count", "cash_collected")
+    merge(grouped(Handover, Handover.from_person, Handover.amount, Handover.status == "completed"),
+          "handover_out_count", "handed_out")
+    merge(grouped(Handover, Handover.to_person, Handover.amount, Handover.status == "completed"),
+          "handover_in_count", "received")
+    return expected
+
+def rebuild(conn):
+    """Xóa và tính lại toàn bộ bảng số dư - chạy trong transaction của conn"""
+    return ledger_summary.replace_rows(conn, aggregate_source(conn), balance_table, KEY_COLUMNS)
+
+def verify(conn):
+    """Danh sách (người, tòa nhà) có số dư lệch so với dữ liệu gốc (rỗng = khớp)"""
+    return ledger_summary.diff_rows(
+        aggregate_source(conn), ledger_summary.load_rows(conn, balance_table, KEY_COLUMNS, SUM_COLUMNS),
+        KEY_COLUMNS, SUM_COLUMNS,
+    )
+
+# --- Tra cứu ---
+
+def _balance_row(row):
+    values = dict(zip(("person", "building_id") + SUM_COLUMNS, row))
+    for column in ("cash_collected", "handed_out", "received"):
+        values[column] = round(values[column], 2)
+    values["balance"] = round(values["cash_collected"] - values["handed_out"] + values["received"], 2)
+    return values
+
+def _columns():
+    return [balance_table.c[column] for column in KEY_COLUMNS + SUM_COLUMNS]
+
+def person_balance(db, person, building_id=None):
+    """Số dư của một người (theo từng tòa nhà + tổng) - đọc theo primary key"""
+    person = normalize_person(person)
+    query = select(*_columns()).where(balance_table.c.person == person)
+    if building_id is not None:
+        query = query.where(balance_table.c.building_id == building_id)
+    buildings = [_balance_row(row) for row in db.execute(query.order_by(balance_table.c.building_id))]
+    return {
+        "person": person,
+        "balance": round(sum(row["balance"] for row in buildings), 2),
+        "buildings": buildings,
+    }
+
+def balances(db, building_id=None):
+    """Số dư mọi người (lọc theo tòa nhà nếu có), người giữ nhiều tiền nhất trước"""
+    query = select(*_columns())
+    if building_id is not None:
+        query = query.where(balance_table.c.building_id == building_id)
+    rows = [_balance_row(row) for row in db.execute(query)]
+    rows.sort(key=lambda row: (-row["balance"], row["person"], row["building_id"]))
+    return rows
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if command == "rebuild":
+        with engine.begin() as conn:
+            count = rebuild(conn)
+        print(f"✅ Đã tính lại số dư tiền mặt: {count:,} dòng")
+        return 0
+    if command == "verify":
+        with engine.connect() as conn:
+            mismatches = verify(conn)
+        if not mismatches:
+            print("✅ Số dư tiền mặt khớp với payments/handovers")
+            return 0
+        print(f"🔴 {len(mismatches)} số dư lệch (chạy 'python cash_reconciliation.py rebuild' để sửa):")
+        for mismatch in mismatches[:20]:
+            print(f"  {mismatch['key']}: mong đợi {mismatch['expected']} / đang lưu {mismatch['actual']}")
+        return 1
+    print(f"❌ Lệnh không hợp lệ: {command} (verify | rebuild)")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
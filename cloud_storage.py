@@ -4,8 +4,6 @@ Sử dụng Cloudinary để lưu trữ files upload an toàn
 """
 
 import os
-import cloudinary
-import cloudinary.uploader
 from typing import Optional
 
 # Cloudinary configuration
@@ -16,6 +14,8 @@ CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET", "")
 def init_cloudinary():
     """Khởi tạo Cloudinary"""
     if CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET:
+        # Import lazy - SDK chỉ cần khi thật sự upload
+        import cloudinary
         cloudinary.config(
             cloud_name=CLOUDINARY_CLOUD_NAME,
             api_key=CLOUDINARY_API_KEY,
@@ -34,6 +34,7 @@ def upload_file_to_cloud(file_path: str, folder: str = "payment-receipts") -> Op
             print("⚠️ Cloudinary not configured, saving locally")
             return None
             
+        import cloudinary.uploader
         result = cloudinary.uploader.upload(
             file_path,
             folder=folder,
@@ -0,0 +1,69 @@
+"""
+Request Coalescing - single-flight cho endpoint đọc tốn kém
+Lúc đổi ca cả nhóm mở dashboard cùng lúc: hàng chục request giống hệt nhau đến cùng một thời điểm.
+Request đầu tiên (leader) chạy tính toán trong threadpool; request trùng key đến khi leader chưa
+xong thì chờ và dùng chung kết quả (kể cả exception) thay vì tính lại.
+
+- Key = (tên endpoint, phạm vi quyền + tham số) - caller tự đưa phạm vi quyền vào key
+  (main.coalesced_read thêm version các bảng liên quan: không gộp vào lần tính bắt đầu trước một lần ghi)
+- Chỉ gộp request đang chạy cùng lúc, không cache: request đến sau khi leader xong sẽ tính lại
+- Leader bị hủy (client ngắt kết nối) không hủy tính toán của các request đang chờ
+- Số request leader / được gộp theo endpoint xuất ra /metrics
+"""
+
+import asyncio
+import threading
+
+from fastapi.concurrency import run_in_threadpool
+
+class SingleFlight:
+    """Gộp các lời gọi trùng key đang chạy trên cùng event loop"""
+
+    def __init__(self):
+        self._inflight = {}  # (name, key) -> asyncio.Task
+        self._lock = threading.Lock()  # chỉ bảo vệ stats (collector đọc từ thread khác)
+        self.stats = {}  # name -> {"leaders": n, "coalesced": n}
+
+    def _count(self, name, field):
+        with self._lock:
+            stats = self.stats.setdefault(name, {"leaders": 0, "coalesced": 0})
+            stats[field] += 1
+
+    async def run(self, name, key, func, *args):
+        """Kết quả func(*args) (hàm đồng bộ, chạy trong threadpool), dùng chung cho request trùng key"""
+        inflight_key = (name, key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(func, *args))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda done: self._finished(inflight_key, done))
+            self._count(name, "leaders")
+        else:
+            self._count(name, "coalesced")
+        return await asyncio.shield(task)
+
+    def _finished(self, inflight_key, task):
+        if self._inflight.get(inflight_key) is task:
+            del self._inflight[inflight_key]
+        if not task.cancelled():
+            task.exception()  # tránh cảnh báo "exception was never retrieved" khi mọi request đã bị hủy
+
+    def in_flight(self):
+        return len(self._inflight)
+
+    def collector(self):
+        """Dòng Prometheus cho metrics.registry.register_collector"""
+        with self._lock:
+            stats = {name: dict(values) for name, values in self.stats.items()}
+        lines = []
+        for field in ("leaders", "coalesced"):
+            lines.append(f"# TYPE request_coalescing_{field}_total counter")
+            lines += [f'request_coalescing_{field}_total{{endpoint="{name}"}} {values[field]}'
+                      for name, values in sorted(stats.items())]
+        return lines
+
+request_coalescer = SingleFlight()
+
+def role_scope(user):
+    """Phần key theo quyền: trợ lý chỉ thấy dữ liệu của mình, vai trò khác dùng chung theo vai trò"""
+    return (user.role, user.id) if user.role == "assistant" else (user.role,)
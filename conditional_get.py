@@ -0,0 +1,85 @@
+"""
+Conditional GET - ETag yếu cho danh sách / dashboard từ bộ đếm change_versions
+Trang admin gọi lại loadPayments() sau mỗi lần lưu và mỗi lần chuyển trang; phần lớn là dữ liệu không đổi.
+
+- Mỗi lần ghi tăng version của entity trong change_versions (payment / handover: hook after_flush trong
+  database_production, building / user: invalidation_bus.publish)
+- ETag = hash(tên endpoint, phạm vi quyền, version các entity endpoint phụ thuộc) - không cần đọc dữ liệu
+- Client gửi If-None-Match khớp -> 304 rỗng sau 1 query đọc version (không tải danh sách)
+- ETag đi kèm dữ liệu được tính TRƯỚC khi đọc dữ liệu trong cùng session: dữ liệu luôn mới ít nhất bằng
+  ETag (replica trễ, cache worker khác chưa xóa) -> client không bao giờ giữ dữ liệu cũ với ETag mới
+"""
+
+import hashlib
+
+from fastapi import Response
+from sqlalchemy import select
+
+from database_production import ChangeVersion
+
+# Tăng khi đổi định dạng response: ETag cũ của client không còn khớp
+ETAG_FORMAT_VERSION = 1
+CACHE_CONTROL = "private, no-cache"
+
+# Endpoint -> các entity mà dữ liệu trả về phụ thuộc
+ENDPOINT_ENTITIES = {
+    "payments": ("payment",),
+    "handovers": ("handover", "building", "user"),
+    "dashboard": ("payment", "handover", "user"),
+    "buildings": ("building",),
+    "users": ("user",),
+    "recipients": ("user",),
+    "reports": ("payment", "handover", "building"),
+}
+
+versions_table = ChangeVersion.__table__
+
+def current_versions(db, entities):
+    """{entity: version} - entity chưa có dòng tính là 0"""
+    versions = dict.fromkeys(entities, 0)
+    versions.update(db.execute(
+        select(versions_table.c.entity, versions_table.c.version).where(versions_table.c.entity.in_(entities))
+    ).all())
+    return versions
+
+def endpoint_versions(db, name):
+    return current_versions(db, ENDPOINT_ENTITIES[name])
+
+def weak_etag(name, scope, versions):
+    raw = "|".join([str(ETAG_FORMAT_VERSION), name, repr(scope)] +
+                   [f"{entity}={versions[entity]}" for entity in sorted(versions)])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:24]}"'
+
+def current_etag(db, name, scope):
+    return weak_etag(name, scope, endpoint_versions(db, name))
+
+def etag_matches(if_none_match, etag):
+    """So sánh yếu (RFC 9110): bỏ tiền tố W/, nhận danh sách nhiều ETag và *"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+def not_modified(request, db, name, scope, versions=None):
+    """Response 304 nếu If-None-Match của client khớp version hiện tại, ngược lại None
+
+    versions: version handler đã đọc (endpoint_versions); không có thì chỉ đọc khi client gửi If-None-Match.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    etag = weak_etag(name, scope, versions if versions is not None else endpoint_versions(db, name))
+    if not etag_matches(if_none_match, etag):
+        return None
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def load_with_etag(db, name, scope, load):
+    """(etag, load()) - đọc version trước dữ liệu, trong cùng session"""
+    etag = current_etag(db, name, scope)
+    return etag, load()
+
+def with_etag(response, etag, payload):
+    """Gắn ETag vào response của handler, trả về payload"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return payload
@@ -0,0 +1,18 @@
+"""
+Cấu hình pytest chung
+Test in-process luôn chạy trên SQLite tạm (hoặc TEST_DATABASE_URL), không bao giờ dùng DATABASE_URL thật
+File usage của railway_monitor và snapshot analytics cũng ghi vào thư mục tạm
+"""
+
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="payment_test_")
+
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or "sqlite:///{}".format(
+    os.path.join(TEST_DIR, "test.db")
+)
+os.environ["RAILWAY_USAGE_FILE"] = os.path.join(TEST_DIR, "railway_usage.json")
+os.environ["ANALYTICS_SNAPSHOT_FILE"] = os.path.join(TEST_DIR, "analytics_snapshot.duckdb")
+# Job phân tích bất thường hàng ngày không tự chạy trong lúc test (test_job_scheduler.py gọi trực tiếp)
+os.environ["ANOMALY_SCHEDULE_TIME"] = ""
@@ -2,11 +2,15 @@
 Database configuration hỗ trợ cả SQLite (dev) và PostgreSQL (production)
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, Date, DateTime, Text, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from fastapi import Depends
 from datetime import datetime
+import itertools
 import os
+import threading
+import time
 
 # Timezone support - fallback cho Python < 3.9
 try:
@@ -24,19 +28,223 @@ def get_vietnam_time():
 # Lấy DATABASE_URL từ environment (Railway sẽ cung cấp)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if DATABASE_URL:
+# SQLite performance profile - có thể chỉnh qua environment
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))  # 128MB
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))  # 16MB page cache / connection
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "5"))
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "900"))  # 15 phút
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Áp dụng pragma tối ưu cho mỗi connection SQLite mới"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL: reader không bị chặn bởi writer (và ngược lại)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # NORMAL an toàn với WAL, chỉ fsync khi checkpoint
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Giá trị âm = KiB thay vì số page
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+def build_sqlite_engine(url, tuned=True):
+    """Tạo engine SQLite; tuned=False giữ cấu hình mặc định (dùng cho benchmark)"""
+    if not tuned:
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    pool_options = {}
+    if ":memory:" not in url and url.rstrip("/") != "sqlite:":
+        # File DB: QueuePool với WAL cho phép nhiều reader song song
+        pool_options = {
+            "pool_size": SQLITE_POOL_SIZE,
+            "max_overflow": SQLITE_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+
+    sqlite_engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,
+            # Timeout của driver (giây) - khớp với busy_timeout
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        **pool_options
+    )
+    event.listen(sqlite_engine, "connect", apply_sqlite_pragmas)
+    return sqlite_engine
+
+def run_sqlite_maintenance(target_engine=None):
+    """Checkpoint WAL và chạy PRAGMA optimize"""
+    target_engine = target_engine or engine
+    if target_engine.dialect.name != "sqlite":
+        return None
+
+    with target_engine.connect() as conn:
+        # TRUNCATE giữ file -wal nhỏ sau các đợt ghi lớn
+        busy, log_frames, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        conn.exec_driver_sql("PRAGMA optimize")
+    return {"busy": busy, "log_frames": log_frames, "checkpointed": checkpointed}
+
+# PostgreSQL engine - cấu hình qua environment (Railway free tier mặc định)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "2"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))  # 5 phút
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "3"))  # Hết connection -> 503 nhanh thay vì treo 30s
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))  # 0 = tắt server-side prepare
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "payment-system")
+
+def build_postgres_engine(url):
+    """Tạo engine PostgreSQL với pool, timeout và application_name từ environment"""
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+
+    connect_args = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    if url.startswith("postgresql+psycopg://"):
+        # psycopg 3: prepare server-side sau N lần chạy cùng statement
+        connect_args["prepare_threshold"] = DB_PREPARE_THRESHOLD or None
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+def get_pool_status(target_engine=None):
+    """Thống kê pool hiện tại (dùng cho health check / metrics)"""
+    pool = (target_engine or engine).pool
+    status = {"pool_class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        size = pool.size()
+        status.update({
+            "size": size,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": getattr(pool, "_max_overflow", 0),
+            "timeout": pool.timeout(),
+        })
+        status["capacity"] = size + status["max_overflow"]
+        status["usage"] = round(status["checked_out"] / status["capacity"], 3) if status["capacity"] else 0
+    return status
+
+_maintenance_thread = None
+
+def start_sqlite_maintenance(interval=None):
+    """Chạy maintenance định kỳ trong background thread (chỉ SQLite)"""
+    global _maintenance_thread
+    interval = interval or SQLITE_MAINTENANCE_INTERVAL
+    if engine.dialect.name != "sqlite" or interval <= 0:
+        return None
+    if _maintenance_thread and _maintenance_thread.is_alive():
+        return _maintenance_thread
+
+    def maintenance_loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_sqlite_maintenance()
+            except Exception as e:
+                print(f"⚠️ SQLite maintenance failed: {e}")
+
+    _maintenance_thread = threading.Thread(target=maintenance_loop, name="sqlite-maintenance", daemon=True)
+    _maintenance_thread.start()
+    return _maintenance_thread
+
+if DATABASE_URL and not DATABASE_URL.startswith("sqlite"):
     # Production: PostgreSQL từ Railway
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    engine = create_engine(DATABASE_URL)
-    print("🚀 Kết nối PostgreSQL production")
+    engine = build_postgres_engine(DATABASE_URL)
+    print(f"🚀 Kết nối PostgreSQL production (pool {DB_POOL_SIZE}+{DB_MAX_OVERFLOW})")
 else:
-    # Development: SQLite local
-    DATABASE_URL = "sqlite:///./payment_ledger.db"
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    # Development: SQLite local (hoặc DATABASE_URL=sqlite:///... cho test)
+    DATABASE_URL = DATABASE_URL or "sqlite:///./payment_ledger.db"
+    engine = build_sqlite_engine(DATABASE_URL)
     print("💻 Sử dụng SQLite development")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def build_engine(url):
+    """Tạo engine theo loại database của URL"""
+    if url.startswith("sqlite"):
+        return build_sqlite_engine(url)
+    return build_postgres_engine(url)
+
+# Read replicas (tùy chọn): danh sách URL cách nhau bởi dấu phẩy
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Sau một lần ghi, đọc từ primary trong khoảng này để không thấy dữ liệu cũ trên replica
+REPLICA_MAX_STALENESS_SECONDS = float(os.getenv("REPLICA_MAX_STALENESS_SECONDS", "5"))
+
+class ReplicaRouter:
+    """Chọn engine cho request đọc: replica (round-robin) hoặc primary nếu vừa có ghi"""
+
+    def __init__(self, primary, replicas=(), max_staleness=REPLICA_MAX_STALENESS_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_staleness = max_staleness
+        self.last_write = None
+        self._counter = itertools.count()
+
+    def record_write(self):
+        """Ghi nhận thời điểm commit có thay đổi dữ liệu trên primary"""
+        self.last_write = time.monotonic()
+
+    def replicas_fresh(self):
+        """Replica được coi là đủ mới khi lần ghi gần nhất đã quá staleness bound"""
+        return self.last_write is None or time.monotonic() - self.last_write >= self.max_staleness
+
+    def pick_read_engine(self):
+        """Engine dùng cho đọc - primary nếu không có replica hoặc vừa ghi"""
+        if not self.replicas or not self.replicas_fresh():
+            return self.primary
+        return self.replicas[next(self._counter) % len(self.replicas)]
+
+class RoutingSession(Session):
+    """Session đọc từ read_engine nhưng luôn flush/ghi vào primary"""
+
+    def __init__(self, router=None, read_engine=None, **kwargs):
+        super().__init__(**kwargs)
+        self.router = router
+        self.read_engine = read_engine
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.router is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self._flushing or self.read_engine is None or getattr(clause, "is_dml", False):
+            return self.router.primary
+        return self.read_engine
+
+replica_router = ReplicaRouter(engine, [build_engine(url) for url in DATABASE_REPLICA_URLS])
+if replica_router.replicas:
+    print(f"📚 Read replicas: {len(replica_router.replicas)} (staleness {REPLICA_MAX_STALENESS_SECONDS}s)")
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession, router=replica_router)
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_session_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state):
+    # query(...).delete() / update() không đi qua flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_primary_write(session):
+    if session.info.pop("wrote", False) and session.router is not None:
+        session.router.record_write()
+
 Base = declarative_base()
 
 class Building(Base):
@@ -104,10 +312,121 @@ class Handover(Base):
     created_at = Column(DateTime, default=lambda: get_vietnam_time().replace(tzinfo=None))
     updated_at = Column(DateTime, default=lambda: get_vietnam_time().replace(tzinfo=None), onupdate=lambda: get_vietnam_time().replace(tzinfo=None))
 
+class LedgerDailySummary(Base):
+    """Bảng tổng hợp thu/bàn giao theo ngày - cập nhật cùng transaction với payments/handovers (ledger_summary.py)"""
+    __tablename__ = "ledger_daily_summary"
+
+    day = Column(Date, primary_key=True)
+    building_id = Column(Integer, primary_key=True)  # 0 = không thuộc tòa nhà nào
+    user_id = Column(Integer, primary_key=True)  # added_by_user_id / handover_by_user_id
+    payment_method = Column(String(30), primary_key=True)  # bàn giao ghi vào "cash"
+    payment_count = Column(Integer, nullable=False, default=0)
+    amount_due = Column(Float, nullable=False, default=0)
+    amount_collected = Column(Float, nullable=False, default=0)
+    cash_collected = Column(Float, nullable=False, default=0)
+    handover_count = Column(Integer, nullable=False, default=0)
+    handed_over = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_ledger_summary_user_day", "user_id", "day"),)
+
+class CashBalance(Base):
+    """Số dư tiền mặt đang giữ theo người và tòa nhà - cập nhật cùng transaction (cash_reconciliation.py)"""
+    __tablename__ = "cash_balances"
+
+    person = Column(String(100), primary_key=True)  # collected_by / from_person / to_person
+    building_id = Column(Integer, primary_key=True)  # 0 = không thuộc tòa nhà nào
+    payment_count = Column(Integer, nullable=False, default=0)
+    cash_collected = Column(Float, nullable=False, default=0)
+    handover_out_count = Column(Integer, nullable=False, default=0)
+    handed_out = Column(Float, nullable=False, default=0)
+    handover_in_count = Column(Integer, nullable=False, default=0)
+    received = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_cash_balances_building", "building_id"),)
+
+class AnomalyFinding(Base):
+    """Bất thường do job phân tích hàng đêm phát hiện (anomaly_detection.py) - mỗi lần chạy thay toàn bộ"""
+    __tablename__ = "anomaly_findings"
+
+    id = Column(Integer, primary_key=True)
+    run_at = Column(DateTime, nullable=False)
+    kind = Column(String(30), nullable=False)  # shortfall | room_amount | collector_cash_share
+    score = Column(Float, nullable=False)  # robust z-score
+    building_id = Column(Integer, nullable=False, default=0)  # 0 = không thuộc tòa nhà nào
+    payment_id = Column(Integer, nullable=True)  # None với phát hiện theo người thu
+    room_number = Column(String(20), nullable=True)
+    collected_by = Column(String(50), nullable=True)
+    value = Column(Float, nullable=False)
+    baseline = Column(Float, nullable=False)
+    details = Column(String(255), nullable=True)
+
+    __table_args__ = (Index("ix_anomaly_findings_kind_score", "kind", "score"),)
+
+class ChangeVersion(Base):
+    """Bộ đếm thay đổi theo entity - tăng mỗi lần ghi, các worker so sánh để xóa cache (invalidation_bus.py)"""
+    __tablename__ = "change_versions"
+
+    entity = Column(String(50), primary_key=True)  # building | user | ...
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+class JobRun(Base):
+    """Lần chạy gần nhất của job định kỳ - worker nào giành được dòng thì chạy (job_scheduler.py)"""
+    __tablename__ = "job_runs"
+
+    name = Column(String(50), primary_key=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+LEDGER_MODELS = (Payment, Handover)
+
+# Model -> entity trong change_versions, tăng tự động khi ghi (ETag của danh sách, conditional_get.py)
+# Building / User tăng qua invalidation_bus.publish trong handler
+VERSIONED_MODELS = {Payment: "payment", Handover: "handover"}
+
+@event.listens_for(RoutingSession, "after_flush")
+def _update_ledger_summary(session, flush_context):
+    # Import muộn: ledger_summary / cash_reconciliation import models từ module này
+    import cash_reconciliation
+    import ledger_summary
+    deltas = ledger_summary.collect_session_changes(session)
+    if deltas:
+        ledger_summary.apply_deltas(session.connection(), deltas)
+    cash_reconciliation.apply_session_changes(session)
+
+@event.listens_for(RoutingSession, "after_flush")
+def _bump_change_versions(session, flush_context):
+    # Tăng trong cùng transaction: rollback thì version cũng không đổi
+    import invalidation_bus
+    touched = {VERSIONED_MODELS[type(obj)] for obj in itertools.chain(session.new, session.dirty, session.deleted)
+               if type(obj) in VERSIONED_MODELS}
+    for entity in sorted(touched):
+        invalidation_bus.bump_version(session.connection(), entity)
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_ledger_bulk_write(orm_execute_state):
+    # query(Payment).delete() / update() không qua flush -> tính lại bảng tổng hợp trước khi commit
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        if any(mapper.class_ in LEDGER_MODELS for mapper in orm_execute_state.all_mappers):
+            orm_execute_state.session.info["ledger_rebuild"] = True
+
+@event.listens_for(RoutingSession, "before_commit")
+def _rebuild_ledger_summary(session):
+    if session.info.pop("ledger_rebuild", False):
+        import cash_reconciliation
+        import ledger_summary
+        conn = session.connection(bind_arguments={"clause": ledger_summary.summary_table.delete()})
+        ledger_summary.rebuild(conn)
+        cash_reconciliation.rebuild(conn)
+        import invalidation_bus
+        for entity in VERSIONED_MODELS.values():
+            invalidation_bus.bump_version(conn, entity)
+
 # Tạo tất cả các bảng
 def create_tables():
-    """Tạo tất cả các bảng trong database"""
-    Base.metadata.create_all(bind=engine)
+    """Tạo/cập nhật schema (bảng + index) qua migration runner"""
+    from migrations import run_migrations
+    run_migrations()
     print("✅ Database tables được tạo/cập nhật thành công")
 
 # Dependency để lấy database session
@@ -119,6 +438,26 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(db: Session = Depends(get_db)):
+    """Session cho handler chỉ đọc - replica nếu có, ngược lại dùng lại session primary của request"""
+    read_engine = replica_router.pick_read_engine()
+    if read_engine is replica_router.primary:
+        yield db
+        return
+
+    read_db = SessionLocal(read_engine=read_engine)
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+def open_read_session():
+    """Session đọc không gắn với request nào (replica nếu có) - cho tính toán dùng chung giữa nhiều request"""
+    read_engine = replica_router.pick_read_engine()
+    if read_engine is replica_router.primary:
+        return SessionLocal()
+    return SessionLocal(read_engine=read_engine)
+
 if __name__ == "__main__":
     create_tables()
     print("✅ Hoàn thành thiết lập database!")
\ No newline at end of file
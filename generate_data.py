@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator - dữ liệu lớn cho test hiệu năng
+Sinh tòa nhà, user, payments và bàn giao với phân bố gần thực tế:
+- Tòa nhà lệch (Zipf): vài tòa nhà chiếm phần lớn giao dịch
+- Phương thức thanh toán theo tỉ trọng, số tiền phân bố log-normal (làm tròn 10.000đ)
+- Tên khách tiếng Việt, thời gian rải đều theo ngày, dồn vào giờ check-in/check-out và cuối tuần
+
+Insert bằng SQLAlchemy Core theo batch; PostgreSQL (psycopg2) dùng COPY.
+
+Cách dùng:
+    python generate_data.py --payments 1000000
+    python generate_data.py --payments 200000 --buildings 40 --building-skew 1.3 --days 730
+    python generate_data.py --payments 50000 --methods cash=0.6,bank_transfer=0.3,momo=0.1 --seed 42
+"""
+
+import argparse
+import csv
+import io
+import math
+import random
+import time
+from datetime import timedelta
+
+from sqlalchemy import select
+
+import cash_reconciliation
+import invalidation_bus
+import ledger_summary
+from database_production import VERSIONED_MODELS, Building, Handover, Payment, User, engine, get_vietnam_time
+from auth_service_simple import get_password_hash_simple
+
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng",
+                "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+# Tỉ trọng họ gần với thực tế (Nguyễn ~ 38%)
+FAMILY_WEIGHTS = [38, 11, 9.5, 7, 5.1, 2.1, 4.5, 3.9, 3.9, 2.1, 2, 1.4, 1.3, 1.3, 1, 0.5]
+MIDDLE_NAMES = ["Văn", "Thị", "Minh", "Thu", "Hoàng", "Ngọc", "Đức", "Thanh", "Quốc", "Bảo", "Gia", "Hải"]
+GIVEN_NAMES = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Hải", "Hạnh", "Hiếu", "Hoa", "Hùng", "Huy",
+               "Khánh", "Lan", "Linh", "Long", "Mai", "Minh", "Nam", "Ngân", "Nhung", "Phúc", "Phương",
+               "Quân", "Sơn", "Tâm", "Thảo", "Trang", "Trung", "Tú", "Tuấn", "Vy", "Yến"]
+FOREIGN_GUESTS = ["John Smith", "Kim Min-jun", "Tanaka Yuki", "Emma Wilson", "Li Wei", "Anna Müller"]
+DISTRICTS = ["Quận 1", "Quận 3", "Quận 7", "Bình Thạnh", "Thủ Đức", "Phú Nhuận", "Quận 4", "Tân Bình"]
+STREETS = ["Lê Lợi", "Nguyễn Huệ", "Võ Văn Tần", "Nguyễn Hữu Cảnh", "Điện Biên Phủ", "Pasteur", "Hai Bà Trưng"]
+
+DEFAULT_METHOD_WEIGHTS = {"cash": 0.45, "bank_transfer": 0.35, "momo": 0.1, "credit_card": 0.06, "zalopay": 0.04}
+# Giờ trong ngày: dồn vào check-out (10-12h) và check-in (14-20h)
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.2, 0.3, 1, 2, 3, 4, 6, 6, 4, 4, 7, 8, 8, 7, 6, 5, 4, 3, 2, 1.5]
+WEEKEND_BOOST = 1.4
+
+def parse_weights(spec):
+    """'cash=0.6,momo=0.4' -> {'cash': 0.6, 'momo': 0.4}"""
+    weights = {}
+    for item in spec.split(","):
+        name, value = item.split("=", 1)
+        weights[name.strip()] = float(value)
+    return weights
+
+def zipf_weights(count, skew):
+    """Trọng số 1/rank^skew - skew 0 là đều, càng lớn càng lệch"""
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+def cumulative(weights):
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+class DataGenerator:
+    """Sinh dòng dữ liệu (dict cho Core insert) với RNG có seed để tái lập"""
+
+    def __init__(self, days=365, building_skew=1.1, method_weights=None, seed=None):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.building_skew = building_skew
+        methods = method_weights or DEFAULT_METHOD_WEIGHTS
+        self.methods = list(methods)
+        self.method_cum = cumulative(methods.values())
+        self.family_cum = cumulative(FAMILY_WEIGHTS)
+        self.hour_cum = cumulative(HOUR_WEIGHTS)
+        self.now = get_vietnam_time().replace(tzinfo=None)
+        # Trọng số ngày: cuối tuần đông hơn
+        day_weights = []
+        for offset in range(days):
+            weekday = (self.now - timedelta(days=offset)).weekday()
+            day_weights.append(WEEKEND_BOOST if weekday >= 5 else 1.0)
+        self.day_cum = cumulative(day_weights)
+
+    def person_name(self):
+        rng = self.rng
+        family = rng.choices(FAMILY_NAMES, cum_weights=self.family_cum)[0]
+        return f"{family} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}"
+
+    def guest_name(self):
+        return self.rng.choice(FOREIGN_GUESTS) if self.rng.random() < 0.08 else self.person_name()
+
+    def timestamp(self):
+        rng = self.rng
+        offset = rng.choices(range(self.days), cum_weights=self.day_cum)[0]
+        hour = rng.choices(range(24), cum_weights=self.hour_cum)[0]
+        day = (self.now - timedelta(days=offset)).replace(hour=hour, minute=rng.randrange(60),
+                                                          second=rng.randrange(60), microsecond=0)
+        return min(day, self.now)
+
+    def amount(self, median=1_500_000, sigma=0.6):
+        """Log-normal quanh median, làm tròn 10.000đ"""
+        value = self.rng.lognormvariate(math.log(median), sigma)
+        return float(max(100_000, round(value / 10_000) * 10_000))
+
+    def buildings(self, count, start=1):
+        rows = []
+        for i in range(start, start + count):
+            district = self.rng.choice(DISTRICTS)
+            rows.append({
+                "name": f"Tòa nhà {i:03d} - {district}",
+                "address": f"{self.rng.randint(1, 999)} Đường {self.rng.choice(STREETS)}, {district}, TP.HCM",
+                "contact_info": f"028.{self.rng.randint(1000, 9999)}.{self.rng.randint(1000, 9999)}",
+                "is_active": True,
+                "created_at": self.now, "updated_at": self.now,
+            })
+        return rows
+
+    def users(self, count, start=1, password="password123"):
+        password_hash = get_password_hash_simple(password)
+        rows = []
+        for i in range(start, start + count):
+            role = "manager" if i % 5 == 0 else "assistant"
+            rows.append({
+                "username": f"gen_{role}_{i:04d}", "password_hash": password_hash,
+                "full_name": self.person_name(), "role": role, "is_active": True,
+                "created_at": self.now, "updated_at": self.now,
+            })
+        return rows
+
+    def payments(self, count, building_ids, users, start=0):
+        """users: list (id, full_name) - người thu"""
+        rng = self.rng
+        building_cum = cumulative(zipf_weights(len(building_ids), self.building_skew))
+        for i in range(start, start + count):
+            amount_due = self.amount()
+            # ~5% thu thiếu
+            amount_collected = amount_due if rng.random() > 0.05 else float(round(amount_due * rng.uniform(0.3, 0.9), -4))
+            user_id, full_name = rng.choice(users)
+            created_at = self.timestamp()
+            yield {
+                "building_id": rng.choices(building_ids, cum_weights=building_cum)[0],
+                "booking_id": f"GEN{i:09d}",
+                "guest_name": self.guest_name(),
+                "room_number": f"{rng.randint(1, 30)}{rng.randint(1, 20):02d}",
+                "amount_due": amount_due,
+                "amount_collected": amount_collected,
+                "payment_method": rng.choices(self.methods, cum_weights=self.method_cum)[0],
+                "collected_by": full_name,
+                "notes": None,
+                "receipt_image": None,
+                "status": "completed",
+                "added_by_user_id": user_id,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+
+    def handovers(self, count, building_ids, users, recipients=("Kế toán", "Chủ nhà")):
+        rng = self.rng
+        building_cum = cumulative(zipf_weights(len(building_ids), self.building_skew))
+        for _ in range(count):
+            user_id, full_name = rng.choice(users)
+            created_at = self.timestamp()
+            yield {
+                "building_id": rng.choices(building_ids, cum_weights=building_cum)[0],
+                "from_person": full_name,
+                "to_person": rng.choice(recipients),
+                "amount": self.amount(median=5_000_000, sigma=0.5),
+                "notes": None,
+                "image_path": None,
+                "status": "completed",
+                "handover_by_user_id": user_id,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def copy_rows(target_engine, table, batch):
+    """COPY FROM STDIN (psycopg2) - nhanh hơn INSERT nhiều lần trên PostgreSQL"""
+    columns = list(batch[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["" if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    raw = target_engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+def bulk_insert(target_engine, table, rows, batch_size=10000, use_copy=False, progress=None, after_batch=None):
+    """Insert theo batch, mỗi batch một transaction; trả về số dòng
+
+    after_batch(conn, batch) chạy trong cùng transaction với INSERT (COPY: transaction ngay sau đó).
+    """
+    total = 0
+    started = time.perf_counter()
+    for batch in batched(rows, batch_size):
+        if use_copy:
+            copy_rows(target_engine, table, batch)
+            if after_batch:
+                with target_engine.begin() as conn:
+                    after_batch(conn, batch)
+        else:
+            with target_engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+                if after_batch:
+                    after_batch(conn, batch)
+        total += len(batch)
+        if progress:
+            progress(table.name, total, time.perf_counter() - started)
+    return total
+
+def apply_summaries(model):
+    """after_batch: cộng batch vừa insert vào các bảng tổng hợp (sổ thu theo ngày, số dư tiền mặt)"""
+    def apply(conn, batch):
+        ledger_summary.apply_rows(conn, model, batch)
+        cash_reconciliation.apply_rows(conn, model, batch)
+        invalidation_bus.bump_version(conn, VERSIONED_MODELS[model])
+    return apply
+
+def can_copy(target_engine):
+    return target_engine.dialect.name == "postgresql" and target_engine.dialect.driver == "psycopg2"
+
+def generate(target_engine=None, buildings=20, users=30, payments=100_000, handovers=None, days=365,
+             building_skew=1.1, method_weights=None, batch_size=10_000, seed=None, use_copy=None, verbose=True):
+    """Sinh dữ liệu vào database, trả về số dòng đã tạo theo bảng
+
+    Tòa nhà / user đang có được dùng chung với dữ liệu mới sinh.
+    """
+    target_engine = target_engine or engine
+    use_copy = can_copy(target_engine) if use_copy is None else use_copy
+    handovers = payments // 10 if handovers is None else handovers
+    generator = DataGenerator(days=days, building_skew=building_skew, method_weights=method_weights, seed=seed)
+    started = time.perf_counter()
+
+    def progress(table, done, elapsed):
+        if verbose:
+            print(f"   {table}: {done:,} dòng ({done / max(elapsed, 1e-6):,.0f} dòng/s)")
+
+    with target_engine.connect() as conn:
+        building_count = conn.execute(select(Building.id).order_by(Building.id.desc()).limit(1)).scalar() or 0
+        user_count = conn.execute(select(User.id).order_by(User.id.desc()).limit(1)).scalar() or 0
+        payment_count = conn.execute(select(Payment.id).order_by(Payment.id.desc()).limit(1)).scalar() or 0
+
+    summary = {}
+    if buildings:
+        summary["buildings"] = bulk_insert(target_engine, Building.__table__,
+                                           generator.buildings(buildings, start=building_count + 1))
+    if users:
+        summary["users"] = bulk_insert(target_engine, User.__table__, generator.users(users, start=user_count + 1))
+    # Worker đang chạy xóa cache tòa nhà / người dùng ở lần poll kế tiếp
+    changed = [entity for entity, count in (("building", buildings), ("user", users)) if count]
+    if changed:
+        with target_engine.begin() as conn:
+            for entity in changed:
+                invalidation_bus.bump_version(conn, entity)
+
+    with target_engine.connect() as conn:
+        building_ids = list(conn.execute(select(Building.id).where(Building.is_active == True)).scalars())
+        collectors = [tuple(row) for row in conn.execute(
+            select(User.id, User.full_name).where(User.is_active == True)
+        )]
+    if not building_ids or not collectors:
+        raise ValueError("Cần ít nhất một tòa nhà và một user để sinh giao dịch")
+
+    summary["payments"] = bulk_insert(
+        target_engine, Payment.__table__, generator.payments(payments, building_ids, collectors, start=payment_count),
+        batch_size, use_copy, progress, after_batch=apply_summaries(Payment)
+    )
+    summary["handovers"] = bulk_insert(
+        target_engine, Handover.__table__, generator.handovers(handovers, building_ids, collectors),
+        batch_size, use_copy, progress, after_batch=apply_summaries(Handover)
+    )
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu lớn cho test hiệu năng")
+    parser.add_argument("--payments", type=int, default=100_000)
+    parser.add_argument("--handovers", type=int, help="Mặc định: payments / 10")
+    parser.add_argument("--buildings", type=int, default=20)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--days", type=int, default=365, help="Rải giao dịch trong N ngày gần nhất")
+    parser.add_argument("--building-skew", type=float, default=1.1, help="Độ lệch Zipf giữa các tòa nhà (0 = đều)")
+    parser.add_argument("--methods", help="Tỉ trọng phương thức, vd cash=0.6,bank_transfer=0.4")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-copy", action="store_true", help="Không dùng COPY trên PostgreSQL")
+    args = parser.parse_args()
+
+    from migrations import run_migrations
+    run_migrations(verbose=False)
+
+    print(f"🔄 Sinh {args.payments:,} payments vào {engine.url.render_as_string(hide_password=True)}")
+    summary = generate(
+        buildings=args.buildings, users=args.users, payments=args.payments, handovers=args.handovers,
+        days=args.days, building_skew=args.building_skew,
+        method_weights=parse_weights(args.methods) if args.methods else None,
+        batch_size=args.batch_size, seed=args.seed, use_copy=False if args.no_copy else None,
+    )
+    print(f"✅ Hoàn tất: {summary}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Invalidation Bus - xóa cache đồng bộ giữa nhiều worker / replica
+Mỗi worker có cache riêng trong process (cache.py); ghi ở worker này phải làm worker khác xóa cache.
+
+- publish(entity) sau khi ghi thành công: xóa cache local, tăng version trong bảng change_versions
+  và (PostgreSQL) NOTIFY trên kênh INVALIDATION_CHANNEL trong cùng transaction
+- Mỗi worker chạy một thread lắng nghe:
+    PostgreSQL: LISTEN trên connection riêng, nhận sự kiện gần như ngay lập tức;
+                mất kết nối -> kết nối lại và đọc change_versions để bắt kịp sự kiện bị lỡ
+    SQLite / khác: đọc change_versions mỗi INVALIDATION_POLL_SECONDS giây
+- Version chỉ tăng: sự kiện trùng (NOTIFY + poll) hoặc của chính worker không xóa cache hai lần
+- TTL của cache vẫn là lưới an toàn nếu publish lỗi (database mất kết nối sau khi commit)
+"""
+
+import logging
+import os
+import select
+import socket
+import threading
+
+from sqlalchemy import insert, select as sql_select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import ENTITY_NAMESPACES, cache
+from database_production import ChangeVersion, engine, get_vietnam_time
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+INVALIDATION_POLL_SECONDS = float(os.getenv("INVALIDATION_POLL_SECONDS", "2"))
+
+versions_table = ChangeVersion.__table__
+
+def seed_versions(conn, entities=None):
+    """Tạo dòng version 0 cho các entity chưa có (publish sau đó chỉ cần UPDATE)"""
+    entities = entities or ENTITY_NAMESPACES
+    existing = {entity for (entity,) in conn.execute(sql_select(versions_table.c.entity))}
+    missing = [{"entity": entity, "version": 0} for entity in entities if entity not in existing]
+    if missing:
+        conn.execute(insert(versions_table), missing)
+    return len(missing)
+
+def bump_version(conn, entity):
+    """Tăng version của entity trong transaction của conn, trả về version mới"""
+    now = get_vietnam_time().replace(tzinfo=None)
+    bumped = update(versions_table).where(versions_table.c.entity == entity).values(
+        version=versions_table.c.version + 1, updated_at=now)
+    if conn.dialect.update_returning:
+        version = conn.execute(bumped.returning(versions_table.c.version)).scalar()
+    elif conn.execute(bumped).rowcount:
+        version = conn.execute(sql_select(versions_table.c.version).where(versions_table.c.entity == entity)).scalar()
+    else:
+        version = None
+    if version is None:
+        # Entity chưa được seed
+        conn.execute(insert(versions_table).values(entity=entity, version=1, updated_at=now))
+        version = 1
+    return version
+
+class InvalidationBus:
+    """Phát / nhận sự kiện thay đổi entity cho cache của một worker"""
+
+    def __init__(self, cache, target_engine=None, node_id=None, poll_interval=None, use_notify=None):
+        self.cache = cache
+        self.engine = target_engine or engine
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = INVALIDATION_POLL_SECONDS if poll_interval is None else poll_interval
+        self.use_notify = self.engine.dialect.name == "postgresql" if use_notify is None else use_notify
+        self.stats = {"published": 0, "received": 0, "errors": 0}
+        self._seen = {}  # entity -> version đã xử lý
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Phát ---
+
+    def publish(self, entity):
+        """Gọi sau khi commit thay đổi của entity; trả về version mới (None nếu không ghi được)"""
+        self.cache.invalidate_entity(entity)
+        try:
+            with self.engine.begin() as conn:
+                version = bump_version(conn, entity)
+                if self.use_notify:
+                    conn.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                        "channel": INVALIDATION_CHANNEL, "payload": f"{entity}:{version}:{self.node_id}"})
+        except SQLAlchemyError as e:
+            self._count("errors")
+            logger.warning("Invalidation publish failed", extra={"entity": entity, "error": str(e)})
+            return None
+        self._mark_seen(entity, version)
+        self._count("published")
+        return version
+
+    # --- Nhận ---
+
+    def handle(self, entity, version):
+        """Xóa cache của entity nếu version mới hơn lần xử lý trước; True nếu đã xóa"""
+        if not self._mark_seen(entity, version):
+            return False
+        self.cache.invalidate_entity(entity)
+        self._count("received")
+        return True
+
+    def handle_payload(self, payload):
+        """Payload NOTIFY dạng entity:version:node_id"""
+        entity, version, _ = payload.split(":", 2)
+        return self.handle(entity, int(version))
+
+    def poll_once(self):
+        """Đọc change_versions, xóa cache các entity đã đổi; trả về danh sách entity đã xóa"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql_select(versions_table.c.entity, versions_table.c.version)).all()
+        return [entity for entity, version in rows if self.handle(entity, version)]
+
+    def sync(self):
+        """Ghi nhận version hiện tại mà không xóa cache (lúc khởi động, cache còn rỗng)"""
+        with self.engine.connect() as conn:
+            for entity, version in conn.execute(sql_select(versions_table.c.entity, versions_table.c.version)):
+                self._mark_seen(entity, version)
+
+    def _mark_seen(self, entity, version):
+        with self._lock:
+            if version <= self._seen.get(entity, 0):
+                return False
+            self._seen[entity] = version
+            return True
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    # --- Thread lắng nghe ---
+
+    def start(self):
+        if self._thread is not None:
+            return self._thread
+        try:
+            self.sync()
+        except SQLAlchemyError as e:
+            logger.warning("Invalidation sync failed", extra={"error": str(e)})
+        self._stop.clear()
+        target = self._listen_loop if self.use_notify else self._poll_loop
+        self._thread = threading.Thread(target=target, name="invalidation-bus", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except SQLAlchemyError as e:
+                self._count("errors")
+                logger.warning("Invalidation poll failed", extra={"error": str(e)})
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                self._count("errors")
+                logger.warning("Invalidation listener disconnected", extra={"error": str(e)})
+                self._stop.wait(self.poll_interval)
+
+    def _listen(self):
+        # Connection riêng, tách khỏi pool: LISTEN giữ suốt vòng đời worker
+        raw = self.engine.raw_connection()
+        raw.detach()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+            self.poll_once()  # bắt kịp sự kiện phát ra lúc chưa LISTEN
+            while not self._stop.is_set():
+                if select.select([connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self.handle_payload(connection.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+    def collector(self):
+        """Dòng Prometheus cho metrics.registry.register_collector"""
+        with self._lock:
+            stats = dict(self.stats)
+        lines = []
+        for field, count in stats.items():
+            lines += [f"# TYPE cache_invalidation_{field}_total counter", f"cache_invalidation_{field}_total {count}"]
+        return lines
+
+bus = InvalidationBus(cache)
@@ -0,0 +1,143 @@
+"""
+Job định kỳ trong process - chạy job hàng ngày (phân tích bất thường) ngay trong worker uvicorn
+Container Railway chỉ chạy uvicorn (Dockerfile CMD), không có cron.
+
+- Mỗi worker có một thread kiểm tra mỗi JOB_CHECK_SECONDS giây; job đến hạn khi đã qua giờ chạy
+  trong ngày (giờ Việt Nam) mà lần chạy gần nhất bắt đầu trước mốc đó
+- Nhiều worker / replica: worker nào UPDATE được dòng của job trong job_runs (started_at < mốc) thì chạy,
+  worker khác bỏ qua -> mỗi mốc chỉ chạy một lần, kể cả khi worker khởi động lại
+- Mốc đã giành / đã bị worker khác giành được nhớ trong process: giữa hai mốc việc kiểm tra không chạy SQL
+  (kiểm tra mỗi phút mà query DB sẽ giữ service thức, Railway sleepOnIdle không bao giờ ngủ)
+- Container đang ngủ lúc đến giờ (Railway free tier): job chạy ngay khi worker thức dậy
+- Job lỗi không chạy lại trong ngày (tránh lặp lỗi mỗi phút), số lần chạy / lỗi xuất ra /metrics
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, time as day_time, timedelta
+
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from database_production import JobRun, engine, get_vietnam_time
+
+logger = logging.getLogger(__name__)
+
+JOB_CHECK_SECONDS = float(os.getenv("JOB_CHECK_SECONDS", "60"))
+
+jobs_table = JobRun.__table__
+
+def parse_time(value):
+    """"HH:MM" -> datetime.time"""
+    hour, minute = value.split(":")
+    return day_time(int(hour), int(minute))
+
+def due_at(at, now):
+    """Mốc chạy gần nhất không sau now"""
+    scheduled = datetime.combine(now.date(), at)
+    return scheduled if scheduled <= now else scheduled - timedelta(days=1)
+
+class DailyJob:
+    """Chạy func() mỗi ngày một lần lúc `at` (HH:MM giờ Việt Nam) trên một worker duy nhất"""
+
+    def __init__(self, name, at, func, target_engine=None, check_interval=None):
+        self.name = name
+        self.at = parse_time(at)
+        self.func = func
+        self.engine = target_engine or engine
+        self.check_interval = JOB_CHECK_SECONDS if check_interval is None else check_interval
+        self.stats = {"runs": 0, "errors": 0}
+        self._last_due = None  # mốc gần nhất đã được claim (bởi worker này hoặc worker khác)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim(self, due, now):
+        """True nếu worker này giành được lần chạy của mốc due"""
+        with self.engine.begin() as conn:
+            claimed = conn.execute(update(jobs_table).where(
+                jobs_table.c.name == self.name,
+                or_(jobs_table.c.started_at.is_(None), jobs_table.c.started_at < due),
+            ).values(started_at=now)).rowcount
+            if claimed:
+                return True
+            if conn.execute(select(jobs_table.c.name).where(jobs_table.c.name == self.name)).first():
+                return False
+        try:
+            # Lần chạy đầu tiên: hai worker cùng INSERT -> chỉ một worker thành công
+            with self.engine.begin() as conn:
+                conn.execute(insert(jobs_table).values(name=self.name, started_at=now))
+            return True
+        except IntegrityError:
+            return False
+
+    def load_last_run(self):
+        """Đọc started_at của lần chạy gần nhất một lần lúc khởi động (mọi worker)"""
+        with self.engine.connect() as conn:
+            self._last_due = conn.execute(
+                select(jobs_table.c.started_at).where(jobs_table.c.name == self.name)).scalar()
+        return self._last_due
+
+    def run_if_due(self, now=None):
+        """Chạy job nếu đến hạn và giành được lượt; True nếu worker này đã chạy"""
+        now = now or get_vietnam_time().replace(tzinfo=None)
+        due = due_at(self.at, now)
+        if self._last_due is not None and due <= self._last_due:
+            return False
+        claimed = self.claim(due, now)
+        self._last_due = max(due, self._last_due) if self._last_due is not None else due
+        if not claimed:
+            return False
+        try:
+            self.func()
+        except Exception as e:
+            self._count("errors")
+            logger.exception("Scheduled job failed", extra={"job": self.name, "error": str(e)})
+            return True
+        with self.engine.begin() as conn:
+            conn.execute(update(jobs_table).where(jobs_table.c.name == self.name).values(
+                finished_at=get_vietnam_time().replace(tzinfo=None)))
+        self._count("runs")
+        return True
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    # --- Thread kiểm tra ---
+
+    def start(self):
+        if self._thread is not None:
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _loop(self):
+        try:
+            self.load_last_run()
+        except SQLAlchemyError as e:
+            logger.warning("Scheduled job load failed", extra={"job": self.name, "error": str(e)})
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.run_if_due()
+            except SQLAlchemyError as e:
+                logger.warning("Scheduled job check failed", extra={"job": self.name, "error": str(e)})
+
+    def collector(self):
+        """Dòng Prometheus cho metrics.registry.register_collector"""
+        with self._lock:
+            stats = dict(self.stats)
+        lines = []
+        for field, count in stats.items():
+            lines += [f"# TYPE scheduled_job_{field}_total counter",
+                      f'scheduled_job_{field}_total{{job="{self.name}"}} {count}']
+        return lines
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Ledger Summary - bảng tổng hợp thu/bàn giao theo ngày
+Mỗi dòng = (ngày, tòa nhà, user, phương thức thanh toán): số khoản thu, tổng phải thu, đã thu,
+tiền mặt đã thu, số bàn giao, tiền đã bàn giao. Dashboard / báo cáo đọc O(ngày × tòa nhà) dòng
+thay vì quét toàn bộ payments.
+
+- Cập nhật trong cùng transaction với thay đổi payments/handovers (session event after_flush,
+  xem database_production.py) nên không bao giờ lệch sau commit
+- query(...).delete()/update() hàng loạt không đi qua flush -> rebuild lại trước khi commit
+- Bàn giao ghi vào dòng phương thức "cash" của người bàn giao (handover_by_user_id)
+- building_id NULL lưu thành 0 để dùng được trong primary key
+
+Cách dùng:
+    python ledger_summary.py verify     # so bảng tổng hợp với dữ liệu gốc, exit 1 nếu lệch
+    python ledger_summary.py rebuild    # tính lại toàn bộ từ payments/handovers
+"""
+
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import and_, bindparam, case, delete, func, inspect, literal_column, select
+
+from database_production import Handover, LedgerDailySummary, Payment, engine, get_vietnam_time
+
+KEY_COLUMNS = ("day", "building_id", "user_id", "payment_method")
+SUM_COLUMNS = ("payment_count", "amount_due", "amount_collected", "cash_collected", "handover_count", "handed_over")
+# Dòng có mọi cột đếm về 0 thì bị xóa
+COUNT_COLUMNS = ("payment_count", "handover_count")
+HANDOVER_METHOD = "cash"
+# Sai số cho phép khi so tổng tiền (Float cộng dồn)
+AMOUNT_TOLERANCE = 0.01
+
+summary_table = LedgerDailySummary.__table__
+
+def as_date(value):
+    """date từ datetime / date / chuỗi 'YYYY-MM-DD' (SQLite trả date() dạng chuỗi)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def _day(created_at):
+    return as_date(created_at or get_vietnam_time().replace(tzinfo=None))
+
+def payment_contribution(get):
+    """[(key, giá trị)] mà một payment đóng góp - get(tên cột) trả về giá trị cột"""
+    method = get("payment_method")
+    collected = get("amount_collected") or 0
+    key = (_day(get("created_at")), get("building_id") or 0, get("added_by_user_id"), method)
+    return [(key, {
+        "payment_count": 1,
+        "amount_due": get("amount_due") or 0,
+        "amount_collected": collected,
+        "cash_collected": collected if method == "cash" else 0,
+    })]
+
+def handover_contribution(get):
+    """[(key, giá trị)] mà một bàn giao đóng góp - chỉ bàn giao completed được tính tiền"""
+    key = (_day(get("created_at")), get("building_id") or 0, get("handover_by_user_id"), HANDOVER_METHOD)
+    return [(key, {
+        "handover_count": 1,
+        "handed_over": (get("amount") or 0) if get("status") == "completed" else 0,
+    })]
+
+CONTRIBUTIONS = {Payment: payment_contribution, Handover: handover_contribution}
+
+def add_contributions(deltas, contributions, sign, sum_columns=SUM_COLUMNS):
+    """Cộng (sign=1) / trừ (sign=-1) các đóng góp vào deltas {key: giá trị}"""
+    for key, values in contributions:
+        row = deltas.setdefault(key, dict.fromkeys(sum_columns, 0))
+        for column, value in values.items():
+            row[column] += sign * value
+
+def _old_value(obj):
+    """Giá trị cột trước flush (đã commit) của object"""
+    state = inspect(obj)
+
+    def get(key):
+        history = state.attrs[key].history
+        return history.deleted[0] if history.deleted else getattr(obj, key)
+    return get
+
+def collect_session_changes(session, contributions=None, sum_columns=SUM_COLUMNS):
+    """Delta tổng hợp từ session.new / dirty / deleted (gọi trong after_flush)"""
+    contributions = contributions or CONTRIBUTIONS
+    deltas = {}
+    for obj in session.new:
+        contribute = contributions.get(type(obj))
+        if contribute:
+            add_contributions(deltas, contribute(lambda key: getattr(obj, key)), 1, sum_columns)
+    for obj in session.dirty:
+        contribute = contributions.get(type(obj))
+        if contribute and session.is_modified(obj, include_collections=False):
+            add_contributions(deltas, contribute(_old_value(obj)), -1, sum_columns)
+            add_contributions(deltas, contribute(lambda key: getattr(obj, key)), 1, sum_columns)
+    for obj in session.deleted:
+        contribute = contributions.get(type(obj))
+        if contribute:
+            add_contributions(deltas, contribute(_old_value(obj)), -1, sum_columns)
+    return deltas
+
+def apply_deltas(conn, deltas, table=summary_table, key_columns=KEY_COLUMNS, sum_columns=SUM_COLUMNS,
+                 count_columns=COUNT_COLUMNS):
+    """Cộng delta vào bảng tổng hợp (upsert), xóa các dòng không còn giao dịch nào
+
+    table/key_columns/... cho phép bảng tổng hợp khác dùng lại (cash_reconciliation.py).
+    """
+    rows = [
+        dict(zip(key_columns, key), **values)
+        for key, values in deltas.items()
+        if any(values.values())
+    ]
+    if not rows:
+        return 0
+
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={column: table.c[column] + stmt.excluded[column] for column in sum_columns},
+        )
+        conn.execute(stmt, rows)
+    else:
+        for row in rows:
+            updated = conn.execute(
+                table.update().where(_key_clause(table, key_columns)).values(
+                    {column: table.c[column] + row[column] for column in sum_columns}
+                ),
+                {f"key_{column}": row[column] for column in key_columns},
+            )
+            if not updated.rowcount:
+                conn.execute(table.insert(), row)
+
+    emptied = [
+        {f"key_{column}": row[column] for column in key_columns}
+        for row in rows
+        if any(row[column] < 0 for column in count_columns)
+    ]
+    if emptied:
+        conn.execute(
+            delete(table).where(_key_clause(table, key_columns), *(table.c[column] <= 0 for column in count_columns)),
+            emptied,
+        )
+    return len(rows)
+
+def _key_clause(table, key_columns):
+    return and_(*(table.c[column] == bindparam(f"key_{column}") for column in key_columns))
+
+def apply_rows(conn, model, rows):
+    """Cộng dồn các dòng insert thẳng bằng Core (generate_data) vào bảng tổng hợp"""
+    deltas = {}
+    contribute = CONTRIBUTIONS[model]
+    for row in rows:
+        add_contributions(deltas, contribute(row.get), 1)
+    return apply_deltas(conn, deltas)
+
+# --- Tính lại từ dữ liệu gốc ---
+
+def aggregate_source(conn):
+    """{key: giá trị} tính trực tiếp từ payments + handovers (GROUP BY trong database)"""
+    # literal_column: cùng biểu thức ở SELECT và GROUP BY (bind param khác nhau PostgreSQL không nhận)
+    zero = literal_column("0")
+    payment_day = func.date(Payment.created_at)
+    payment_building = func.coalesce(Payment.building_id, zero)
+    payments = select(
+        payment_day, payment_building, Payment.added_by_user_id, Payment.payment_method,
+        func.count(Payment.id), func.sum(Payment.amount_due), func.sum(Payment.amount_collected),
+        func.sum(case((Payment.payment_method == literal_column("'cash'"), Payment.amount_collected),
+                      else_=zero)),
+    ).group_by(payment_day, payment_building, Payment.added_by_user_id, Payment.payment_method)
+
+    handover_day = func.date(Handover.created_at)
+    handover_building = func.coalesce(Handover.building_id, zero)
+    handovers = select(
+        handover_day, handover_building, Handover.handover_by_user_id,
+        func.count(Handover.id),
+        func.sum(case((Handover.status == literal_column("'completed'"), Handover.amount), else_=zero)),
+    ).group_by(handover_day, handover_building, Handover.handover_by_user_id)
+
+    expected = {}
+    for day, building_id, user_id, method, count, due, collected, cash in conn.execute(payments):
+        row = expected.setdefault((as_date(day), building_id, user_id, method), dict.fromkeys(SUM_COLUMNS, 0))
+        row.update(payment_count=count, amount_due=due or 0, amount_collected=collected or 0, cash_collected=cash or 0)
+    for day, building_id, user_id, count, amount in conn.execute(handovers):
+        row = expected.setdefault((as_date(day), building_id, user_id, HANDOVER_METHOD), dict.fromkeys(SUM_COLUMNS, 0))
+        row.update(handover_count=count, handed_over=amount or 0)
+    return expected
+
+def load_rows(conn, table=summary_table, key_columns=KEY_COLUMNS, sum_columns=SUM_COLUMNS):
+    """{key: giá trị} đang lưu trong bảng tổng hợp"""
+    return {
+        tuple(row[:len(key_columns)]): dict(zip(sum_columns, row[len(key_columns):]))
+        for row in conn.execute(select(*(table.c[column] for column in key_columns + sum_columns)))
+    }
+
+def replace_rows(conn, expected, table=summary_table, key_columns=KEY_COLUMNS, batch_size=5000):
+    """Xóa toàn bộ bảng rồi ghi {key: giá trị} - chạy trong transaction của conn"""
+    conn.execute(delete(table))
+    rows = [dict(zip(key_columns, key), **values) for key, values in expected.items()]
+    for start in range(0, len(rows), batch_size):
+        conn.execute(table.insert(), rows[start:start + batch_size])
+    return len(rows)
+
+def diff_rows(expected, actual, key_columns=KEY_COLUMNS, sum_columns=SUM_COLUMNS):
+    """Các key có giá trị lệch giữa dữ liệu gốc (expected) và bảng tổng hợp (actual)"""
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, dict.fromkeys(sum_columns, 0))
+        have = actual.get(key, dict.fromkeys(sum_columns, 0))
+        if any(abs((want[column] or 0) - (have[column] or 0)) > AMOUNT_TOLERANCE for column in sum_columns):
+            mismatches.append({"key": dict(zip(key_columns, key)), "expected": want, "actual": have})
+    return mismatches
+
+def rebuild(conn):
+    """Xóa và tính lại toàn bộ bảng tổng hợp - chạy trong transaction của conn"""
+    return replace_rows(conn, aggregate_source(conn))
+
+def verify(conn):
+    """Danh sách dòng lệch giữa bảng tổng hợp và dữ liệu gốc (rỗng = khớp)"""
+    return diff_rows(aggregate_source(conn), load_rows(conn))
+
+# --- Đọc cho dashboard ---
+
+def totals(db, user_id=None):
+    """Tổng cho dashboard; user_id != None -> khoản thu chỉ của user đó (bàn giao luôn tính toàn bộ)"""
+    payment_sums = [func.coalesce(func.sum(summary_table.c[column]), 0)
+                    for column in ("payment_count", "amount_due", "amount_collected", "cash_collected")]
+    handover_sums = [func.coalesce(func.sum(summary_table.c[column]), 0)
+                     for column in ("handover_count", "handed_over")]
+    if user_id is None:
+        row = db.execute(select(*payment_sums, *handover_sums)).one()
+    else:
+        row = (*db.execute(select(*payment_sums).where(summary_table.c.user_id == user_id)).one(),
+               *db.execute(select(*handover_sums)).one())
+    return dict(zip(SUM_COLUMNS, row))
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if command == "rebuild":
+        with engine.begin() as conn:
+            count = rebuild(conn)
+        print(f"✅ Đã tính lại bảng tổng hợp: {count:,} dòng")
+        return 0
+    if command == "verify":
+        with engine.connect() as conn:
+            mismatches = verify(conn)
+        if not mismatches:
+            print("✅ Bảng tổng hợp khớp với payments/handovers")
+            return 0
+        print(f"🔴 {len(mismatches)} dòng lệch (chạy 'python ledger_summary.py rebuild' để sửa):")
+        for mismatch in mismatches[:20]:
+            print(f"  {mismatch['key']}: mong đợi {mismatch['expected']} / đang lưu {mismatch['actual']}")
+        return 1
+    print(f"❌ Lệnh không hợp lệ: {command} (verify | rebuild)")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
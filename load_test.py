@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Load Test - latency/throughput các luồng chính
+Chạy app in-process (ASGI) hoặc dưới uvicorn, seed dữ liệu theo nhiều quy mô,
+bắn request đồng thời bằng httpx async và so sánh với baseline đã lưu.
+
+Luồng: login, list payments, add payment (kèm ảnh), dashboard, tạo bàn giao, list bàn giao
+
+Cách dùng:
+    python load_test.py                                   # in-process, scale 1000 & 10000
+    python load_test.py --mode uvicorn --scales 50000 --concurrency 1,16
+    python load_test.py --save-baseline                   # lưu kết quả làm baseline
+    python load_test.py --baseline load_test_baseline.json --tolerance 0.25   # exit 1 nếu chậm hơn
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+DEFAULT_BASELINE = "load_test_baseline.json"
+USERNAME = "admin"
+PASSWORD = "admin123"
+# PNG 1x1 - đủ để đi qua đường upload ảnh
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+def percentile(sorted_values, pct):
+    """Percentile theo nearest-rank trên list đã sort"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, wall_seconds):
+    """p50/p95/p99 (ms), throughput (req/s), tỉ lệ lỗi"""
+    values = sorted(latencies)
+    total = len(values)
+    return {
+        "requests": total,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "rps": round(total / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+    }
+
+# --- Luồng ---
+
+def flow_login(client, state):
+    return client.post("/api/login", data={"username": USERNAME, "password": PASSWORD})
+
+def flow_list_payments(client, state):
+    return client.get("/api/payments")
+
+def flow_add_payment(client, state):
+    n = random.randint(0, 10**9)
+    return client.post("/api/payments", data={
+        "booking_id": f"LT{n}", "guest_name": f"Khách tải {n}", "room_number": "101",
+        "building_id": str(random.choice(state["building_ids"])),
+        "amount_due": "1500000", "amount_collected": "1500000",
+        "payment_method": random.choice(["cash", "bank_transfer"]), "collected_by": "Load Test",
+    }, files={"receipt_image": ("receipt.png", TINY_PNG, "image/png")})
+
+def flow_dashboard(client, state):
+    return client.get("/api/dashboard")
+
+def flow_create_handover(client, state):
+    return client.post("/api/handovers", data={
+        "building_id": str(random.choice(state["building_ids"])),
+        "to_person": "Kế toán", "amount": "500000", "notes": "load test",
+    })
+
+def flow_list_handovers(client, state):
+    return client.get("/api/handovers")
+
+FLOWS = {
+    "login": flow_login,
+    "list_payments": flow_list_payments,
+    "add_payment_with_image": flow_add_payment,
+    "dashboard": flow_dashboard,
+    "create_handover": flow_create_handover,
+    "list_handovers": flow_list_handovers,
+}
+
+async def run_flow(make_client, flow, state, concurrency, total_requests):
+    """total_requests request chia cho `concurrency` client (mỗi client có cookie riêng)"""
+    latencies = []
+    errors = 0
+    remaining = [total_requests]
+
+    async def worker():
+        nonlocal errors
+        async with make_client() as client:
+            await client.post("/api/login", data={"username": USERNAME, "password": PASSWORD})
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    response = await flow(client, state)
+                    failed = response.status_code >= 400
+                    if not failed and flow is flow_add_payment:
+                        state["uploaded"].append(response.json()["payment"]["receipt_image"])
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append(time.perf_counter() - started)
+                errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+# --- Seed dữ liệu ---
+
+def seed_to_scale(target_payments):
+    """Bổ sung payments/handovers cho đủ target_payments (generate_data, insert theo batch)"""
+    from sqlalchemy import func, select
+    from database_production import Building, Payment, engine
+    from generate_data import generate
+
+    with engine.connect() as conn:
+        has_buildings = conn.execute(select(Building.id).limit(1)).first() is not None
+        existing = conn.execute(select(func.count(Payment.id))).scalar()
+    if existing < target_payments:
+        generate(buildings=0 if has_buildings else 10, users=0 if has_buildings else 10,
+                 payments=target_payments - existing, verbose=False)
+    with engine.connect() as conn:
+        return list(conn.execute(select(Building.id).where(Building.is_active == True)).scalars())
+
+# --- Chạy app ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class InProcessApp:
+    """App chạy trong cùng process qua ASGITransport (không tốn network)"""
+
+    async def __aenter__(self):
+        import main
+        self.app = main.app
+        self._lifespan = main.app.router.lifespan_context(main.app)
+        await self._lifespan.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._lifespan.__aexit__(*exc)
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://loadtest")
+
+class UvicornApp:
+    """App chạy trong process uvicorn riêng - đo cả HTTP stack"""
+
+    def __init__(self, workers=1):
+        self.port = free_port()
+        self.workers = workers
+
+    async def __aenter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            env=dict(os.environ),
+        )
+        async with httpx.AsyncClient() as client:
+            for _ in range(300):
+                try:
+                    if (await client.get(f"http://127.0.0.1:{self.port}/health")).status_code == 200:
+                        return self
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.1)
+        self.process.terminate()
+        raise RuntimeError("uvicorn không khởi động được")
+
+    async def __aexit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+    def client(self):
+        limits = httpx.Limits(max_connections=100)
+        return httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.port}", limits=limits, timeout=30)
+
+async def run_suite(mode, scales, concurrency_levels, requests_per_level, flows):
+    results = {}
+    state = {"uploaded": []}
+    if mode == "uvicorn":
+        # Schema + user demo phải có trước khi seed, uvicorn sẽ thấy schema đã mới nhất
+        from startup import bootstrap_database
+        bootstrap_database()
+    app_context = InProcessApp() if mode == "inprocess" else UvicornApp()
+    async with app_context as app:
+        try:
+            for scale in sorted(scales):
+                state["building_ids"] = seed_to_scale(scale)
+                for concurrency in concurrency_levels:
+                    for name in flows:
+                        key = f"{scale}/{name}/c{concurrency}"
+                        results[key] = await run_flow(app.client, FLOWS[name], state, concurrency,
+                                                      max(requests_per_level, concurrency))
+                        print_result(key, results[key])
+        finally:
+            remove_uploads(state["uploaded"])
+    return results
+
+def remove_uploads(paths):
+    """Xóa ảnh biên lai do load test tạo ra"""
+    for path in paths:
+        if path:
+            try:
+                os.remove(path.lstrip("/"))
+            except OSError:
+                pass
+
+# --- Báo cáo & baseline ---
+
+def print_result(key, result):
+    line = (f"{key:<40} p50 {result['p50_ms']:>8.1f}ms  p95 {result['p95_ms']:>8.1f}ms  "
+            f"p99 {result['p99_ms']:>8.1f}ms  {result['rps']:>7.1f} req/s  lỗi {result['error_rate']:.1%}")
+    print(line)
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Danh sách regression: p95 chậm hơn baseline quá tolerance, hoặc tỉ lệ lỗi tăng"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {result['p95_ms']}ms > baseline {base['p95_ms']}ms (+{tolerance:.0%})")
+        if result["error_rate"] > base["error_rate"]:
+            regressions.append(f"{key}: error rate {result['error_rate']:.2%} > baseline {base['error_rate']:.2%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test các luồng chính")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--scales", default="1000,10000", help="Số payments seed, vd 1000,10000,100000")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="Số request mỗi luồng / mức đồng thời")
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--database-url", help="Mặc định: SQLite tạm mới")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Cho phép p95 chậm hơn baseline (0.2 = 20%%)")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    # Phải set trước khi import database_production / main
+    os.environ["DATABASE_URL"] = args.database_url or "sqlite:///{}".format(
+        os.path.join(tempfile.mkdtemp(prefix="payment_loadtest_"), "loadtest.db")
+    )
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    flows = [name.strip() for name in args.flows.split(",") if name.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"Luồng không tồn tại: {', '.join(sorted(unknown))}")
+
+    print(f"🚀 Load test ({args.mode}) - DB: {os.environ['DATABASE_URL']}")
+    results = asyncio.run(run_suite(
+        args.mode,
+        [int(value) for value in args.scales.split(",")],
+        [int(value) for value in args.concurrency.split(",")],
+        args.requests,
+        flows,
+    ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"💾 Đã lưu baseline: {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n🔴 REGRESSION so với baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n🟢 Không có regression so với {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Structured Logging - JSON, không chặn event loop
+Handler chỉ đẩy record vào queue; một thread riêng (QueueListener) ghi ra stdout.
+
+- LOG_LEVEL: level mặc định (INFO)
+- LOG_LEVELS: level theo module, vd "query_stats=WARNING,auth_service_simple=DEBUG"
+- LOG_FORMAT: json (mặc định) hoặc text khi chạy local
+- LOG_DEBUG_SAMPLE_RATE: tỉ lệ giữ lại log DEBUG (0.0 - 1.0), INFO trở lên luôn được ghi
+- LOG_QUEUE_SIZE: số record tối đa chờ ghi, đầy thì bỏ (không block request)
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Thư viện log DEBUG cho từng byte form - luôn giữ ở INFO trừ khi LOG_LEVELS chỉ định khác
+DEFAULT_MODULE_LEVELS = {"multipart": "INFO", "python_multipart": "INFO"}
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+# Thuộc tính chuẩn của LogRecord - phần còn lại (truyền qua extra=) được đưa vào JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+def get_request_id():
+    """Request ID của request đang xử lý (None nếu ngoài request)"""
+    return _request_id.get()
+
+class RequestIdFilter(logging.Filter):
+    """Gắn request_id vào record - chạy trên thread gọi log nên đọc được contextvar"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class DebugSamplingFilter(logging.Filter):
+    """Chỉ giữ một phần log DEBUG (event số lượng lớn), có thể override bằng extra={"sample_rate": x}"""
+
+    def __init__(self, rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1 or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi record là một dòng JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "sample_rate":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Format dễ đọc khi chạy local"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler không bao giờ block: queue đầy thì bỏ record và đếm lại"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Bản sao để không ảnh hưởng handler khác; giữ các field extra cho formatter ở listener,
+        # chỉ render sẵn message và traceback (object traceback không nên đi qua thread khác)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def parse_module_levels(spec):
+    """'a=DEBUG,b.c=WARNING' -> {'a': 'DEBUG', 'b.c': 'WARNING'}"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging(level=None, module_levels=None, fmt=None, stream=None):
+    """Cấu hình root logger: QueueHandler -> QueueListener (thread riêng) -> stdout
+
+    Gọi nhiều lần không tạo thêm listener. Trả về QueueHandler đang dùng.
+    """
+    global _listener
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(DebugSamplingFilter())
+
+    root.addHandler(queue_handler)
+    root.setLevel(level or LOG_LEVEL)
+    levels = {**DEFAULT_MODULE_LEVELS, **(module_levels or parse_module_levels(LOG_LEVELS))}
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return queue_handler
+
+def shutdown_logging():
+    """Ghi nốt các record còn trong queue rồi dừng listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestIdMiddleware:
+    """ASGI middleware: lấy X-Request-ID từ client (hoặc tạo mới), gắn vào log và response
+
+    Đặt ngoài cùng để mọi log trong request (kể cả middleware khác) có request_id.
+    Log DEBUG mỗi request (bị sampling) với route, status và thời gian xử lý.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+        status_holder = {"status": 500}
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                route = getattr(scope.get("route"), "path", None) or scope.get("path")
+                self.logger.debug("request", extra={
+                    "method": scope["method"], "route": route, "status": status_holder["status"],
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                })
+            _request_id.reset(token)
@@ -4,19 +4,33 @@ Sử dụng SQLite database để lưu trữ bền vững
 Bao gồm quản lý user và deployment ready
 """
 
-from fastapi import FastAPI, Request, HTTPException, Form, File, UploadFile, Depends, Cookie
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+import time
+_BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, Response, HTTPException, Form, File, UploadFile, Depends, Cookie
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, PlainTextResponse, FileResponse
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
 import os
 import uuid
 import shutil
+import tempfile
 import threading
 import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+
+from startup import BootTimer, bootstrap_database, precompile_templates_in_background
+
+boot_timer = BootTimer(_BOOT_STARTED)
+boot_timer.mark("import_framework")
 
 # Timezone support - fallback cho Python < 3.9
 try:
@@ -28,54 +42,68 @@ except ImportError:
     vietnam_tz = timezone(timedelta(hours=7))  # UTC+7 for Vietnam
 
 # Import các module tự tạo
-from database_production import get_db, create_tables, User, Payment, Handover, Building  
+from database_production import get_db, get_read_db, open_read_session, start_sqlite_maintenance, get_pool_status, engine, User, Payment, Handover, Building  
+from sqlalchemy import text
+import metrics
+import profiler
+import railway_monitor
+import traffic_capture
+from cache import cache
+from coalesce import request_coalescer, role_scope
+import conditional_get
+from invalidation_bus import bus as invalidation_bus
+import job_scheduler
+import cash_reconciliation
+import ledger_summary
+import query_stats
+import reports
+from slow_queries import slow_query_log
+boot_timer.mark("import_database")
 
 # Railway Free Tier Optimizations
 import logging
 import os
 
-# Configure logging for performance (Railway optimization)
-logging.basicConfig(
-    level=logging.WARNING,  # Reduce logging overhead
-    format='%(levelname)s: %(message)s'
-)
+# Structured JSON logging qua queue - ghi log không chặn event loop (LOG_LEVEL, LOG_LEVELS...)
+import log_config
+log_handler = log_config.setup_logging()
+logger = logging.getLogger("main")
 
 # Environment optimization for Railway free tier
 os.environ.setdefault('UVICORN_WORKERS', '1')  # Single worker
 os.environ.setdefault('UVICORN_TIMEOUT_KEEP_ALIVE', '5')  # Quick timeout
 
-# Google Drive backup import (optional)
-try:
-    from google_drive_backup import GoogleDriveBackup, daily_backup_job, setup_backup_schedule
-    GOOGLE_DRIVE_ENABLED = True
-    print("✅ Google Drive backup enabled")
-except ImportError:
-    GOOGLE_DRIVE_ENABLED = False
-    print("⚠️ Google Drive backup not available (missing dependencies)")
+# Google Drive backup (optional) - chỉ kiểm tra package có cài không, import khi dùng lần đầu
+# (googleapiclient + oauth stack tốn ~150ms import, không cần cho mỗi lần wake)
+GOOGLE_DRIVE_ENABLED = all(
+    importlib.util.find_spec(module) is not None
+    for module in ("googleapiclient", "google_auth_oauthlib")
+)
 
-# Try simple auth first, fallback to original if needed
-try:
-    from auth_service_simple import (
-        authenticate_user, 
-        create_access_token, 
-        get_current_user_from_token,
-        create_user,
-        get_all_users,
-        get_role_display_name,
-        get_password_hash
-    )
-    print("✅ Using simple authentication (SHA256)")
-except ImportError:
-    from auth_service import (
-        authenticate_user, 
-        create_access_token, 
-        get_current_user_from_token,
-        create_user,
-        get_all_users,
-        get_role_display_name,
-        get_password_hash
-    )
-    print("⚠️ Using bcrypt authentication")
+# Analytics (optional, owner) - cũng chỉ kiểm tra package, import module trong endpoint
+# (pyarrow.dataset ~130ms, duckdb ~45ms, numpy ~55ms import)
+PARQUET_EXPORT_ENABLED = importlib.util.find_spec("pyarrow") is not None
+ANALYTICS_SQL_ENABLED = PARQUET_EXPORT_ENABLED and importlib.util.find_spec("duckdb") is not None
+ANOMALY_DETECTION_ENABLED = importlib.util.find_spec("numpy") is not None
+# Giờ chạy phân tích bất thường hàng ngày (giờ Việt Nam, rỗng = tắt) - job chạy trong process, không cần cron
+ANOMALY_SCHEDULE_TIME = os.getenv("ANOMALY_SCHEDULE_TIME", "02:30")
+
+def get_google_drive_backup():
+    """Import lazy GoogleDriveBackup"""
+    from google_drive_backup import GoogleDriveBackup
+    return GoogleDriveBackup()
+
+# Authentication SHA256 (auth_service bcrypt chỉ import trong debug endpoint)
+from auth_service_simple import (
+    authenticate_user, 
+    create_access_token, 
+    get_current_user_from_token,
+    create_user,
+    get_all_users,
+    get_role_display_name,
+    get_password_hash
+)
+boot_timer.mark("import_auth")
 
 # Add CORS middleware import
 from fastapi.middleware.cors import CORSMiddleware
@@ -84,13 +112,44 @@ from fastapi.middleware.cors import CORSMiddleware
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Khởi tạo database
-create_tables()
+def run_scheduled_anomaly_detection():
+    import anomaly_detection
+    summary = anomaly_detection.run(verbose=False)
+    logger.info("Anomaly detection (scheduled)", extra=summary)
+
+anomaly_job = job_scheduler.DailyJob(
+    "anomaly_detection", ANOMALY_SCHEDULE_TIME, run_scheduled_anomaly_detection
+) if ANOMALY_DETECTION_ENABLED and ANOMALY_SCHEDULE_TIME else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Khởi động: schema/user bootstrap theo version, precompile templates, maintenance"""
+    first_boot = "startup" not in boot_timer.steps
+    if first_boot:
+        boot_timer.mark("import_app")
+    applied = boot_timer.measure("database_bootstrap", bootstrap_database)
+    if applied:
+        print(f"✅ Schema migrated to version {applied[-1]}")
+    start_sqlite_maintenance()
+    usage_tracker.start()
+    invalidation_bus.start()
+    if anomaly_job:
+        anomaly_job.start()
+    if first_boot:
+        precompile_templates_in_background(templates.env, boot_timer)
+        boot_timer.mark("startup")
+        print(boot_timer.summary_line())
+    yield
+    if anomaly_job:
+        anomaly_job.stop()
+    invalidation_bus.stop()
+    usage_tracker.stop()
 
 app = FastAPI(
     title="Hệ thống Thu Chi Airbnb", 
     description="Quản lý thu chi và bàn giao tiền mặt - Production Version",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -102,6 +161,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency / status / in-flight / DB query metrics
+# (add_middleware sau = bọc ngoài: Metrics -> QueryStats -> app)
+app.add_middleware(query_stats.QueryStatsMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.registry.register_collector(metrics.pool_collector(get_pool_status))
+metrics.registry.register_collector(cache.collector)
+metrics.registry.register_collector(invalidation_bus.collector)
+metrics.registry.register_collector(request_coalescer.collector)
+if anomaly_job:
+    metrics.registry.register_collector(anomaly_job.collector)
+metrics.registry.register_collector(lambda: [
+    "# TYPE log_records_dropped_total counter",
+    f"log_records_dropped_total {log_handler.dropped}",
+])
+# Thời gian active/idle thật từ traffic -> railway_usage.json (dự báo free tier 500h)
+usage_tracker = railway_monitor.UsageTracker()
+app.add_middleware(railway_monitor.UsageMiddleware, tracker=usage_tracker)
+# Ghi trace ẩn danh để phát lại (chỉ khi đặt TRAFFIC_CAPTURE_FILE)
+if traffic_capture.TRAFFIC_CAPTURE_FILE:
+    app.add_middleware(traffic_capture.TrafficCaptureMiddleware)
+# Ngoài cùng: request_id có trong mọi log của request
+app.add_middleware(log_config.RequestIdMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_exhausted_handler(request: Request, exc: PoolTimeoutError):
+    """Hết connection trong pool -> trả 503 ngay để client thử lại"""
+    return JSONResponse(
+        {"detail": "Hệ thống đang quá tải, vui lòng thử lại sau giây lát"},
+        status_code=503,
+        headers={"Retry-After": "2"}
+    )
+
 # Railway Free Tier: Health check endpoint for smart sleep
 @app.get("/health")
 async def health_check():
@@ -120,16 +211,63 @@ async def root():
     """Redirect root to login page"""
     return RedirectResponse(url="/login", status_code=302)
 
+def get_uploads_usage():
+    """Dung lượng thư mục uploads và ổ đĩa chứa nó"""
+    total_bytes = 0
+    file_count = 0
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.is_file():
+            total_bytes += entry.stat().st_size
+            file_count += 1
+    disk = shutil.disk_usage(UPLOAD_DIR)
+    return {
+        "files": file_count,
+        "bytes": total_bytes,
+        "disk_free_bytes": disk.free,
+        "disk_used_percent": round(disk.used / disk.total * 100, 1) if disk.total else None
+    }
+
 @app.get("/health/detailed")
 async def detailed_health():
     """Detailed health check with system status"""
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "backup": "google_drive_enabled",
+    status = "healthy"
+    database = {"dialect": engine.dialect.name}
+    try:
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        database["status"] = "connected"
+        database["round_trip_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    except Exception as e:
+        status = "unhealthy"
+        database["status"] = "error"
+        database["error"] = str(e)
+
+    return JSONResponse({
+        "status": status,
+        "database": database,
+        "pool": get_pool_status(),
+        "uploads": get_uploads_usage(),
+        "in_flight_requests": metrics.registry.in_flight,
+        "backup": "google_drive_enabled" if GOOGLE_DRIVE_ENABLED else "not_available",
         "optimization": "railway_free_tier",
         "sleep_mode": "auto_enabled"
-    }
+    }, status_code=200 if status == "healthy" else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Metrics theo Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/boot")
+async def boot_health():
+    """Breakdown thời gian import và khởi động (cold start)"""
+    return boot_timer.report()
+
+@app.get("/health/pool")
+async def pool_health():
+    """Thống kê connection pool hiện tại"""
+    return get_pool_status()
 
 templates = Jinja2Templates(directory="templates")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
@@ -166,9 +304,14 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
         user = get_current_user_from_token(token, db)
         if not user:
             raise HTTPException(status_code=401, detail="Token không hợp lệ")
+        # Nhóm quyền cho traffic capture (không ghi danh tính user)
+        request.state.user_role = user.role
         return user
+    except PoolTimeoutError:
+        # Quá tải DB không phải lỗi xác thực -> để handler trả 503
+        raise
     except Exception as e:
-        print(f"Authentication error: {e}")
+        logger.warning("Authentication error: %s", e)
         raise HTTPException(status_code=401, detail="Token không hợp lệ")
 
 @app.get("/dashboard")
@@ -183,14 +326,14 @@ async def root(request: Request, db: Session = Depends(get_db)):
     token = request.cookies.get("access_token")
     
     if not token:
-        print("No access token found in cookies")
+        logger.debug("No access token found in cookies")
         return RedirectResponse(url="/login")
     
     try:
         # Verify token
         user = get_current_user_from_token(token, db)
         if user:
-            print(f"Valid user found: {user.username}")
+            logger.debug("Valid user found", extra={"username": user.username})
             
             # Get dashboard data
             recent_payments = db.query(Payment).order_by(Payment.created_at.desc()).limit(5).all()
@@ -205,9 +348,11 @@ async def root(request: Request, db: Session = Depends(get_db)):
                 "getVietnamTime": get_vietnam_time
             })
         else:
-            print("Token verification failed: user not found")
+            logger.info("Token verification failed: user not found")
+    except PoolTimeoutError:
+        raise
     except Exception as e:
-        print(f"Token verification failed with error: {e}")
+        logger.warning("Token verification failed with error: %s", e)
     
     # Redirect to login if no valid token
     return RedirectResponse(url="/login")
@@ -264,22 +409,20 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Đăng nhập API"""
-    print(f"🔐 Login attempt: {username}")
+    logger.debug("Login attempt", extra={"username": username})
     
     # Check if user exists
     user_check = db.query(User).filter(User.username == username).first()
     if not user_check:
-        print(f"❌ User not found: {username}")
+        logger.info("Login failed: user not found", extra={"username": username})
         raise HTTPException(status_code=401, detail="Thông tin đăng nhập không đúng")
     
-    print(f"👤 User found: {username}, role: {user_check.role}")
-    
     user = authenticate_user(db, username, password)
     if not user:
-        print(f"❌ Authentication failed: {username}")
+        logger.info("Login failed: authentication failed", extra={"username": username})
         raise HTTPException(status_code=401, detail="Thông tin đăng nhập không đúng")
     
-    print(f"✅ Authentication successful: {username}")
+    logger.info("Login successful", extra={"username": username, "role": user.role})
     
     # Tạo access token
     access_token_expires = timedelta(minutes=1440)  # 24 giờ
@@ -312,7 +455,7 @@ async def login(
         path="/"
     )
     
-    print(f"🍪 Cookie set for user: {username} (production: {is_production})")
+    logger.debug("Cookie set", extra={"username": username, "production": bool(is_production)})
     return response
 
 @app.post("/api/payments")
@@ -382,85 +525,219 @@ async def add_payment(
         "timestamp": vietnam_time.isoformat()
     }}
 
+async def coalesced_read(name, key, load, request_db, versions):
+    """load(db) chạy một lần cho các request trùng key đang chờ - session đọc riêng, không gắn với request nào
+
+    versions (change_versions của các bảng endpoint phụ thuộc, đọc trước khi chờ) nằm trong key: request
+    đến sau khi chính nó vừa ghi không gộp vào lần tính đã bắt đầu trước lần ghi đó.
+    request_db (session đã dùng để xác thực) được đóng trước khi chờ: hàng chục request đang chờ
+    không giữ hàng chục connection của pool.
+    """
+    request_db.close()
+    key = (key, tuple(sorted(versions.items())))
+
+    def run():
+        with open_read_session() as db:
+            return load(db)
+    return await request_coalescer.run(name, key, run)
+
 @app.get("/api/payments")
 async def get_payments(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy danh sách khoản thu"""
-    
-    # Lọc theo vai trò
-    if current_user.role == "assistant":
-        # Trợ lý chỉ xem được khoản thu của mình
-        payments = db.query(Payment).filter(Payment.added_by_user_id == current_user.id).all()
-    else:
-        # Quản lý và chủ sở hữu xem được tất cả
-        payments = db.query(Payment).all()
-    
-    payments_data = []
-    for payment in payments:
-        # Convert datetime to Vietnam timezone for display
-        if payment.created_at:
-            # Assume payment.created_at is already in Vietnam time (from database)
-            display_time = payment.created_at.strftime("%H:%M:%S %d/%m/%Y") 
+    """Lấy danh sách khoản thu (304 nếu If-None-Match khớp ETag hiện tại)"""
+    
+    scope = role_scope(current_user)
+    versions = conditional_get.endpoint_versions(db, "payments")
+    unchanged = conditional_get.not_modified(request, db, "payments", scope, versions)
+    if unchanged:
+        return unchanged
+    
+    def load_payments(db):
+        # Lọc theo vai trò
+        if current_user.role == "assistant":
+            # Trợ lý chỉ xem được khoản thu của mình
+            payments = db.query(Payment).filter(Payment.added_by_user_id == current_user.id).all()
         else:
-            display_time = "N/A"
-            
-        payments_data.append({
-            "id": payment.id,
-            "booking_id": payment.booking_id,
-            "guest_name": payment.guest_name,
-            "room_number": payment.room_number,
-            "building_id": payment.building_id,
-            "amount_due": payment.amount_due,
-            "amount_collected": payment.amount_collected,
-            "payment_method": payment.payment_method,
-            "collected_by": payment.collected_by,
-            "notes": payment.notes,
-            "receipt_image": payment.receipt_image,
-            "status": payment.status,
-            "created_at": display_time,
-            "timestamp": payment.created_at.isoformat() if payment.created_at else None
-        })
+            # Quản lý và chủ sở hữu xem được tất cả
+            payments = db.query(Payment).all()
+        
+        payments_data = []
+        for payment in payments:
+            # Convert datetime to Vietnam timezone for display
+            if payment.created_at:
+                # Assume payment.created_at is already in Vietnam time (from database)
+                display_time = payment.created_at.strftime("%H:%M:%S %d/%m/%Y") 
+            else:
+                display_time = "N/A"
+                
+            payments_data.append({
+                "id": payment.id,
+                "booking_id": payment.booking_id,
+                "guest_name": payment.guest_name,
+                "room_number": payment.room_number,
+                "building_id": payment.building_id,
+                "amount_due": payment.amount_due,
+                "amount_collected": payment.amount_collected,
+                "payment_method": payment.payment_method,
+                "collected_by": payment.collected_by,
+                "notes": payment.notes,
+                "receipt_image": payment.receipt_image,
+                "status": payment.status,
+                "created_at": display_time,
+                "timestamp": payment.created_at.isoformat() if payment.created_at else None
+            })
+        return {"payments": payments_data}
     
-    return {"payments": payments_data}
+    etag, payload = await coalesced_read(
+        "payments", scope, lambda read_db: conditional_get.load_with_etag(
+            read_db, "payments", scope, lambda: load_payments(read_db)), db, versions)
+    return conditional_get.with_etag(response, etag, payload)
 
 @app.get("/api/dashboard")
 async def get_dashboard(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy thông tin dashboard"""
-    
-    # Lấy tất cả payments (theo role)
-    if current_user.role == "assistant":
-        payments = db.query(Payment).filter(Payment.added_by_user_id == current_user.id).all()
-    else:
-        payments = db.query(Payment).all()
-    
-    # Lấy tất cả handovers
-    handovers = db.query(Handover).all()
+    """Lấy thông tin dashboard - đọc bảng tổng hợp theo ngày (ledger_summary) thay vì toàn bộ payments"""
     
-    total_collected = sum(p.amount_collected for p in payments)
-    total_due = sum(p.amount_due for p in payments)
-    collection_rate = (total_collected / total_due * 100) if total_due > 0 else 0
+    scope = role_scope(current_user)
+    versions = conditional_get.endpoint_versions(db, "dashboard")
+    unchanged = conditional_get.not_modified(request, db, "dashboard", scope, versions)
+    if unchanged:
+        return unchanged
     
-    # Tính tiền mặt cần bàn giao
-    cash_payments = sum(p.amount_collected for p in payments if p.payment_method == "cash")
-    cash_handed_over = sum(h.amount for h in handovers if h.status == "completed")
-    cash_pending = cash_payments - cash_handed_over
+    def load_dashboard(db):
+        # Trợ lý chỉ tính khoản thu của mình, bàn giao tính toàn bộ
+        summary = ledger_summary.totals(db, user_id=current_user.id if current_user.role == "assistant" else None)
+        
+        total_collected = summary["amount_collected"]
+        total_due = summary["amount_due"]
+        collection_rate = (total_collected / total_due * 100) if total_due > 0 else 0
+        
+        # Tính tiền mặt cần bàn giao - trợ lý: số dư tiền mặt đang giữ của chính mình
+        cash_payments = summary["cash_collected"]
+        cash_handed_over = summary["handed_over"]
+        cash_pending = cash_payments - cash_handed_over
+        if current_user.role == "assistant":
+            cash_pending = cash_reconciliation.person_balance(db, current_user.full_name)["balance"]
+        
+        return {
+            "total_collected": total_collected,
+            "total_due": total_due,
+            "collection_rate": round(collection_rate, 2),
+            "total_payments": summary["payment_count"],
+            "cash_balance": cash_payments,
+            "cash_pending_handover": cash_pending,
+            "total_handovers": summary["handover_count"],
+            "last_updated": get_vietnam_time().isoformat()
+        }
     
+    etag, payload = await coalesced_read(
+        "dashboard", scope, lambda read_db: conditional_get.load_with_etag(
+            read_db, "dashboard", scope, lambda: load_dashboard(read_db)), db, versions)
+    return conditional_get.with_etag(response, etag, payload)
+
+def report_filters(current_user, building_id, payment_method):
+    """Bộ lọc báo cáo theo vai trò - trợ lý chỉ xem số liệu của mình"""
     return {
-        "total_collected": total_collected,
-        "total_due": total_due,
-        "collection_rate": round(collection_rate, 2),
-        "total_payments": len(payments),
-        "cash_balance": cash_payments,
-        "cash_pending_handover": cash_pending,
-        "total_handovers": len(handovers),
-        "last_updated": get_vietnam_time().isoformat()
+        "user_id": current_user.id if current_user.role == "assistant" else None,
+        "building_id": building_id,
+        "payment_method": payment_method,
     }
 
+@app.get("/api/reports/timeseries")
+async def get_report_timeseries(
+    response: Response,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = "day",
+    building_id: Optional[int] = None,
+    payment_method: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Báo cáo theo ngày / tuần / tháng (từ bảng tổng hợp)"""
+    try:
+        start, end = reports.resolve_range(start, end)
+        filters = report_filters(current_user, building_id, payment_method)
+        report = await coalesced_read(
+            "reports_timeseries", (role_scope(current_user), start, end, bucket, building_id, payment_method),
+            lambda read_db: reports.timeseries(read_db, start, end, bucket, **filters), db,
+            conditional_get.endpoint_versions(db, "reports"))
+    except reports.ReportRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["Cache-Control"] = f"private, max-age={reports.REPORT_CACHE_SECONDS}"
+    return report
+
+@app.get("/api/reports/breakdown")
+async def get_report_breakdown(
+    response: Response,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    by: str = "building",
+    building_id: Optional[int] = None,
+    payment_method: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Báo cáo theo tòa nhà / phương thức thanh toán / người thu"""
+    try:
+        start, end = reports.resolve_range(start, end)
+        filters = report_filters(current_user, building_id, payment_method)
+        report = await coalesced_read(
+            "reports_breakdown", (role_scope(current_user), start, end, by, building_id, payment_method),
+            lambda read_db: reports.breakdown(read_db, start, end, by, **filters), db,
+            conditional_get.endpoint_versions(db, "reports"))
+    except reports.ReportRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["Cache-Control"] = f"private, max-age={reports.REPORT_CACHE_SECONDS}"
+    return report
+
+@app.get("/api/cash/balance")
+async def get_cash_balance(
+    person: Optional[str] = None,
+    building_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Số dư tiền mặt đang giữ của một người (mặc định: người đang đăng nhập)"""
+    own_name = cash_reconciliation.normalize_person(current_user.full_name)
+    person = cash_reconciliation.normalize_person(person) or own_name
+    if current_user.role == "assistant" and person != own_name:
+        raise HTTPException(status_code=403, detail="Trợ lý chỉ xem được số dư của mình")
+    return cash_reconciliation.person_balance(db, person, building_id)
+
+@app.get("/api/cash/balances")
+async def get_cash_balances(
+    building_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Số dư tiền mặt của mọi người thu (quản lý / chủ sở hữu)"""
+    if current_user.role == "assistant":
+        raise HTTPException(status_code=403, detail="Không có quyền xem số dư của người khác")
+    rows = cash_reconciliation.balances(db, building_id)
+    return {"balances": rows, "total": round(sum(row["balance"] for row in rows), 2)}
+
+@app.get("/api/cash/audit")
+async def audit_cash_balances(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Đối chiếu bảng số dư với payments/handovers (chỉ owner, quét toàn bộ dữ liệu gốc)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền đối chiếu số dư")
+    mismatches = await run_in_threadpool(cash_reconciliation.verify, db)
+    if mismatches:
+        logger.warning("Cash balances out of sync", extra={"mismatches": len(mismatches)})
+    return {"ok": not mismatches, "mismatches": mismatches[:100], "mismatch_count": len(mismatches)}
+
 @app.post("/api/handovers")
 async def create_handover(
     request: Request,
@@ -520,38 +797,60 @@ async def create_handover(
 
 @app.get("/api/handovers")
 async def get_handovers(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy danh sách bàn giao"""
-    
-    handovers = db.query(Handover).all()
-    handovers_data = []
-    
-    for handover in handovers:
-        handover_by_user = db.query(User).filter(User.id == handover.handover_by_user_id).first()
-        building = db.query(Building).filter(Building.id == handover.building_id).first()
-        
-        handovers_data.append({
-            "id": handover.id,
-            "building_name": building.name if building else "Unknown",
-            "from_person": handover.from_person,
-            "to_person": handover.to_person,
-            "handover_by": handover_by_user.full_name if handover_by_user else "Unknown",
-            "amount": handover.amount,
-            "notes": handover.notes,
-            "image_path": handover.image_path,
-            "status": handover.status,
-            "created_at": handover.created_at.isoformat(),
-            "timestamp": handover.created_at.isoformat()
-        })
+    """Lấy danh sách bàn giao (304 nếu If-None-Match khớp ETag hiện tại)"""
+    
+    scope = role_scope(current_user)
+    versions = conditional_get.endpoint_versions(db, "handovers")
+    unchanged = conditional_get.not_modified(request, db, "handovers", scope, versions)
+    if unchanged:
+        return unchanged
+    
+    def load_handovers(db):
+        handovers = db.query(Handover).all()
+        handovers_data = []
+    
+        # Lấy user/tòa nhà liên quan bằng 1 query mỗi bảng thay vì 2 query cho mỗi bàn giao
+        user_ids = {h.handover_by_user_id for h in handovers}
+        building_ids = {h.building_id for h in handovers if h.building_id is not None}
+        users_by_id = {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()} if user_ids else {}
+        buildings_by_id = {b.id: b for b in db.query(Building).filter(Building.id.in_(building_ids)).all()} if building_ids else {}
+    
+        for handover in handovers:
+            handover_by_user = users_by_id.get(handover.handover_by_user_id)
+            building = buildings_by_id.get(handover.building_id)
+        
+            handovers_data.append({
+                "id": handover.id,
+                "building_name": building.name if building else "Unknown",
+                "from_person": handover.from_person,
+                "to_person": handover.to_person,
+                "handover_by": handover_by_user.full_name if handover_by_user else "Unknown",
+                "amount": handover.amount,
+                "notes": handover.notes,
+                "image_path": handover.image_path,
+                "status": handover.status,
+                "created_at": handover.created_at.isoformat(),
+                "timestamp": handover.created_at.isoformat()
+            })
+    
+        return {"handovers": handovers_data}
     
-    return {"handovers": handovers_data}
+    etag, payload = await coalesced_read(
+        "handovers", scope, lambda read_db: conditional_get.load_with_etag(
+            read_db, "handovers", scope, lambda: load_handovers(read_db)), db, versions)
+    return conditional_get.with_etag(response, etag, payload)
 
 @app.get("/api/users")
 async def get_users(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách tất cả người dùng (cho dropdown recipient)"""
     
@@ -559,11 +858,12 @@ async def get_users(
     if current_user.role not in ["manager", "owner"]:
         raise HTTPException(status_code=403, detail="Không có quyền truy cập")
     
-    users = get_all_users(db)
-    users_data = []
+    unchanged = conditional_get.not_modified(request, db, "users", current_user.role)
+    if unchanged:
+        return unchanged
     
-    for user in users:
-        users_data.append({
+    def load_users():
+        return [{
             "id": user.id,
             "username": user.username,
             "full_name": user.full_name,
@@ -571,30 +871,39 @@ async def get_users(
             "role_display": get_role_display_name(user.role),
             "phone": user.phone,
             "email": user.email
-        })
+        } for user in get_all_users(db)]
     
-    return {"users": users_data}
+    # Cache giữ (etag, dữ liệu): entry chưa kịp xóa ở worker này vẫn đi kèm ETag cũ của nó
+    etag, users = cache.get_or_load("users", current_user.role, lambda: conditional_get.load_with_etag(
+        db, "users", current_user.role, load_users))
+    return conditional_get.with_etag(response, etag, {"users": users})
 
 @app.get("/api/recipients")
 async def get_recipients(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách người có thể nhận bàn giao"""
     
-    # Lấy tất cả user trừ chính mình
-    users = db.query(User).filter(User.id != current_user.id, User.is_active == True).all()
-    recipients_data = []
+    unchanged = conditional_get.not_modified(request, db, "recipients", current_user.id)
+    if unchanged:
+        return unchanged
     
-    for user in users:
-        recipients_data.append({
+    # Lấy tất cả user trừ chính mình (cache theo từng người - danh sách khác nhau)
+    def load_recipients():
+        users = db.query(User).filter(User.id != current_user.id, User.is_active == True).all()
+        return [{
             "id": user.id,
             "name": user.full_name,
             "role": get_role_display_name(user.role),
             "phone": user.phone or "Chưa có SĐT"
-        })
+        } for user in users]
     
-    return {"recipients": recipients_data}
+    etag, recipients = cache.get_or_load("recipients", current_user.id, lambda: conditional_get.load_with_etag(
+        db, "recipients", current_user.id, load_recipients))
+    return conditional_get.with_etag(response, etag, {"recipients": recipients})
 
 # CRUD Operations for Payments
 @app.put("/api/payments/{payment_id}")
@@ -678,7 +987,7 @@ async def delete_payment(
 async def get_payment_detail(
     payment_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy chi tiết payment để edit"""
     
@@ -778,7 +1087,7 @@ async def delete_handover(
 async def get_handover_detail(
     handover_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy chi tiết handover để edit"""
     
@@ -801,23 +1110,28 @@ async def get_handover_detail(
 # Building Management APIs
 @app.get("/api/buildings")
 async def get_buildings(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lấy danh sách tòa nhà"""
     
-    buildings = db.query(Building).filter(Building.is_active == True).all()
-    buildings_data = []
+    unchanged = conditional_get.not_modified(request, db, "buildings", current_user.role)
+    if unchanged:
+        return unchanged
     
-    for building in buildings:
-        buildings_data.append({
+    def load_buildings():
+        return [{
             "id": building.id,
             "name": building.name,
             "address": building.address,
             "description": building.description
-        })
+        } for building in db.query(Building).filter(Building.is_active == True).all()]
     
-    return {"buildings": buildings_data}
+    etag, buildings = cache.get_or_load("buildings", current_user.role, lambda: conditional_get.load_with_etag(
+        db, "buildings", current_user.role, load_buildings))
+    return conditional_get.with_etag(response, etag, {"buildings": buildings})
 
 @app.post("/api/buildings")
 async def create_building(
@@ -842,6 +1156,7 @@ async def create_building(
     db.add(building)
     db.commit()
     db.refresh(building)
+    invalidation_bus.publish("building")
     
     return {"success": True, "building_id": building.id, "message": "Tạo tòa nhà thành công"}
 
@@ -870,6 +1185,7 @@ async def update_building(
     
     db.commit()
     db.refresh(building)
+    invalidation_bus.publish("building")
     
     return {"success": True, "message": "Cập nhật tòa nhà thành công"}
 
@@ -895,6 +1211,7 @@ async def delete_building(
     
     db.delete(building)
     db.commit()
+    invalidation_bus.publish("building")
     
     return {"success": True, "message": "Xóa tòa nhà thành công"}
 
@@ -940,6 +1257,7 @@ async def create_new_user(
     
     try:
         new_user = create_user(db, username, password, full_name, role, phone, email)
+        invalidation_bus.publish("user")
         return {"success": True, "user": {
             "id": new_user.id,
             "username": new_user.username,
@@ -985,6 +1303,7 @@ async def update_user(
         user.updated_at = get_vietnam_time()
         db.commit()
         db.refresh(user)
+        invalidation_bus.publish("user")
         
         return {"success": True, "user": {
             "id": user.id,
@@ -995,6 +1314,8 @@ async def update_user(
             "phone": user.phone,
             "email": user.email
         }}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
@@ -1021,8 +1342,11 @@ async def delete_user(
         user.is_active = False
         user.updated_at = get_vietnam_time()
         db.commit()
+        invalidation_bus.publish("user")
         
         return {"success": True, "message": f"Đã vô hiệu hóa người dùng {user.username}"}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
@@ -1045,12 +1369,187 @@ async def activate_user(
         user.is_active = True
         user.updated_at = get_vietnam_time()
         db.commit()
+        invalidation_bus.publish("user")
         
         return {"success": True, "message": f"Đã kích hoạt người dùng {user.username}"}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+# Runtime profiler (chỉ owner) - chẩn đoán khi worker chậm / tăng RAM mà không cần redeploy
+@app.get("/api/admin/profile")
+async def sample_profile(
+    seconds: float = 10,
+    interval_ms: float = 10,
+    format: str = "collapsed",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Lấy mẫu stack mọi thread trong N giây - collapsed stacks cho flamegraph/speedscope"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền profile")
+    # Trả connection về pool - không giữ trong suốt thời gian lấy mẫu
+    db.close()
+
+    try:
+        result = await run_in_threadpool(profiler.profiler.sample, seconds, interval_ms / 1000)
+    except profiler.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "json":
+        return {
+            **{key: value for key, value in result.items() if key != "stacks"},
+            "stacks": [{"stack": stack, "count": count} for stack, count in result["stacks"].most_common()],
+        }
+    return PlainTextResponse(profiler.render_collapsed(result["stacks"]), headers={
+        "X-Profile-Samples": str(result["samples"]),
+        "X-Profile-Duration": str(result["duration_seconds"]),
+    })
+
+@app.post("/api/admin/tracemalloc/start")
+async def tracemalloc_start(frames: int = 10, current_user: User = Depends(get_current_user)):
+    """Bật tracemalloc và chụp snapshot làm mốc"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền profile")
+    return profiler.memory_tracker.start(frames)
+
+@app.get("/api/admin/tracemalloc/diff")
+async def tracemalloc_diff(
+    limit: int = 25,
+    group_by: str = "lineno",
+    reset: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Top vị trí code tăng bộ nhớ so với mốc (group_by: lineno / filename / traceback)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền profile")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by không hợp lệ")
+    try:
+        return await run_in_threadpool(profiler.memory_tracker.diff, limit, group_by, reset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/admin/tracemalloc/stop")
+async def tracemalloc_stop(current_user: User = Depends(get_current_user)):
+    """Tắt tracemalloc (tracemalloc làm chậm mọi phép cấp phát khi bật)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền profile")
+    profiler.memory_tracker.stop()
+    return {"success": True, "tracing": False}
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(limit: int = 50, current_user: User = Depends(get_current_user)):
+    """Câu SQL chậm gần nhất kèm route và query plan"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền xem slow query")
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "entries": slow_query_log.recent(limit),
+    }
+
+@app.delete("/api/admin/slow-queries")
+async def clear_slow_queries(current_user: User = Depends(get_current_user)):
+    """Xóa ring buffer slow query (và cache EXPLAIN)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền xem slow query")
+    slow_query_log.clear()
+    return {"success": True}
+
+@app.get("/api/admin/usage")
+async def get_railway_usage(days: int = 30, current_user: User = Depends(get_current_user)):
+    """Giờ active/idle theo ngày từ traffic thật và dự báo giờ dùng trong tháng"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền xem usage")
+    await run_in_threadpool(usage_tracker.flush)
+    return usage_tracker.monitor.usage_report(days)
+
+@app.get("/api/admin/export/parquet")
+async def export_parquet_archive(current_user: User = Depends(get_current_user)):
+    """Tải file zip Parquet (payments/handovers theo tháng + tòa nhà, buildings) cho phân tích offline"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền xuất dữ liệu")
+    if not PARQUET_EXPORT_ENABLED:
+        raise HTTPException(status_code=503, detail="Parquet export not available (cần cài pyarrow)")
+    import analytics_export
+
+    work_dir = tempfile.mkdtemp(prefix="parquet_export_")
+    try:
+        export_dir = os.path.join(work_dir, "export")
+        manifest = await run_in_threadpool(analytics_export.export_parquet, export_dir, verbose=False)
+        zip_path = await run_in_threadpool(analytics_export.zip_directory, export_dir, os.path.join(work_dir, "export.zip"))
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    logger.info("Parquet export", extra={"rows": {name: table["rows"] for name, table in manifest["tables"].items()},
+                                         "seconds": manifest["seconds"]})
+    filename = f"payment_export_{get_vietnam_time().strftime('%Y%m%d_%H%M%S')}.zip"
+    return FileResponse(zip_path, media_type="application/zip", filename=filename,
+                        background=BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True))
+
+@app.post("/api/admin/analytics/query")
+async def run_analytics_query(
+    sql: str = Form(...),
+    max_rows: int = Form(default=None),
+    current_user: User = Depends(get_current_user)
+):
+    """SQL chỉ đọc trên snapshot DuckDB (payments, handovers, buildings) - không chạm database chính"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền chạy truy vấn phân tích")
+    if not ANALYTICS_SQL_ENABLED:
+        raise HTTPException(status_code=503, detail="Analytics not available (cần cài duckdb, pyarrow)")
+    import analytics_sql
+    max_rows = min(max_rows or analytics_sql.ANALYTICS_MAX_ROWS, analytics_sql.ANALYTICS_MAX_ROWS)
+    try:
+        result = await run_in_threadpool(analytics_sql.run_query, sql, analytics_sql.snapshot, max_rows)
+    except analytics_sql.AnalyticsTimeout as e:
+        raise HTTPException(status_code=408, detail=str(e))
+    except analytics_sql.AnalyticsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("Analytics query", extra={"rows": result["row_count"], "seconds": result["seconds"]})
+    return result
+
+@app.post("/api/admin/analytics/refresh")
+async def refresh_analytics_snapshot(current_user: User = Depends(get_current_user)):
+    """Dựng lại snapshot phân tích ngay (mặc định tự dựng lại sau ANALYTICS_SNAPSHOT_MAX_AGE giây)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền làm mới snapshot")
+    if not ANALYTICS_SQL_ENABLED:
+        raise HTTPException(status_code=503, detail="Analytics not available (cần cài duckdb, pyarrow)")
+    import analytics_sql
+    manifest = await run_in_threadpool(analytics_sql.snapshot.refresh)
+    return {"success": True, "tables": manifest["tables"], "seconds": manifest["seconds"]}
+
+@app.get("/api/admin/anomalies")
+async def get_anomaly_findings(
+    kind: Optional[str] = None,
+    building_id: Optional[int] = None,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Khoản thu đáng ngờ từ lần phân tích gần nhất (job hàng ngày lúc ANOMALY_SCHEDULE_TIME)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền xem phát hiện bất thường")
+    import anomaly_detection
+    if kind and kind not in anomaly_detection.KINDS:
+        raise HTTPException(status_code=400, detail=f"kind phải là một trong: {', '.join(anomaly_detection.KINDS)}")
+    return anomaly_detection.latest_findings(db, kind=kind, building_id=building_id, limit=max(1, min(limit, 500)))
+
+@app.post("/api/admin/anomalies/run")
+async def run_anomaly_detection(current_user: User = Depends(get_current_user)):
+    """Chạy phân tích bất thường ngay (thay kết quả lần trước)"""
+    if current_user.role != "owner":
+        raise HTTPException(status_code=403, detail="Chỉ chủ sở hữu mới có quyền chạy phân tích")
+    if not ANOMALY_DETECTION_ENABLED:
+        raise HTTPException(status_code=503, detail="Anomaly detection not available (cần cài numpy)")
+    import anomaly_detection
+    summary = await run_in_threadpool(anomaly_detection.run, verbose=False)
+    logger.info("Anomaly detection", extra=summary)
+    return summary
+
 @app.post("/api/test-login")
 async def test_user_login(
     username: str = Form(...),
@@ -1079,6 +1578,8 @@ async def test_user_login(
                 "message": f"❌ Login thất bại cho {username}",
                 "error": "Tài khoản không tồn tại hoặc mật khẩu sai"
             }
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -1104,6 +1605,8 @@ async def debug_users(db: Session = Depends(get_db)):
                 "created_at": str(user.created_at)
             })
         return {"total_users": len(users), "users": user_list}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
@@ -1130,8 +1633,11 @@ async def debug_create_admin(db: Session = Depends(get_db)):
         
         db.add(admin_user)
         db.commit()
+        invalidation_bus.publish("user")
         
         return {"status": "success", "message": "Admin user created", "username": "admin", "password": "admin123"}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
@@ -1158,8 +1664,11 @@ async def create_admin_simple(db: Session = Depends(get_db)):
         
         db.add(admin_user)
         db.commit()
+        invalidation_bus.publish("user")
         
         return {"status": "success", "message": "Admin user created with hardcoded hash", "username": "admin", "password": "admin123"}
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
@@ -1207,6 +1716,8 @@ async def debug_test_login(
         result["status"] = "success"
         return result
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e), "type": type(e).__name__}
 @app.post("/debug/create-simple-admin")
@@ -1237,6 +1748,7 @@ async def create_simple_admin(db: Session = Depends(get_db)):
         
         db.add(admin_user)
         db.commit()
+        invalidation_bus.publish("user")
         
         return {
             "status": "success", 
@@ -1245,6 +1757,8 @@ async def create_simple_admin(db: Session = Depends(get_db)):
             "password": "123",
             "hash_length": len(password_hash)
         }
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e), "type": type(e).__name__}
@@ -1312,6 +1826,7 @@ async def emergency_create_user(db: Session = Depends(get_db)):
         
         db.add(admin_user)
         db.commit()
+        invalidation_bus.publish("user")
         
         return {
             "status": "success",
@@ -1321,6 +1836,8 @@ async def emergency_create_user(db: Session = Depends(get_db)):
             "note": "Use /emergency/login with admin/emergency2025"
         }
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
@@ -1424,6 +1941,7 @@ async def debug_fix_auth(db: Session = Depends(get_db)):
         db.add(manager_user)
         
         db.commit()
+        invalidation_bus.publish("user")
         print("✅ Users created successfully")
         
         return {
@@ -1437,6 +1955,8 @@ async def debug_fix_auth(db: Session = Depends(get_db)):
             "auth_method": "SHA256"
         }
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         return {"status": "error", "message": str(e)}
@@ -1472,7 +1992,7 @@ async def admin_payments_page(
     db: Session = Depends(get_db)
 ):
     """Trang quản lý ghi nhận thu"""
-    print(f"🔍 admin_payments_page called by user: {current_user.username}")
+    logger.debug("admin_payments_page", extra={"username": current_user.username})
     try:
         return templates.TemplateResponse("admin_payments.html", {
             "request": request, 
@@ -1480,7 +2000,7 @@ async def admin_payments_page(
             "getVietnamTime": get_vietnam_time
         })
     except Exception as e:
-        print(f"❌ Template error in admin_payments: {e}")
+        logger.exception("Template error in admin_payments")
         return JSONResponse({
             "error": f"Template error: {str(e)}",
             "template": "admin_payments.html"
@@ -1493,7 +2013,7 @@ async def admin_handovers_page(
     db: Session = Depends(get_db)
 ):
     """Trang quản lý bàn giao"""
-    print(f"🔍 admin_handovers_page called by user: {current_user.username}")
+    logger.debug("admin_handovers_page", extra={"username": current_user.username})
     try:
         return templates.TemplateResponse("admin_handovers.html", {
             "request": request,
@@ -1501,7 +2021,7 @@ async def admin_handovers_page(
             "getVietnamTime": get_vietnam_time
         })
     except Exception as e:
-        print(f"❌ Template error in admin_handovers: {e}")
+        logger.exception("Template error in admin_handovers")
         return JSONResponse({
             "error": f"Template error: {str(e)}",
             "template": "admin_handovers.html"
@@ -1542,6 +2062,8 @@ async def debug_users(db: Session = Depends(get_db)):
             "users": user_list,
             "database_type": "PostgreSQL" if os.getenv("DATABASE_URL") else "SQLite"
         }
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
@@ -1564,6 +2086,8 @@ async def debug_test_auth(username: str, password: str, db: Session = Depends(ge
         else:
             return {"success": False, "message": "Authentication failed"}
             
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -1631,9 +2155,23 @@ async def create_backup(db: Session = Depends(get_db)):
             }
         })
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def find_existing_payment_keys(db: Session, payments_data):
+    """Các cặp (booking_id, guest_name) đã có trong DB - 1 query cho cả lô import/restore"""
+    booking_ids = sorted({p["booking_id"] for p in payments_data if p.get("booking_id")})
+    existing = set()
+    # Chia lô để không vượt giới hạn số tham số của SQLite
+    for start in range(0, len(booking_ids), 500):
+        rows = db.query(Payment.booking_id, Payment.guest_name).filter(
+            Payment.booking_id.in_(booking_ids[start:start + 500])
+        ).all()
+        existing.update((booking_id, guest_name) for booking_id, guest_name in rows)
+    return existing
+
 # Google Drive Backup APIs
 @app.post("/api/gdrive/backup")
 async def backup_to_google_drive(
@@ -1650,7 +2188,7 @@ async def backup_to_google_drive(
             raise HTTPException(status_code=403, detail="Insufficient permissions")
             
         # Initialize Google Drive backup
-        drive_backup = GoogleDriveBackup()
+        drive_backup = get_google_drive_backup()
         drive_backup.authenticate()
         drive_backup.create_backup_folder()
         
@@ -1750,6 +2288,8 @@ async def backup_to_google_drive(
             
     except HTTPException:
         raise
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Google Drive backup error: {str(e)}")
 
@@ -1765,7 +2305,7 @@ async def list_google_drive_backups(
         if current_user.role not in ["manager", "owner"]:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
             
-        drive_backup = GoogleDriveBackup()
+        drive_backup = get_google_drive_backup()
         drive_backup.authenticate()
         drive_backup.create_backup_folder()
         
@@ -1792,12 +2332,13 @@ async def setup_auto_backup(
             raise HTTPException(status_code=403, detail="Only owners can setup auto backup")
             
         # Test Google Drive connection
-        drive_backup = GoogleDriveBackup()
+        drive_backup = get_google_drive_backup()
         drive_backup.authenticate()
         drive_backup.create_backup_folder()
         
         # Setup backup schedule in background thread
         def start_backup_service():
+            from google_drive_backup import setup_backup_schedule
             setup_backup_schedule()
             import schedule
             import time
@@ -1836,7 +2377,7 @@ async def restore_from_google_drive(
             raise HTTPException(status_code=403, detail="Only owners can restore from backup")
             
         # Initialize Google Drive service
-        drive_backup = GoogleDriveBackup()
+        drive_backup = get_google_drive_backup()
         drive_backup.authenticate()
         
         # Restore from backup
@@ -1857,14 +2398,13 @@ async def restore_from_google_drive(
         
         # Restore payments
         if "payments" in backup_data:
+            existing_payments = find_existing_payment_keys(db, backup_data["payments"])
             for payment_data in backup_data["payments"]:
                 # Check if payment already exists
-                existing = db.query(Payment).filter(
-                    Payment.booking_id == payment_data["booking_id"],
-                    Payment.guest_name == payment_data["guest_name"]
-                ).first()
+                payment_key = (payment_data["booking_id"], payment_data["guest_name"])
                 
-                if not existing:
+                if payment_key not in existing_payments:
+                    existing_payments.add(payment_key)
                     payment = Payment(
                         booking_id=payment_data["booking_id"],
                         guest_name=payment_data["guest_name"],
@@ -1887,15 +2427,17 @@ async def restore_from_google_drive(
         
         # Restore handovers
         if "handovers" in backup_data:
+            from_persons = {h["from_person"] for h in backup_data["handovers"]}
+            existing_handovers = {
+                tuple(row) for row in db.query(Handover.from_person, Handover.to_person, Handover.amount)
+                .filter(Handover.from_person.in_(from_persons)).all()
+            } if from_persons else set()
             for handover_data in backup_data["handovers"]:
                 # Check if handover already exists (by from_person, to_person, amount)
-                existing = db.query(Handover).filter(
-                    Handover.from_person == handover_data["from_person"],
-                    Handover.to_person == handover_data["to_person"],
-                    Handover.amount == handover_data["amount"]
-                ).first()
+                handover_key = (handover_data["from_person"], handover_data["to_person"], handover_data["amount"])
                 
-                if not existing:
+                if handover_key not in existing_handovers:
+                    existing_handovers.add(handover_key)
                     handover = Handover(
                         building_id=handover_data["building_id"],
                         from_person=handover_data["from_person"],
@@ -1916,9 +2458,13 @@ async def restore_from_google_drive(
         
         # Restore buildings (only if they don't exist)
         if "buildings" in backup_data:
+            building_names = {b["name"] for b in backup_data["buildings"]}
+            existing_names = {
+                name for (name,) in db.query(Building.name).filter(Building.name.in_(building_names)).all()
+            } if building_names else set()
             for building_data in backup_data["buildings"]:
-                existing = db.query(Building).filter(Building.name == building_data["name"]).first()
-                if not existing:
+                if building_data["name"] not in existing_names:
+                    existing_names.add(building_data["name"])
                     building = Building(
                         name=building_data["name"],
                         address=building_data.get("address", ""),
@@ -1931,6 +2477,8 @@ async def restore_from_google_drive(
                     restored_counts["buildings"] += 1
         
         db.commit()
+        if restored_counts["buildings"]:
+            invalidation_bus.publish("building")
         
         return {
             "success": True,
@@ -1944,6 +2492,8 @@ async def restore_from_google_drive(
         
     except HTTPException:
         raise
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Restore error: {str(e)}")
@@ -1967,6 +2517,7 @@ async def import_payments_json(
         success_count = 0
         error_count = 0
         errors = []
+        existing_payments = find_existing_payment_keys(db, payments_data)
         
         for i, payment_data in enumerate(payments_data):
             try:
@@ -1980,15 +2531,13 @@ async def import_payments_json(
                     continue
                 
                 # Check if payment already exists
-                existing = db.query(Payment).filter(
-                    Payment.booking_id == payment_data["booking_id"],
-                    Payment.guest_name == payment_data["guest_name"]
-                ).first()
+                payment_key = (payment_data["booking_id"], payment_data["guest_name"])
                 
-                if existing:
+                if payment_key in existing_payments:
                     errors.append(f"Row {i+1}: Payment already exists (Booking: {payment_data['booking_id']})")
                     error_count += 1
                     continue
+                existing_payments.add(payment_key)
                 
                 # Create new payment
                 payment = Payment(
@@ -2028,13 +2577,15 @@ async def import_payments_json(
         
     except HTTPException:
         raise
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Import error: {str(e)}")
 
 @app.post("/api/sample-data/create")
 async def create_sample_data(db: Session = Depends(get_db)):
-    """Tạo sample data cho demo"""
+    """Tạo sample data cho demo (dùng generate_data - insert theo batch)"""
     try:
         # Check if data already exists
         existing_payments = db.query(Payment).count()
@@ -2042,78 +2593,24 @@ async def create_sample_data(db: Session = Depends(get_db)):
         
         if existing_payments > 0 or existing_buildings > 0:
             return {"success": False, "message": "Data đã tồn tại. Sử dụng /api/sample-data/reset để reset."}
+        db.close()
         
-        # Create sample buildings
-        buildings_data = [
-            {"name": "Tòa nhà A - Quận 1", "address": "123 Đường Lê Lợi, Quận 1, TP.HCM", "contact_info": "028.1234.5678"},
-            {"name": "Tòa nhà B - Quận 3", "address": "456 Đường Võ Văn Tần, Quận 3, TP.HCM", "contact_info": "028.9876.5432"},
-            {"name": "Tòa nhà C - Quận 7", "address": "789 Đường Nguyễn Hữu Thọ, Quận 7, TP.HCM", "contact_info": "028.5555.6666"}
-        ]
-        
-        created_buildings = []
-        for building_data in buildings_data:
-            building = Building(
-                name=building_data["name"],
-                address=building_data["address"],
-                contact_info=building_data["contact_info"],
-                created_at=get_vietnam_time()
-            )
-            db.add(building)
-            db.flush()
-            created_buildings.append(building)
-        
-        # Create sample payments
-        import random
-        from datetime import timedelta
-        
-        sample_payments = []
-        guest_names = ["Nguyễn Văn A", "Trần Thị B", "Lê Minh C", "Phạm Thu D", "Hoàng Văn E", "Vũ Thị F"]
-        payment_methods = ["cash", "bank_transfer", "credit_card"]
-        collectors = ["Thu Chi 1", "Thu Chi 2", "Admin"]
-        
-        for i in range(15):
-            building = random.choice(created_buildings)
-            payment = Payment(
-                booking_id=f"BK{str(i+1).zfill(3)}",
-                guest_name=random.choice(guest_names),
-                building_id=building.id,
-                room_number=f"{random.randint(1,5)}{str(random.randint(1,20)).zfill(2)}",
-                amount_collected=random.randint(300, 1500) * 1000,
-                payment_method=random.choice(payment_methods),
-                collected_by=random.choice(collectors),
-                notes=f"Sample payment {i+1}",
-                created_at=get_vietnam_time() - timedelta(days=random.randint(0, 30))
-            )
-            db.add(payment)
-            sample_payments.append(payment)
-        
-        # Create sample handovers
-        for building in created_buildings:
-            handover = Handover(
-                building_id=building.id,
-                handover_date=get_vietnam_time() - timedelta(days=random.randint(1, 7)),
-                room_count=random.randint(3, 8),
-                total_amount=random.randint(2000, 8000) * 1000,
-                recipient="Kế toán",
-                notes=f"Bàn giao tiền mặt {building.name}",
-                created_at=get_vietnam_time() - timedelta(days=random.randint(1, 7))
-            )
-            db.add(handover)
-        
-        db.commit()
+        from generate_data import generate
+        summary = await run_in_threadpool(
+            generate, buildings=3, users=0, payments=15, handovers=3, days=30, verbose=False
+        )
+        # generate() chỉ tăng version: xóa cache worker này ngay và NOTIFY các worker khác
+        invalidation_bus.publish("building")
         
         return {
             "success": True,
             "message": "Sample data created successfully",
-            "summary": {
-                "buildings": len(created_buildings),
-                "payments": len(sample_payments),
-                "handovers": len(created_buildings)
-            }
+            "summary": {key: summary[key] for key in ("buildings", "payments", "handovers")}
         }
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 # Khởi động server - Railway compatibility
@@ -0,0 +1,174 @@
+"""
+Request Metrics - Prometheus format
+Latency histogram theo route, số request theo status, in-flight, số query và thời gian DB mỗi request
+"""
+
+import threading
+import time
+
+import query_stats
+
+# Bucket latency (giây) - request bình thường < 100ms, report/backup có thể vài giây
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bucket số câu SQL mỗi request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Histogram tích lũy kiểu Prometheus (bucket + sum + count)"""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for upper, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{upper}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class MetricsRegistry:
+    """Lưu metrics trong process (single worker trên Railway)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.in_flight = 0
+        self.latency = {}       # (method, route) -> Histogram
+        self.db_time = {}       # (method, route) -> Histogram
+        self.db_queries = {}    # (method, route) -> Histogram
+        self.requests = {}      # (method, route, status) -> count
+        self.counters = {}      # (name, labels) -> count
+        self.collectors = []    # hàm trả về list dòng Prometheus bổ sung
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method, route, status, duration, stats=None):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            if stats is not None:
+                self.db_queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.count)
+                self.db_time.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(stats.total_time)
+
+    def increment(self, name, labels="", amount=1):
+        """Counter đơn giản - labels dạng 'route="/api/x"'"""
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def register_collector(self, collector):
+        """Đăng ký nguồn metrics khác (pool, cache...) - collector() trả về list dòng"""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Xuất toàn bộ metrics theo Prometheus text format 0.0.4"""
+        lines = [
+            "# HELP http_requests_in_flight Requests đang xử lý",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        with self._lock:
+            lines.append(f"http_requests_in_flight {self.in_flight}")
+
+            lines += ["# HELP http_requests_total Tổng số request theo route và status",
+                      "# TYPE http_requests_total counter"]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+            for name, help_text, series in (
+                ("http_request_duration_seconds", "Latency request", self.latency),
+                ("http_request_db_queries", "Số câu SQL mỗi request", self.db_queries),
+                ("http_request_db_seconds", "Thời gian DB mỗi request", self.db_time),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), histogram in sorted(series.items()):
+                    lines += histogram.render(name, f'method="{method}",route="{route}"')
+
+            declared = set()
+            for (name, labels), count in sorted(self.counters.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {name} counter")
+                    declared.add(name)
+                lines.append(f"{name}{{{labels}}} {count}" if labels else f"{name} {count}")
+
+        lines += ["# HELP process_uptime_seconds Thời gian process đã chạy",
+                  "# TYPE process_uptime_seconds gauge",
+                  f"process_uptime_seconds {time.time() - self.started:.0f}"]
+        for collector in self.collectors:
+            try:
+                lines += collector()
+            except Exception as e:
+                lines.append(f"# collector error: {e}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def route_label(scope):
+    """Route template (vd /api/payments/{payment_id}) để tránh label theo từng id"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware ghi latency/status/in-flight và số query DB cho mỗi request HTTP
+
+    Đặt bên ngoài query_stats.QueryStatsMiddleware để đọc được số liệu SQL của request.
+    """
+
+    def __init__(self, app, registry=registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        self.registry.request_started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            route = route_label(scope)
+            # Do QueryStatsMiddleware (bên trong) gắn vào scope
+            stats = query_stats.get_request_stats(scope)
+            self.registry.request_finished(scope["method"], route, status_holder["status"], duration, stats)
+            if stats is not None and stats.repeated_shapes():
+                self.registry.increment("db_n_plus_one_requests_total", f'route="{route}"')
+
+def pool_collector(get_pool_status):
+    """Collector cho connection pool của SQLAlchemy"""
+    def collect():
+        status = get_pool_status()
+        lines = []
+        for key in ("size", "checked_in", "checked_out", "overflow", "capacity"):
+            if key in status:
+                lines += [f"# TYPE db_pool_{key} gauge", f"db_pool_{key} {status[key]}"]
+        return lines
+    return collect
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations
+Quản lý version schema: tạo bảng, thêm index cho database đang chạy
+
+- Version hiện tại lưu trong bảng schema_version
+- PostgreSQL: CREATE INDEX CONCURRENTLY (không khóa ghi bảng payments/handovers)
+- Startup: chỉ 1 query kiểm tra khi schema đã mới nhất
+
+Cách dùng:
+    python migrations.py            # chạy các migration còn thiếu
+    python migrations.py status     # xem version hiện tại
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from database_production import (AnomalyFinding, Base, CashBalance, ChangeVersion, JobRun, LedgerDailySummary,
+                                 VERSIONED_MODELS, engine)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Khóa advisory để nhiều worker khởi động cùng lúc không chạy migration song song
+MIGRATION_LOCK_ID = 802610
+
+def create_index(conn, name, table, columns):
+    """Tạo index nếu chưa có - CONCURRENTLY trên PostgreSQL"""
+    column_list = ", ".join(columns)
+    if conn.dialect.name == "postgresql":
+        # CONCURRENTLY bị lỗi giữa chừng để lại index INVALID -> xóa và tạo lại
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        conn.exec_driver_sql(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_list})")
+    else:
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})")
+
+def create_base_tables(conn):
+    """Tạo các bảng theo models (không ảnh hưởng bảng đã có)"""
+    Base.metadata.create_all(bind=conn)
+
+def create_performance_indexes(conn):
+    """Index cho các truy vấn danh sách / dashboard / xóa tòa nhà / restore"""
+    create_index(conn, "ix_payments_added_by_created", "payments", ["added_by_user_id", "created_at"])
+    create_index(conn, "ix_payments_building_id", "payments", ["building_id"])
+    create_index(conn, "ix_payments_booking_guest", "payments", ["booking_id", "guest_name"])
+    create_index(conn, "ix_handovers_building_created", "handovers", ["building_id", "created_at"])
+    create_index(conn, "ix_handovers_handover_by", "handovers", ["handover_by_user_id"])
+
+def create_ledger_summary(conn):
+    """Bảng tổng hợp theo ngày cho dashboard/báo cáo, backfill từ dữ liệu hiện có"""
+    import ledger_summary
+    LedgerDailySummary.__table__.create(conn, checkfirst=True)
+    create_index(conn, "ix_ledger_summary_user_day", "ledger_daily_summary", ["user_id", "day"])
+    ledger_summary.rebuild(conn)
+
+def create_cash_balances(conn):
+    """Bảng số dư tiền mặt theo người / tòa nhà, backfill từ dữ liệu hiện có"""
+    import cash_reconciliation
+    CashBalance.__table__.create(conn, checkfirst=True)
+    create_index(conn, "ix_cash_balances_building", "cash_balances", ["building_id"])
+    cash_reconciliation.rebuild(conn)
+
+def create_anomaly_findings(conn):
+    """Bảng kết quả phân tích bất thường (job chạy đêm ghi vào)"""
+    AnomalyFinding.__table__.create(conn, checkfirst=True)
+    create_index(conn, "ix_anomaly_findings_kind_score", "anomaly_findings", ["kind", "score"])
+
+def create_change_versions(conn):
+    """Bộ đếm thay đổi theo entity cho invalidation cache giữa các worker"""
+    import invalidation_bus
+    ChangeVersion.__table__.create(conn, checkfirst=True)
+    invalidation_bus.seed_versions(conn)
+
+def seed_ledger_versions(conn):
+    """Bộ đếm thay đổi cho payments / handovers (ETag của danh sách và dashboard)"""
+    import invalidation_bus
+    invalidation_bus.seed_versions(conn, VERSIONED_MODELS.values())
+
+def create_job_runs(conn):
+    """Bảng khóa lần chạy của job định kỳ trong process (một worker chạy mỗi ngày)"""
+    JobRun.__table__.create(conn, checkfirst=True)
+
+# (version, mô tả, hàm migration) - chỉ thêm vào cuối, không sửa migration đã release
+MIGRATIONS = [
+    (1, "Tạo bảng cơ bản", create_base_tables),
+    (2, "Index hiệu năng cho payments và handovers", create_performance_indexes),
+    (3, "Bảng tổng hợp sổ thu theo ngày", create_ledger_summary),
+    (4, "Số dư tiền mặt theo người thu", create_cash_balances),
+    (5, "Bảng phát hiện bất thường", create_anomaly_findings),
+    (6, "Bộ đếm thay đổi cho invalidation cache", create_change_versions),
+    (7, "Bộ đếm thay đổi cho payments và handovers", seed_ledger_versions),
+    (8, "Lần chạy job định kỳ", create_job_runs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(target_engine=None):
+    """Version schema hiện tại (0 nếu chưa từng chạy migration)"""
+    target_engine = target_engine or engine
+    try:
+        with target_engine.connect() as conn:
+            version = conn.execute(text(f"SELECT max(version) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+            return version or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+def _ensure_version_table(conn):
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)"
+    )
+
+def run_migrations(target_engine=None, verbose=True):
+    """Chạy các migration còn thiếu, trả về danh sách version đã áp dụng"""
+    target_engine = target_engine or engine
+
+    # Fast path: schema đã mới nhất -> chỉ 1 query
+    if get_schema_version(target_engine) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    # AUTOCOMMIT: CREATE INDEX CONCURRENTLY không chạy được trong transaction
+    with target_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+        try:
+            _ensure_version_table(conn)
+            current = conn.execute(text(f"SELECT max(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+
+            for version, description, migrate in MIGRATIONS:
+                if version <= current:
+                    continue
+                if verbose:
+                    print(f"🔄 Migration {version}: {description}")
+                migrate(conn)
+                conn.execute(
+                    text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": version, "d": description, "t": datetime.utcnow()}
+                )
+                applied.append(version)
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+
+    if verbose and applied:
+        print(f"✅ Schema version {applied[-1]}")
+    return applied
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        print(f"📋 Schema version: {get_schema_version()} / {LATEST_VERSION}")
+    else:
+        applied = run_migrations()
+        if not applied:
+            print(f"✅ Schema đã ở version mới nhất ({LATEST_VERSION})")
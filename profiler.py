@@ -0,0 +1,149 @@
+"""
+Runtime Profiler - chẩn đoán production không cần redeploy
+- Sampling profiler: đọc sys._current_frames() theo chu kỳ, xuất collapsed stacks
+  (định dạng của flamegraph.pl / speedscope: "frame;frame;frame count")
+- tracemalloc: chụp snapshot làm mốc, so sánh để biết code nào làm tăng bộ nhớ
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL_SECONDS = 0.001
+TRACEMALLOC_FRAMES = 10
+
+# Bỏ cấp phát của chính tracemalloc / importlib - áp dụng cho cả mốc lẫn snapshot so sánh
+TRACEMALLOC_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+)
+
+class ProfilerBusyError(RuntimeError):
+    """Đang có một phiên profile khác chạy"""
+
+def frame_label(frame):
+    code = frame.f_code
+    filename = code.co_filename.rsplit("/", 1)[-1]
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+def collapse_stack(frame, thread_name):
+    """Stack từ ngoài vào trong, phân cách bởi ';' - gốc là tên thread"""
+    frames = []
+    while frame is not None:
+        frames.append(frame_label(frame))
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+class SamplingProfiler:
+    """Sampling profiler trong process - chỉ một phiên tại một thời điểm"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def sample(self, seconds, interval=0.01):
+        """Lấy mẫu stack của mọi thread (trừ thread profiler) trong `seconds` giây
+
+        Hàm chạy blocking - gọi từ threadpool để event loop vẫn phục vụ request
+        (và chính event loop cũng được lấy mẫu).
+        """
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        interval = max(interval, MIN_INTERVAL_SECONDS)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Profiler đang chạy")
+        try:
+            own_id = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        stacks[collapse_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "interval_seconds": interval,
+                "samples": samples,
+                "stacks": stacks,
+            }
+        finally:
+            self._lock.release()
+
+def render_collapsed(stacks):
+    """Collapsed stacks - nhiều mẫu nhất lên trước"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+profiler = SamplingProfiler()
+
+class MemoryTracker:
+    """So sánh tracemalloc snapshot với mốc đã chụp"""
+
+    def __init__(self):
+        self.baseline = None
+        self.started_at = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=TRACEMALLOC_FRAMES):
+        """Bật tracemalloc (tốn thêm CPU/RAM khi bật) và chụp mốc"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = self.snapshot()
+        self.started_at = time.time()
+        return self.status()
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_IGNORED)
+
+    def stop(self):
+        tracemalloc.stop()
+        self.baseline = None
+        self.started_at = None
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if self.tracing else (0, 0)
+        return {
+            "tracing": self.tracing,
+            "started_at": self.started_at,
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+        }
+
+    def diff(self, limit=25, group_by="lineno", reset_baseline=False):
+        """Top vị trí code có bộ nhớ tăng nhiều nhất từ mốc"""
+        if not self.tracing or self.baseline is None:
+            raise RuntimeError("tracemalloc chưa bật")
+        snapshot = self.snapshot()
+        stats = snapshot.compare_to(self.baseline, group_by)
+        result = {
+            **self.status(),
+            "group_by": group_by,
+            "top": [
+                {
+                    "location": str(stat.traceback[0]) if stat.traceback else "?",
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+        if reset_baseline:
+            self.baseline = snapshot
+        return result
+
+memory_tracker = MemoryTracker()
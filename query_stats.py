@@ -0,0 +1,161 @@
+"""
+Per-request SQL Accounting
+Đếm số câu SQL và tổng thời gian DB cho từng request qua SQLAlchemy event hooks,
+phát hiện N+1 (cùng một dạng câu SQL lặp lại nhiều lần trong một request)
+
+- QUERY_DEBUG=1: trả header Server-Timing (db/app) cho mỗi response
+- N_PLUS_ONE_THRESHOLD: số lần lặp của một dạng câu SQL thì bị cảnh báo
+"""
+
+import contextvars
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from slow_queries import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.getenv("QUERY_DEBUG", "").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_current_stats = contextvars.ContextVar("query_stats", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\([^()]*\)", re.IGNORECASE)
+
+def statement_shape(statement):
+    """Chuẩn hóa câu SQL: bỏ khoảng trắng thừa, gộp IN (...) có độ dài khác nhau"""
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", statement).strip())
+
+class QueryStats:
+    """Số liệu SQL của một request"""
+
+    __slots__ = ("count", "total_time", "shapes", "scope")
+
+    def __init__(self, scope=None):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}
+        self.scope = scope
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        return shape
+
+    @property
+    def route(self):
+        """'METHOD /route/template' của request (router gắn route vào scope khi match)"""
+        if self.scope is None:
+            return None
+        route = getattr(self.scope.get("route"), "path", None) or self.scope.get("path")
+        return f"{self.scope.get('method')} {route}"
+
+    def repeated_shapes(self, threshold=None):
+        """Các dạng câu SQL lặp >= threshold lần - dấu hiệu N+1"""
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+    def server_timing(self, app_duration):
+        """Giá trị header Server-Timing"""
+        return (
+            f'db;dur={self.total_time * 1000:.2f};desc="{self.count} queries", '
+            f"app;dur={app_duration * 1000:.2f}"
+        )
+
+def start_request(scope=None):
+    """Bắt đầu đếm cho request hiện tại, trả về (stats, token) để reset sau"""
+    stats = QueryStats(scope)
+    return stats, _current_stats.set(stats)
+
+def end_request(token):
+    _current_stats.reset(token)
+
+def current_stats():
+    """QueryStats của request đang chạy (None nếu ngoài request)"""
+    return _current_stats.get()
+
+def get_request_stats(scope):
+    """QueryStats đã gắn vào ASGI scope bởi QueryStatsMiddleware"""
+    return scope.get("state", {}).get("query_stats")
+
+class QueryStatsMiddleware:
+    """ASGI middleware: đếm SQL mỗi request, cảnh báo N+1, Server-Timing khi QUERY_DEBUG"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = start_request(scope)
+        scope.setdefault("state", {})["query_stats"] = stats
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING_ENABLED:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing(time.perf_counter() - started).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request(token)
+            repeated = stats.repeated_shapes()
+            if repeated:
+                route = getattr(scope.get("route"), "path", scope.get("path"))
+                for shape, count in repeated:
+                    logger.warning("N+1 query pattern", extra={
+                        "method": scope["method"], "route": route, "count": count, "statement": shape[:200]
+                    })
+
+def parse_server_timing(header_value):
+    """Đọc (số query, thời gian DB ms) từ header Server-Timing - dùng trong test"""
+    match = re.search(r'db;dur=([\d.]+);desc="(\d+) queries"', header_value or "")
+    if not match:
+        return None, None
+    return int(match.group(2)), float(match.group(1))
+
+def assert_query_budget(response, max_queries, label=None):
+    """Test helper: response phải dùng tối đa max_queries câu SQL (cần SERVER_TIMING_ENABLED)"""
+    count, _ = parse_server_timing(response.headers.get("server-timing"))
+    label = label or f"{response.request.method} {response.request.url.path}"
+    assert count is not None, f"{label}: thiếu header Server-Timing (bật query_stats.SERVER_TIMING_ENABLED)"
+    assert count <= max_queries, f"{label}: {count} queries > budget {max_queries}"
+    return count
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current_stats.get()
+    shape = stats.record(statement, duration) if stats is not None else None
+    if slow_query_log.is_slow(duration):
+        slow_query_log.record(
+            conn, statement, parameters, duration, shape or statement_shape(statement),
+            executemany=executemany, route=stats.route if stats is not None else None
+        )
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Query lỗi không gọi after_cursor_execute -> bỏ mốc thời gian đã push
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
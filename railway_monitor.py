@@ -2,15 +2,35 @@
 """
 Railway Usage Monitor
 Tracks system usage and provides recommendations for staying within free tier
+
+Usage comes from live request traffic: UsageMiddleware feeds a UsageTracker, which
+counts a container as active from each request until RAILWAY_SLEEP_AFTER_SECONDS of
+silence (when Railway would put it to sleep) and flushes per-day counters to the
+usage file. The file keeps the last USAGE_HISTORY_DAYS days (ring buffer).
 """
 
 import datetime
 import json
 import os
+import threading
+import time
+
+USAGE_FILE = os.getenv("RAILWAY_USAGE_FILE", "railway_usage.json")
+FREE_TIER_HOURS = 500
+# Railway sleeps the service after this much inactivity
+SLEEP_AFTER_SECONDS = float(os.getenv("RAILWAY_SLEEP_AFTER_SECONDS", "600"))
+USAGE_HISTORY_DAYS = int(os.getenv("USAGE_HISTORY_DAYS", "62"))
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "60"))
+
+def empty_day():
+    return {"requests": 0, "active_seconds": 0.0, "awake_seconds": 0.0}
 
 class RailwayMonitor:
-    def __init__(self):
-        self.usage_file = "railway_usage.json"
+    def __init__(self, usage_file=None):
+        self.usage_file = usage_file or USAGE_FILE
+        # UsageTracker.flush chạy từ thread flush định kỳ và từ /api/admin/usage (run_in_threadpool) cùng lúc:
+        # giữ lock suốt read-modify-write + save
+        self._lock = threading.RLock()
         self.load_usage_data()
     
     def load_usage_data(self):
@@ -19,11 +39,13 @@ class RailwayMonitor:
             if os.path.exists(self.usage_file):
                 with open(self.usage_file, 'r') as f:
                     self.usage_data = json.load(f)
+                self.usage_data.setdefault("daily_stats", {})
             else:
                 self.usage_data = {
                     "month_start": datetime.datetime.now().strftime("%Y-%m-01"),
                     "total_hours": 0,
                     "daily_usage": {},
+                    "daily_stats": {},
                     "recommendations": []
                 }
         except Exception:
@@ -31,49 +53,112 @@ class RailwayMonitor:
                 "month_start": datetime.datetime.now().strftime("%Y-%m-01"),
                 "total_hours": 0,
                 "daily_usage": {},
+                "daily_stats": {},
                 "recommendations": []
             }
     
     def save_usage_data(self):
-        """Save usage data to file"""
-        try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(self.usage_data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving usage data: {e}")
+        """Save usage data to file (write + rename so a crash never leaves half a file)"""
+        with self._lock:
+            try:
+                tmp_file = f"{self.usage_file}.tmp"
+                with open(tmp_file, 'w') as f:
+                    json.dump(self.usage_data, f, indent=2)
+                os.replace(tmp_file, self.usage_file)
+            except Exception as e:
+                print(f"Error saving usage data: {e}")
     
     def record_session(self, hours=1):
         """Record a usage session"""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
         
-        if today not in self.usage_data["daily_usage"]:
-            self.usage_data["daily_usage"][today] = 0
-        
-        self.usage_data["daily_usage"][today] += hours
-        self.usage_data["total_hours"] += hours
-        self.save_usage_data()
+        with self._lock:
+            if today not in self.usage_data["daily_usage"]:
+                self.usage_data["daily_usage"][today] = 0
+            
+            self.usage_data["daily_usage"][today] += hours
+            self.usage_data["total_hours"] += hours
+            self.save_usage_data()
+    
+    def record_activity(self, daily_deltas):
+        """Merge measured per-day counters {date: {requests, active_seconds, awake_seconds}}"""
+        with self._lock:
+            stats = self.usage_data["daily_stats"]
+            for date, delta in daily_deltas.items():
+                day = stats.setdefault(date, empty_day())
+                for key, value in delta.items():
+                    day[key] = day.get(key, 0) + value
+                self.usage_data["daily_usage"][date] = round(day["active_seconds"] / 3600, 4)
+
+            # Ring buffer: only keep the most recent days
+            for date in sorted(stats)[:-USAGE_HISTORY_DAYS]:
+                stats.pop(date)
+            for date in sorted(self.usage_data["daily_usage"])[:-USAGE_HISTORY_DAYS]:
+                self.usage_data["daily_usage"].pop(date)
+
+            month_prefix = datetime.datetime.now().strftime("%Y-%m")
+            self.usage_data["month_start"] = f"{month_prefix}-01"
+            self.usage_data["total_hours"] = round(sum(
+                hours for date, hours in self.usage_data["daily_usage"].items() if date.startswith(month_prefix)
+            ), 4)
+            self.save_usage_data()
     
-    def get_monthly_projection(self):
+    def get_monthly_projection(self, now=None):
         """Project monthly usage based on current pattern"""
-        now = datetime.datetime.now()
-        days_in_month = (datetime.datetime(now.year, now.month + 1, 1) - 
-                        datetime.datetime(now.year, now.month, 1)).days
-        current_day = now.day
+        now = now or datetime.datetime.now()
+        next_month = datetime.datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+        days_in_month = (next_month - datetime.datetime(now.year, now.month, 1)).days
+        month_prefix = now.strftime("%Y-%m")
+        month_days = sorted(date for date in self.usage_data["daily_usage"] if date.startswith(month_prefix))
         
-        if current_day > 0:
-            daily_avg = self.usage_data["total_hours"] / current_day
-            projected_monthly = daily_avg * days_in_month
+        # Average over the days since tracking started this month (not since the 1st)
+        first_day = int(month_days[0][-2:]) if month_days else 1
+        tracked_days = now.day - first_day + 1
+        month_hours = sum(self.usage_data["daily_usage"][date] for date in month_days)
+        if tracked_days > 0:
+            daily_avg = month_hours / tracked_days
+            projected_monthly = month_hours + daily_avg * (days_in_month - now.day)
         else:
             projected_monthly = 0
         
         return projected_monthly
     
+    def get_usage_series(self, days=30):
+        """Per-day usage for charts (oldest first)"""
+        series = []
+        for date in sorted(self.usage_data["daily_stats"])[-days:]:
+            day = self.usage_data["daily_stats"][date]
+            active = day["active_seconds"] / 3600
+            awake = day["awake_seconds"] / 3600
+            series.append({
+                "date": date,
+                "requests": day["requests"],
+                "active_hours": round(active, 3),
+                "awake_hours": round(awake, 3),
+                "idle_hours": round(max(awake - active, 0), 3),
+            })
+        return series
+    
+    def usage_report(self, days=30):
+        """Summary used by the owner usage API"""
+        with self._lock:
+            projected = self.get_monthly_projection()
+            return {
+                "month_start": self.usage_data["month_start"],
+                "month_hours": self.usage_data["total_hours"],
+                "projected_monthly_hours": round(projected, 2),
+                "free_tier_hours": FREE_TIER_HOURS,
+                "sleep_after_seconds": SLEEP_AFTER_SECONDS,
+                "days": self.get_usage_series(days),
+                "recommendations": self.get_recommendations(),
+            }
+    
     def get_recommendations(self):
         """Get usage recommendations"""
         projected = self.get_monthly_projection()
         recommendations = []
         
-        if projected > 500:
+        if projected > FREE_TIER_HOURS:
             recommendations.extend([
                 "⚠️  PROJECTED USAGE EXCEEDS 500h FREE LIMIT",
                 "🔧 Enable aggressive auto-sleep",
@@ -124,17 +209,97 @@ class RailwayMonitor:
         for date, hours in recent_days:
             print(f"  {date}: {hours:.1f}h")
 
+class UsageTracker:
+    """Measures active/awake time from request traffic and flushes it to a RailwayMonitor
+
+    - active: from each request until SLEEP_AFTER_SECONDS without traffic
+    - awake: wall time this process has been running
+    Both are attributed to the local day on which they happened.
+    """
+
+    def __init__(self, monitor=None, sleep_after=SLEEP_AFTER_SECONDS, clock=time.time):
+        self.monitor = monitor or RailwayMonitor()
+        self.sleep_after = sleep_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._covered_until = 0.0
+        self._last_tick = clock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _day(self, timestamp):
+        return self._pending.setdefault(
+            datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d"), empty_day()
+        )
+
+    def record_request(self, now=None):
+        """Extend the active window to now + sleep_after"""
+        now = now if now is not None else self.clock()
+        with self._lock:
+            day = self._day(now)
+            day["requests"] += 1
+            window_end = now + self.sleep_after
+            if window_end > self._covered_until:
+                day["active_seconds"] += window_end - max(now, self._covered_until)
+                self._covered_until = window_end
+
+    def tick(self, now=None):
+        """Add wall time since the last tick to awake_seconds"""
+        now = now if now is not None else self.clock()
+        with self._lock:
+            if now > self._last_tick:
+                self._day(now)["awake_seconds"] += now - self._last_tick
+            self._last_tick = now
+
+    def flush(self):
+        """Write pending counters to the usage file"""
+        self.tick()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.monitor.record_activity(pending)
+
+    def start(self, interval=USAGE_FLUSH_SECONDS):
+        """Background thread flushing every interval seconds"""
+        if self._thread is not None:
+            return self._thread
+
+        def worker():
+            while not self._stop.wait(interval):
+                self.flush()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=worker, name="usage-tracker", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        self.flush()
+
+class UsageMiddleware:
+    """ASGI middleware counting HTTP requests for usage accounting (health checks excluded)"""
+
+    IGNORED_PATHS = ("/health",)
+
+    def __init__(self, app, tracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.IGNORED_PATHS):
+            self.tracker.record_request()
+        await self.app(scope, receive, send)
+
 def main():
     monitor = RailwayMonitor()
     
-    # Record current session (estimate 1 hour)
-    monitor.record_session(1.0)
-    
-    # Display status
+    # Usage is recorded by the running app (UsageMiddleware) - this only reports it
     monitor.display_status()
     
-    print(f"\n📝 Usage data saved to: {monitor.usage_file}")
-    print("💡 Run this script daily to track usage")
+    print(f"\n📝 Usage data file: {monitor.usage_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
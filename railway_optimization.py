@@ -5,28 +5,16 @@ Optimizes database connections and resource usage for Railway free tier
 """
 
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.pool import QueuePool
-import logging
 
 def optimize_for_railway():
     """Configure app for optimal Railway free tier usage"""
     
-    # Database connection optimization
+    # Database connection optimization - engine thật được cấu hình trong database_production
+    # (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_STATEMENT_TIMEOUT_MS...)
     DATABASE_URL = os.getenv("DATABASE_URL")
     if DATABASE_URL:
-        # Optimize for Railway
-        engine = create_engine(
-            DATABASE_URL,
-            poolclass=QueuePool,
-            pool_size=2,  # Smaller pool for free tier
-            max_overflow=5,  # Limited overflow
-            pool_pre_ping=True,  # Check connections
-            pool_recycle=300,  # 5 minute recycle
-            pool_timeout=20,
-            echo=False  # Disable SQL logging for performance
-        )
-        print("✅ Database optimized for Railway free tier")
+        from database_production import engine, get_pool_status
+        print(f"✅ Database optimized for Railway free tier: {get_pool_status(engine)}")
         return engine
     
     return None
@@ -38,11 +26,9 @@ def setup_auto_sleep():
     os.environ.setdefault('UVICORN_WORKERS', '1')  # Single worker
     os.environ.setdefault('UVICORN_TIMEOUT_KEEP_ALIVE', '5')  # Quick timeout
     
-    # Logging optimization
-    logging.basicConfig(
-        level=logging.WARNING,  # Reduce logging
-        format='%(levelname)s: %(message)s'
-    )
+    # Logging optimization - JSON qua QueueHandler, ghi log trên thread riêng
+    from log_config import setup_logging
+    setup_logging()
     
     print("✅ Auto-sleep optimizations configured")
 
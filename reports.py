@@ -0,0 +1,149 @@
+"""
+Reports - báo cáo theo thời gian / theo nhóm từ bảng tổng hợp ledger_daily_summary
+Một năm dữ liệu = tối đa 366 dòng theo ngày (timeseries) hoặc vài chục nhóm (breakdown),
+không đọc payments/handovers.
+
+- bucket: day / week (tuần bắt đầu thứ Hai) / month, gom trong Python từ tổng theo ngày
+- breakdown: building / payment_method / collector (người ghi nhận = added_by_user_id)
+- Bàn giao nằm ở phương thức "cash" của người bàn giao (xem ledger_summary.py)
+"""
+
+import os
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from database_production import Building, User, get_vietnam_time
+from ledger_summary import SUM_COLUMNS, as_date, summary_table
+
+REPORT_DEFAULT_DAYS = int(os.getenv("REPORT_DEFAULT_DAYS", "30"))
+REPORT_MAX_DAYS = int(os.getenv("REPORT_MAX_DAYS", "731"))
+# Cache-Control max-age cho response báo cáo (giây)
+REPORT_CACHE_SECONDS = int(os.getenv("REPORT_CACHE_SECONDS", "60"))
+
+BUCKETS = ("day", "week", "month")
+BREAKDOWN_COLUMNS = {
+    "building": summary_table.c.building_id,
+    "payment_method": summary_table.c.payment_method,
+    "collector": summary_table.c.user_id,
+}
+MONEY_COLUMNS = ("amount_due", "amount_collected", "cash_collected", "handed_over")
+
+class ReportRangeError(ValueError):
+    """Khoảng thời gian báo cáo không hợp lệ"""
+
+def resolve_range(start=None, end=None, today=None):
+    """(start, end) đã kiểm tra - mặc định REPORT_DEFAULT_DAYS ngày gần nhất"""
+    today = today or get_vietnam_time().date()
+    end = end or today
+    start = start or end - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ReportRangeError("start phải trước hoặc bằng end")
+    if (end - start).days + 1 > REPORT_MAX_DAYS:
+        raise ReportRangeError(f"Khoảng báo cáo tối đa {REPORT_MAX_DAYS} ngày")
+    return start, end
+
+def bucket_start(day, bucket):
+    """Ngày đầu của kỳ chứa `day`"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def next_period(start, bucket):
+    if bucket == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=7 if bucket == "week" else 1)
+
+def period_label(start, bucket):
+    if bucket == "month":
+        return start.strftime("%Y-%m")
+    if bucket == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    return start.isoformat()
+
+def _sums():
+    return [func.coalesce(func.sum(summary_table.c[column]), 0).label(column) for column in SUM_COLUMNS]
+
+def _filters(start, end, user_id=None, building_id=None, payment_method=None):
+    conditions = [summary_table.c.day >= start, summary_table.c.day <= end]
+    if user_id is not None:
+        conditions.append(summary_table.c.user_id == user_id)
+    if building_id is not None:
+        conditions.append(summary_table.c.building_id == building_id)
+    if payment_method:
+        conditions.append(summary_table.c.payment_method == payment_method)
+    return conditions
+
+def _values(row):
+    values = dict(zip(SUM_COLUMNS, row))
+    for column in MONEY_COLUMNS:
+        values[column] = round(values[column] or 0, 2)
+    return values
+
+def _with_totals(items):
+    totals = dict.fromkeys(SUM_COLUMNS, 0)
+    for item in items:
+        for column in SUM_COLUMNS:
+            totals[column] += item[column]
+    for column in MONEY_COLUMNS:
+        totals[column] = round(totals[column], 2)
+    totals["cash_pending_handover"] = round(totals["cash_collected"] - totals["handed_over"], 2)
+    return totals
+
+def timeseries(db, start, end, bucket="day", **filters):
+    """Tổng theo kỳ trong [start, end] - kỳ không có giao dịch vẫn có mặt với giá trị 0"""
+    if bucket not in BUCKETS:
+        raise ReportRangeError(f"bucket phải là một trong {', '.join(BUCKETS)}")
+    rows = db.execute(
+        select(summary_table.c.day, *_sums())
+        .where(*_filters(start, end, **filters))
+        .group_by(summary_table.c.day)
+    ).all()
+
+    periods = {}
+    day = bucket_start(start, bucket)
+    while day <= end:
+        periods[day] = dict.fromkeys(SUM_COLUMNS, 0)
+        day = next_period(day, bucket)
+    for row in rows:
+        values = _values(row[1:])
+        period = periods[bucket_start(as_date(row[0]), bucket)]
+        for column in SUM_COLUMNS:
+            period[column] += values[column]
+
+    series = [
+        dict(period=period_label(period_start, bucket), start=period_start.isoformat(),
+             **{column: round(value, 2) if column in MONEY_COLUMNS else value for column, value in values.items()})
+        for period_start, values in periods.items()
+    ]
+    return {
+        "bucket": bucket, "start": start.isoformat(), "end": end.isoformat(),
+        "series": series, "totals": _with_totals(series),
+    }
+
+def breakdown(db, start, end, by="building", **filters):
+    """Tổng theo tòa nhà / phương thức / người ghi nhận trong [start, end], sắp theo số tiền đã thu"""
+    column = BREAKDOWN_COLUMNS.get(by)
+    if column is None:
+        raise ReportRangeError(f"by phải là một trong {', '.join(BREAKDOWN_COLUMNS)}")
+    rows = db.execute(
+        select(column, *_sums()).where(*_filters(start, end, **filters)).group_by(column)
+    ).all()
+
+    keys = [row[0] for row in rows]
+    labels = {}
+    if by == "building" and keys:
+        labels = dict(db.execute(select(Building.id, Building.name).where(Building.id.in_(keys))).all())
+        labels.setdefault(0, "Không thuộc tòa nhà")
+    elif by == "collector" and keys:
+        labels = dict(db.execute(select(User.id, User.full_name).where(User.id.in_(keys))).all())
+
+    items = [dict(key=row[0], label=labels.get(row[0], str(row[0])), **_values(row[1:])) for row in rows]
+    items.sort(key=lambda item: (-item["amount_collected"], str(item["key"])))
+    return {
+        "by": by, "start": start.isoformat(), "end": end.isoformat(),
+        "rows": items, "totals": _with_totals(items),
+    }
@@ -0,0 +1,135 @@
+"""
+Slow Query Log
+Câu SQL chạy lâu hơn ngưỡng được log kèm route gọi, dạng tham số (không log giá trị)
+và query plan: PostgreSQL `EXPLAIN (ANALYZE off)`, SQLite `EXPLAIN QUERY PLAN`.
+Giữ N bản ghi gần nhất trong ring buffer để owner xem qua API.
+
+- SLOW_QUERY_MS: ngưỡng (ms), mặc định 200; 0 = tắt
+- SLOW_QUERY_BUFFER_SIZE: số bản ghi giữ trong bộ nhớ
+- SLOW_QUERY_EXPLAIN: 0 để không chạy EXPLAIN
+- SLOW_QUERY_EXPLAIN_TTL: mỗi dạng câu SQL chỉ EXPLAIN lại sau N giây
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() not in ("0", "false", "no")
+SLOW_QUERY_EXPLAIN_TTL = float(os.getenv("SLOW_QUERY_EXPLAIN_TTL", "300"))
+
+# Chỉ EXPLAIN được các câu DML/SELECT, không phải DDL/PRAGMA
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+EXPLAIN_SAVEPOINT = "slow_query_explain"
+
+def parameters_shape(parameters, executemany=False):
+    """Kiểu dữ liệu của tham số (không giữ giá trị - tránh lộ tên khách, số tiền...)"""
+    if executemany:
+        rows = list(parameters or [])
+        return {"executemany": len(rows), "row": parameters_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+def explain(dbapi_connection, dialect_name, statement, parameters):
+    """Query plan dạng list dòng text, dùng cursor DBAPI riêng (không kích hoạt event SQLAlchemy)"""
+    if dialect_name == "postgresql":
+        prefix = "EXPLAIN (ANALYZE off) "
+    elif dialect_name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+    # PostgreSQL: EXPLAIN lỗi sẽ hủy transaction của request -> bọc trong SAVEPOINT
+    # (autocommit thì không có transaction để bảo vệ)
+    savepoint = dialect_name == "postgresql" and not getattr(dbapi_connection, "autocommit", False)
+    cursor = dbapi_connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            raise
+        if savepoint:
+            cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+    finally:
+        cursor.close()
+    if dialect_name == "sqlite":
+        # (id, parent, notused, detail)
+        return [row[3] for row in rows]
+    return [row[0] for row in rows]
+
+class SlowQueryLog:
+    """Ring buffer các câu SQL chậm"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_BUFFER_SIZE,
+                 explain_enabled=SLOW_QUERY_EXPLAIN, explain_ttl=SLOW_QUERY_EXPLAIN_TTL):
+        self.threshold_ms = threshold_ms
+        self.explain_enabled = explain_enabled
+        self.explain_ttl = explain_ttl
+        self.entries = deque(maxlen=size)
+        self._explained = {}    # shape -> (thời điểm EXPLAIN, plan)
+        self._lock = threading.Lock()
+
+    def is_slow(self, duration):
+        return self.threshold_ms > 0 and duration * 1000 >= self.threshold_ms
+
+    def _plan_for(self, conn, shape, statement, parameters, executemany):
+        if not self.explain_enabled or executemany:
+            return None
+        if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+            return None
+        now = time.monotonic()
+        cached = self._explained.get(shape)
+        if cached and now - cached[0] < self.explain_ttl:
+            return cached[1]
+        try:
+            plan = explain(conn.connection.dbapi_connection, conn.dialect.name, statement, parameters)
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+        self._explained[shape] = (now, plan)
+        return plan
+
+    def record(self, conn, statement, parameters, duration, shape, executemany=False, route=None):
+        """Ghi một câu SQL chậm (gọi từ after_cursor_execute)"""
+        plan = self._plan_for(conn, shape, statement, parameters, executemany)
+        entry = {
+            "at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "duration_ms": round(duration * 1000, 2),
+            "route": route,
+            "statement": shape[:2000],
+            "parameters": parameters_shape(parameters, executemany),
+            "plan": plan,
+        }
+        with self._lock:
+            self.entries.append(entry)
+        logger.warning("Slow query", extra={
+            "duration_ms": entry["duration_ms"], "route": route,
+            "statement": entry["statement"][:500], "plan": plan,
+        })
+        return entry
+
+    def recent(self, limit=None):
+        """Bản ghi mới nhất trước"""
+        with self._lock:
+            entries = list(self.entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._explained.clear()
+
+slow_query_log = SlowQueryLog()
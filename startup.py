@@ -0,0 +1,80 @@
+"""
+Startup Helpers - tối ưu cold start cho Railway sleep/wake
+Đo thời gian import/boot, bootstrap database theo version, precompile Jinja templates
+"""
+
+import threading
+import time
+
+class BootTimer:
+    """Ghi lại thời gian từng bước khởi động (giây, tính từ lúc tạo timer)"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._last = self.started
+        self.steps = {}
+        self.background = {}
+
+    def mark(self, step):
+        """Đánh dấu kết thúc một bước, thời gian bước = từ mark trước đến giờ"""
+        now = time.perf_counter()
+        self.steps[step] = round(now - self._last, 4)
+        self._last = now
+
+    def measure(self, step, func, *args, **kwargs):
+        """Chạy func và ghi thời gian vào step"""
+        self._last = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.mark(step)
+        return result
+
+    def report(self):
+        """Tổng hợp breakdown để log / trả về từ health endpoint"""
+        return {
+            "total_seconds": round(sum(self.steps.values()), 4),
+            "steps": dict(self.steps),
+            "background": dict(self.background),
+        }
+
+    def summary_line(self):
+        parts = ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in self.steps.items())
+        return f"⏱️ Boot {self.report()['total_seconds'] * 1000:.0f}ms: {parts}"
+
+def bootstrap_database():
+    """Chạy migration; chỉ seed user khi schema vừa được tạo/nâng version
+
+    Khi schema đã mới nhất, bước này chỉ tốn 1 query (không import init script).
+    """
+    from migrations import run_migrations
+    applied = run_migrations(verbose=False)
+    if applied:
+        from init_railway_users import init_production_users
+        init_production_users()
+    return applied
+
+def precompile_templates(env):
+    """Load toàn bộ template vào cache của Jinja để request đầu tiên không phải compile"""
+    compiled = 0
+    for name in env.list_templates(extensions=["html"]):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            # Template lỗi cú pháp/filter vẫn sẽ báo lỗi khi render, không chặn boot
+            print(f"⚠️ Template {name} không compile được: {e}")
+    return compiled
+
+def precompile_templates_in_background(env, timer=None):
+    """Compile templates trong thread riêng - không làm chậm lúc wake"""
+    def worker():
+        started = time.perf_counter()
+        count = precompile_templates(env)
+        if timer is not None:
+            timer.background["templates_precompiled"] = {
+                "templates": count,
+                "seconds": round(time.perf_counter() - started, 4),
+            }
+
+    thread = threading.Thread(target=worker, name="template-precompile", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,56 @@
+"""
+Test export Parquet: partition theo tháng/tòa nhà, kiểu dữ liệu, số dòng khớp database, endpoint zip
+"""
+
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+pa = pytest.importorskip("pyarrow")
+ds = pytest.importorskip("pyarrow.dataset")
+
+import analytics_export
+import main
+from database_production import Payment, engine
+from generate_data import generate
+
+@pytest.fixture(scope="module")
+def seeded():
+    with TestClient(main.app):
+        generate(buildings=3, users=2, payments=2000, handovers=150, days=90, seed=44, verbose=False)
+
+def test_export_is_partitioned_and_typed(seeded, tmp_path):
+    manifest = analytics_export.export_parquet(str(tmp_path), batch_size=500, verbose=False)
+    with engine.connect() as conn:
+        payment_count, collected = conn.execute(
+            select(func.count(Payment.id), func.sum(Payment.amount_collected))).one()
+    assert manifest["tables"]["payments"]["rows"] == payment_count
+
+    payments = ds.dataset(str(tmp_path / "payments"), format="parquet", partitioning="hive")
+    assert {path.split("/")[-3].split("=")[0] for path in payments.files} == {"month"}
+    schema = payments.schema
+    assert schema.field("amount_collected").type == pa.int64()
+    assert schema.field("created_at").type == pa.timestamp("us")
+    assert pa.types.is_dictionary(schema.field("payment_method").type)
+    assert pa.types.is_dictionary(schema.field("status").type)
+
+    table = payments.to_table(columns=["amount_collected", "month"])
+    assert table.num_rows == payment_count
+    assert abs(pa.compute.sum(table["amount_collected"]).as_py() - collected) <= payment_count
+    assert (tmp_path / "buildings").exists() and (tmp_path / "manifest.json").exists()
+
+def test_export_endpoint_returns_zip(seeded):
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        response = client.get("/api/admin/export/parquet")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        assert "manifest.json" in names
+        assert any(name.startswith("payments/month=") and name.endswith(".parquet") for name in names)
+
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        assert client.get("/api/admin/export/parquet").status_code == 403
@@ -0,0 +1,76 @@
+"""
+Test truy vấn analytics DuckDB: kết quả khớp database, giới hạn dòng, chặn câu lệnh ghi / đọc file, timeout, quyền owner
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("duckdb")
+
+import analytics_sql
+import main
+from database_production import Payment, engine
+from generate_data import generate
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    with TestClient(main.app):
+        generate(buildings=3, users=2, payments=1500, handovers=100, days=90, seed=45, verbose=False)
+    snapshot = analytics_sql.Snapshot(str(tmp_path_factory.mktemp("analytics") / "snapshot.duckdb"))
+    snapshot.refresh()
+    return snapshot
+
+def test_query_matches_database(snapshot):
+    result = analytics_sql.run_query(
+        "SELECT count(*) AS payments, sum(amount_collected) AS collected FROM payments", snapshot)
+    with engine.connect() as conn:
+        count, collected = conn.execute(select(func.count(Payment.id), func.sum(Payment.amount_collected))).one()
+    assert result["columns"] == ["payments", "collected"]
+    assert result["rows"][0][0] == count
+    assert abs(result["rows"][0][1] - collected) <= count
+
+    by_month = analytics_sql.run_query(
+        "WITH m AS (SELECT month, count(*) AS n FROM payments GROUP BY month) SELECT sum(n) FROM m", snapshot)
+    assert by_month["rows"] == [[count]]
+
+def test_rows_are_limited(snapshot):
+    result = analytics_sql.run_query("SELECT id FROM payments", snapshot, max_rows=10)
+    assert result["row_count"] == 10 and result["truncated"] is True
+
+@pytest.mark.parametrize("sql", [
+    "DROP TABLE payments",
+    "SELECT 1; DROP TABLE payments",
+    "/* SELECT */ DELETE FROM payments",
+    "COPY payments TO 'out.csv'",
+    "",
+])
+def test_non_select_is_rejected(snapshot, sql):
+    with pytest.raises(analytics_sql.AnalyticsError):
+        analytics_sql.run_query(sql, snapshot)
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM read_parquet('export/**/*.parquet')",
+])
+def test_external_files_are_blocked(snapshot, sql):
+    with pytest.raises(analytics_sql.AnalyticsError):
+        analytics_sql.run_query(sql, snapshot)
+
+def test_long_query_times_out(snapshot):
+    with pytest.raises(analytics_sql.AnalyticsTimeout):
+        analytics_sql.run_query(
+            "SELECT count(*) FROM range(100000000000) a, payments b WHERE a.range % 7 = b.id", snapshot, timeout=0.2)
+
+def test_endpoint_is_owner_only(snapshot, monkeypatch):
+    monkeypatch.setattr(analytics_sql, "snapshot", snapshot)
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        response = client.post("/api/admin/analytics/query", data={"sql": "SELECT count(*) FROM buildings"})
+        assert response.status_code == 200 and response.json()["row_count"] == 1
+        assert client.post("/api/admin/analytics/query", data={"sql": "DELETE FROM payments"}).status_code == 400
+
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        assert client.post("/api/admin/analytics/query", data={"sql": "SELECT 1"}).status_code == 403
+        assert client.post("/api/admin/analytics/refresh").status_code == 403
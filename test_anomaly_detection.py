@@ -0,0 +1,87 @@
+"""
+Test phát hiện bất thường: thống kê theo nhóm đúng, phát hiện khoản thu được cài sẵn, endpoint chỉ cho owner
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+np = pytest.importorskip("numpy")
+
+import anomaly_detection
+import main
+from database_production import Payment, SessionLocal
+from generate_data import generate
+
+def test_robust_z_matches_per_group_median_and_mad():
+    rng = np.random.default_rng(7)
+    groups = rng.integers(0, 4, 400)
+    values = rng.normal(100, 10, 400)
+    z, median, counts = anomaly_detection.robust_z(groups, values, 4)
+    for group in range(4):
+        members = values[groups == group]
+        expected_median = np.median(members)
+        mad = np.median(np.abs(members - expected_median))
+        assert np.allclose(median[groups == group], expected_median)
+        assert np.allclose(z[groups == group], (members - expected_median) / (anomaly_detection.MAD_SCALE * mad))
+        assert (counts[groups == group] == len(members)).all()
+
+def test_rolling_stats_use_only_previous_values_of_same_group():
+    groups = np.array([0, 1, 0, 0, 1, 0])
+    values = np.array([1.0, 10.0, 3.0, 5.0, 20.0, 7.0])
+    mean, std, count = anomaly_detection.rolling_stats(groups, values, np.arange(6), window=2)
+    assert count.tolist() == [0, 0, 1, 2, 1, 2]
+    assert np.allclose(mean[[2, 3, 4, 5]], [1.0, 2.0, 10.0, 4.0])
+    assert np.allclose(std[[3, 5]], [1.0, 1.0])
+
+def payment(building_id, amount_due, amount_collected, collector="Người thu test", room="T01", method="bank_transfer"):
+    return Payment(
+        building_id=building_id, booking_id=f"AN-{uuid.uuid4().hex[:8]}", guest_name="Khách test",
+        room_number=room, amount_due=amount_due, amount_collected=amount_collected, payment_method=method,
+        collected_by=collector, status="completed", added_by_user_id=1,
+    )
+
+@pytest.fixture(scope="module")
+def planted():
+    with TestClient(main.app):
+        generate(buildings=2, users=4, payments=3000, handovers=50, days=60, seed=46, verbose=False)
+    with SessionLocal() as db:
+        building_id = db.query(Payment.building_id).filter(Payment.booking_id.like("GEN%")).first()[0]
+        room = f"R{uuid.uuid4().hex[:4]}"
+        db.add_all([payment(building_id, 500_000, 500_000, room=room) for _ in range(10)])
+        db.flush()
+        room_outlier = payment(building_id, 5_000_000, 5_000_000, room=room)
+        shortfall = payment(building_id, 1_000_000, 50_000)
+        db.add_all([room_outlier, shortfall])
+        db.add_all([payment(building_id, 600_000, 600_000, collector="Thu ngân tiền mặt", method="cash")
+                    for _ in range(30)])
+        db.commit()
+        planted = {"building_id": building_id, "room_outlier": room_outlier.id, "shortfall": shortfall.id}
+    planted["summary"] = anomaly_detection.run(verbose=False)
+    return planted
+
+def test_planted_anomalies_are_found(planted):
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+
+        def findings(kind):
+            response = client.get("/api/admin/anomalies", params={"kind": kind, "limit": 500})
+            assert response.status_code == 200
+            return response.json()["findings"]
+
+        assert planted["shortfall"] in {row["payment_id"] for row in findings("shortfall")}
+        room_findings = {row["payment_id"]: row for row in findings("room_amount")}
+        assert room_findings[planted["room_outlier"]]["baseline"] == 500_000
+        assert ("Thu ngân tiền mặt", planted["building_id"]) in {
+            (row["collected_by"], row["building_id"]) for row in findings("collector_cash_share")}
+
+        report = client.get("/api/admin/anomalies").json()
+        assert report["counts"] == planted["summary"]["findings"]
+        assert client.get("/api/admin/anomalies", params={"kind": "guest"}).status_code == 400
+
+def test_anomalies_are_owner_only(planted):
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        assert client.get("/api/admin/anomalies").status_code == 403
+        assert client.post("/api/admin/anomalies/run").status_code == 403
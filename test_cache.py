@@ -0,0 +1,109 @@
+"""
+Test cache dữ liệu tham chiếu: LRU + TTL, invalidation theo entity, endpoint dùng cache và xóa khi ghi, metrics
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import query_stats
+from cache import TTLCache, cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_evicts_least_recently_used():
+    lru = TTLCache(max_entries=2, ttl=60)
+    lru.set("buildings", "owner", 1)
+    lru.set("buildings", "manager", 2)
+    assert lru.get("buildings", "owner") == 1  # owner vừa dùng -> manager bị đẩy ra
+    lru.set("users", "owner", 3)
+    assert lru.get("buildings", "manager") is None
+    assert lru.get("buildings", "owner") == 1 and lru.get("users", "owner") == 3
+    assert lru.stats()["buildings"]["evictions"] == 1
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    ttl_cache = TTLCache(max_entries=10, ttl=30, clock=clock)
+    loads = []
+    load = lambda: loads.append(1) or len(loads)
+    assert ttl_cache.get_or_load("buildings", "owner", load) == 1
+    clock.now += 29
+    assert ttl_cache.get_or_load("buildings", "owner", load) == 1
+    clock.now += 2
+    assert ttl_cache.get_or_load("buildings", "owner", load) == 2
+    stats = ttl_cache.stats()["buildings"]
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+def test_invalidate_entity_clears_related_namespaces_and_drops_in_flight_loads():
+    ttl_cache = TTLCache(max_entries=10, ttl=60)
+    ttl_cache.set("users", "owner", ["a"])
+    ttl_cache.set("recipients", 1, ["b"])
+    ttl_cache.set("buildings", "owner", ["c"])
+
+    def load_racing_with_write():
+        ttl_cache.invalidate_entity("user")  # ghi xảy ra trong lúc đang đọc DB
+        return ["stale"]
+
+    assert ttl_cache.invalidate_entity("user") == 2
+    assert ttl_cache.get_or_load("users", "owner", load_racing_with_write) == ["stale"]
+    assert ttl_cache.get("users", "owner") is None  # kết quả cũ không được lưu
+    assert ttl_cache.get("buildings", "owner") == ["c"]
+
+def test_zero_ttl_disables_caching():
+    ttl_cache = TTLCache(max_entries=10, ttl=0)
+    assert ttl_cache.set("buildings", "owner", 1) is False
+    assert ttl_cache.get("buildings", "owner") is None
+
+@pytest.fixture
+def client():
+    query_stats.SERVER_TIMING_ENABLED = True
+    cache.clear()
+    with TestClient(main.app) as test_client:
+        test_client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        yield test_client
+    query_stats.SERVER_TIMING_ENABLED = False
+
+def query_count(response):
+    return query_stats.parse_server_timing(response.headers.get("server-timing"))[0]
+
+def test_buildings_are_served_from_cache_until_written(client):
+    first = client.get("/api/buildings")
+    cached = client.get("/api/buildings")
+    assert cached.json() == first.json()
+    assert query_count(cached) < query_count(first)
+
+    name = f"Tòa cache {uuid.uuid4().hex[:6]}"
+    building_id = client.post("/api/buildings", data={"name": name}).json()["building_id"]
+    assert name in {building["name"] for building in client.get("/api/buildings").json()["buildings"]}
+
+    client.put(f"/api/buildings/{building_id}", data={"name": name + " mới"})
+    assert name + " mới" in {building["name"] for building in client.get("/api/buildings").json()["buildings"]}
+
+    client.delete(f"/api/buildings/{building_id}")
+    assert building_id not in {building["id"] for building in client.get("/api/buildings").json()["buildings"]}
+
+def test_user_changes_invalidate_users_and_recipients(client):
+    client.get("/api/users")
+    client.get("/api/recipients")
+    username = f"cache_{uuid.uuid4().hex[:6]}"
+    user_id = client.post("/api/admin/users", data={
+        "username": username, "password": "secret123", "full_name": "Người cache", "role": "assistant"}).json()["user"]["id"]
+    assert username in {user["username"] for user in client.get("/api/users").json()["users"]}
+    assert user_id in {user["id"] for user in client.get("/api/recipients").json()["recipients"]}
+
+    client.delete(f"/api/admin/users/{user_id}")
+    assert user_id not in {user["id"] for user in client.get("/api/recipients").json()["recipients"]}
+
+def test_hit_rate_is_exported_in_metrics(client):
+    client.get("/api/buildings")
+    client.get("/api/buildings")
+    lines = dict(line.rsplit(" ", 1) for line in client.get("/metrics").text.splitlines() if line.startswith("cache_"))
+    assert int(lines['cache_hits_total{namespace="buildings"}']) >= 1
+    assert 0 < float(lines['cache_hit_ratio{namespace="buildings"}']) <= 1
@@ -0,0 +1,81 @@
+"""
+Test số dư tiền mặt theo người thu: cập nhật khi thêm/sửa/xóa, quyền xem, endpoint đối chiếu
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cash_reconciliation
+import main
+from database_production import engine
+from generate_data import generate
+
+PASSWORDS = {"admin": "admin123", "assistant1": "assistant123"}
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+def login(client, username):
+    client.post("/api/login", data={"username": username, "password": PASSWORDS[username]})
+
+def balance(client, person, **params):
+    return client.get("/api/cash/balance", params=dict(params, person=person)).json()
+
+def add_payment(client, collector, building_id, amount, method="cash"):
+    return client.post("/api/payments", data={
+        "booking_id": f"CR-{uuid.uuid4().hex[:8]}", "guest_name": "Khách đối chiếu", "building_id": str(building_id),
+        "amount_due": str(amount), "amount_collected": str(amount), "payment_method": method, "collected_by": collector,
+    }).json()["payment"]["id"]
+
+def test_balances_follow_payments_and_handovers(client):
+    login(client, "admin")
+    building_id = client.post("/api/buildings", data={"name": "Tòa đối chiếu"}).json()["building_id"]
+    collector = f"Thu ngân {uuid.uuid4().hex[:6]}"
+    receiver = f"Kế toán {uuid.uuid4().hex[:6]}"
+
+    payment_id = add_payment(client, collector, building_id, 1_000_000)
+    add_payment(client, collector, building_id, 700_000, method="bank_transfer")  # không phải tiền mặt
+    assert balance(client, collector)["balance"] == 1_000_000
+
+    handover_id = client.post("/api/handovers", data={
+        "building_id": building_id, "to_person": receiver, "amount": 400_000}).json()["handover"]["id"]
+    # Bàn giao tạo ra mang tên người đăng nhập -> đổi sang người thu
+    client.put(f"/api/handovers/{handover_id}", data={
+        "from_person": collector, "to_person": receiver, "amount": 500_000, "building_id": building_id})
+    assert balance(client, collector)["balance"] == 500_000
+    assert balance(client, receiver, building_id=building_id)["balance"] == 500_000
+
+    client.delete(f"/api/payments/{payment_id}")
+    result = balance(client, collector)
+    assert result["balance"] == -500_000
+    assert result["buildings"][0]["handover_out_count"] == 1
+
+    client.delete(f"/api/handovers/{handover_id}")
+    assert balance(client, receiver)["buildings"] == []
+
+def test_assistant_only_sees_own_balance(client):
+    login(client, "assistant1")
+    assert client.get("/api/cash/balance").json()["person"] == "Trần Thị Trợ Lý"
+    assert client.get("/api/cash/balance", params={"person": "Admin System"}).status_code == 403
+    assert client.get("/api/cash/balances").status_code == 403
+
+def test_audit_detects_drift(client):
+    generate(buildings=2, users=2, payments=300, handovers=40, seed=43, verbose=False)
+    login(client, "admin")
+    assert client.get("/api/cash/audit").json()["ok"] is True
+
+    with engine.begin() as conn:
+        conn.execute(cash_reconciliation.balance_table.update().values(received=0))
+    report = client.get("/api/cash/audit").json()
+    assert report["ok"] is False and report["mismatch_count"] > 0
+
+    with engine.begin() as conn:
+        cash_reconciliation.rebuild(conn)
+    assert client.get("/api/cash/audit").json()["ok"] is True
+
+    login(client, "assistant1")
+    assert client.get("/api/cash/audit").status_code == 403
@@ -0,0 +1,160 @@
+"""
+Test gộp request: request trùng key dùng chung một lần tính, khác key / khác quyền tính riêng, lỗi và hủy
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import conditional_get
+import ledger_summary
+import main
+from coalesce import SingleFlight
+
+def run_concurrently(flight, calls):
+    async def scenario():
+        return await asyncio.gather(*(flight.run(name, key, func) for name, key, func in calls),
+                                    return_exceptions=True)
+    return asyncio.run(scenario())
+
+def slow_counter(delay=0.1):
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return {"value": len(calls)}
+    return compute, calls
+
+def test_identical_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    compute, calls = slow_counter()
+    results = run_concurrently(flight, [("dashboard", ("owner",), compute)] * 10)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats["dashboard"] == {"leaders": 1, "coalesced": 9}
+    assert flight.in_flight() == 0
+
+    # Hết in-flight -> lần sau tính lại (không phải cache)
+    run_concurrently(flight, [("dashboard", ("owner",), compute)])
+    assert len(calls) == 2
+
+def test_different_keys_are_computed_separately():
+    flight = SingleFlight()
+    compute, calls = slow_counter()
+    run_concurrently(flight, [
+        ("dashboard", ("owner",), compute),
+        ("dashboard", ("assistant", 2), compute),
+        ("dashboard", ("assistant", 3), compute),
+        ("payments", ("owner",), compute),
+    ])
+    assert len(calls) == 4
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        time.sleep(0.05)
+        raise ValueError("lỗi tính toán")
+
+    results = run_concurrently(flight, [("reports", "k", failing)] * 3)
+    assert len(attempts) == 1 and all(isinstance(result, ValueError) for result in results)
+    run_concurrently(flight, [("reports", "k", failing)])
+    assert len(attempts) == 2
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+    compute, calls = slow_counter(delay=0.2)
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.run("dashboard", "k", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.run("dashboard", "k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"value": 1}
+    assert len(calls) == 1
+
+@pytest.fixture(scope="module")
+def cookies():
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        owner = dict(client.cookies)
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        return {"owner": owner, "assistant": dict(client.cookies)}
+
+def test_concurrent_dashboard_requests_are_coalesced_per_role(cookies, monkeypatch):
+    calls = []
+    original_totals = ledger_summary.totals
+
+    def slow_totals(db, user_id=None):
+        calls.append(user_id)
+        time.sleep(0.2)
+        return original_totals(db, user_id=user_id)
+
+    monkeypatch.setattr(ledger_summary, "totals", slow_totals)
+    before = main.request_coalescer.stats.get("dashboard", {"coalesced": 0})["coalesced"]
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", cookies=cookies["owner"]) as owner, \
+                httpx.AsyncClient(transport=transport, base_url="http://test", cookies=cookies["assistant"]) as assistant:
+            requests = [owner.get("/api/dashboard") for _ in range(8)]
+            requests += [assistant.get("/api/dashboard") for _ in range(4)]
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200] * 12, responses[0].text
+    assert len(calls) == 2  # một lần cho owner, một lần cho trợ lý
+    assert len({response.text for response in responses[:8]}) == 1
+    assert main.request_coalescer.stats["dashboard"]["coalesced"] - before == 10
+
+    with TestClient(main.app) as client:
+        assert 'request_coalescing_coalesced_total{endpoint="dashboard"}' in client.get("/metrics").text
+
+def test_request_after_own_write_does_not_join_older_computation(cookies, monkeypatch):
+    """A đang tải danh sách; B ghi rồi tải lại -> B không được dùng kết quả A đã đọc trước lần ghi"""
+    original_load = conditional_get.load_with_etag
+    started = threading.Event()
+
+    def slow_load(*args):
+        result = original_load(*args)  # đọc xong dữ liệu rồi mới chậm: kết quả của A không có payment của B
+        started.set()
+        time.sleep(0.3)
+        return result
+
+    monkeypatch.setattr(conditional_get, "load_with_etag", slow_load)
+    before = dict(main.request_coalescer.stats.get("payments", {"leaders": 0, "coalesced": 0}))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", cookies=cookies["owner"]) as a, \
+                httpx.AsyncClient(transport=transport, base_url="http://test", cookies=cookies["owner"]) as b:
+            first = asyncio.ensure_future(a.get("/api/payments"))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            created = await b.post("/api/payments", data={
+                "booking_id": "COALESCE-AFTER-WRITE", "guest_name": "Khách B", "building_id": 1,
+                "amount_due": 100_000, "amount_collected": 100_000,
+                "payment_method": "cash", "collected_by": "Admin System"
+            })
+            assert created.status_code == 200, created.text
+            second = await b.get("/api/payments")
+            return await first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.status_code == second.status_code == 200
+    booking_ids = {payment["booking_id"] for payment in second.json()["payments"]}
+    assert "COALESCE-AFTER-WRITE" in booking_ids
+    assert second.headers["ETag"] != first.headers["ETag"]
+    stats = main.request_coalescer.stats["payments"]
+    assert stats["leaders"] - before["leaders"] == 2
+    assert stats["coalesced"] == before["coalesced"]
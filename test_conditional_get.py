@@ -0,0 +1,113 @@
+"""
+Test conditional GET: ETag theo version bảng, 304 khi khớp, đổi khi ghi, tách theo vai trò / người dùng
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from conditional_get import current_versions, etag_matches, weak_etag
+from database_production import Payment, SessionLocal
+
+PASSWORDS = {"admin": "admin123", "assistant1": "assistant123"}
+
+def login(client, username):
+    response = client.post("/api/login", data={"username": username, "password": PASSWORDS[username]})
+    assert response.status_code == 200
+
+def revalidate(client, path, etag):
+    return client.get(path, headers={"If-None-Match": etag})
+
+def add_payment(client, booking_id):
+    response = client.post("/api/payments", data={
+        "booking_id": booking_id, "guest_name": "Khách ETag", "building_id": 1,
+        "amount_due": 300_000, "amount_collected": 300_000,
+        "payment_method": "cash", "collected_by": "Admin System"
+    })
+    assert response.status_code == 200, response.text
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        login(test_client, "admin")
+        yield test_client
+
+def test_etag_matching():
+    etag = weak_etag("payments", ("owner",), {"payment": 3})
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag.removeprefix("W/"), etag)  # so sánh yếu
+    assert etag_matches(f'W/"khac", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"khac"', etag)
+    assert weak_etag("payments", ("owner",), {"payment": 4}) != etag
+    assert weak_etag("payments", ("assistant", 2), {"payment": 3}) != etag
+    assert weak_etag("dashboard", ("owner",), {"payment": 3}) != etag
+
+def test_unchanged_list_returns_304(client):
+    response = client.get("/api/payments")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    unchanged = revalidate(client, "/api/payments", etag)
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["ETag"] == etag
+
+def test_write_changes_etag(client):
+    etags = {path: client.get(path).headers["ETag"] for path in ("/api/payments", "/api/dashboard", "/api/handovers")}
+    add_payment(client, "ETAG-1")
+
+    for path in ("/api/payments", "/api/dashboard"):
+        response = revalidate(client, path, etags[path])
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etags[path]
+    assert any(p["booking_id"] == "ETAG-1" for p in client.get("/api/payments").json()["payments"])
+    # Bàn giao không phụ thuộc payments
+    assert revalidate(client, "/api/handovers", etags["/api/handovers"]).status_code == 304
+
+def test_reference_writes_change_dependent_lists(client):
+    etags = {path: client.get(path).headers["ETag"] for path in ("/api/buildings", "/api/handovers", "/api/payments")}
+    response = client.post("/api/buildings", data={"name": "Tòa nhà ETag"})
+    assert response.status_code == 200, response.text
+
+    assert revalidate(client, "/api/buildings", etags["/api/buildings"]).status_code == 200
+    assert revalidate(client, "/api/handovers", etags["/api/handovers"]).status_code == 200
+    assert revalidate(client, "/api/payments", etags["/api/payments"]).status_code == 304
+
+def test_etag_is_scoped_by_role_and_user(client):
+    owner_etag = client.get("/api/dashboard").headers["ETag"]
+    login(client, "assistant1")
+    try:
+        response = revalidate(client, "/api/dashboard", owner_etag)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != owner_etag
+        assert revalidate(client, "/api/dashboard", response.headers["ETag"]).status_code == 304
+    finally:
+        login(client, "admin")
+
+def test_versions_bump_only_on_commit():
+    db = SessionLocal()
+    try:
+        before = current_versions(db, ["payment", "handover"])
+        payment = db.query(Payment).first()
+        payment.notes = "không lưu"
+        db.flush()
+        db.rollback()
+        assert current_versions(db, ["payment", "handover"]) == before
+
+        # Ghi hàng loạt không qua flush vẫn tăng version
+        db.query(Payment).filter(Payment.id == payment.id).update({"notes": "cập nhật hàng loạt"})
+        db.commit()
+        after = current_versions(db, ["payment", "handover"])
+        assert after["payment"] > before["payment"]
+    finally:
+        db.close()
+
+def test_debug_user_rewrite_changes_users_etag(client):
+    etag = client.get("/api/users").headers["ETag"]
+    response = client.post("/debug/create-admin")
+    assert response.json()["status"] == "success", response.text
+    login(client, "admin")  # admin được tạo lại
+    assert revalidate(client, "/api/users", etag).status_code == 200
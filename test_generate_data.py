@@ -0,0 +1,76 @@
+"""
+Test generator dữ liệu: phân bố lệch, số dòng, tái lập theo seed, endpoint sample-data
+"""
+
+from collections import Counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, select
+
+import cash_reconciliation
+import ledger_summary
+import main
+from database_production import Base, Building, Handover, Payment, SessionLocal, User
+from generate_data import DataGenerator, generate, zipf_weights
+
+def test_payments_are_skewed_and_reproducible():
+    users = [(1, "Nguyễn Văn An"), (2, "Trần Thị Bình")]
+    rows = list(DataGenerator(seed=7, building_skew=1.2).payments(5000, [1, 2, 3, 4, 5], users))
+    again = list(DataGenerator(seed=7, building_skew=1.2).payments(5000, [1, 2, 3, 4, 5], users))
+    assert [row["guest_name"] for row in rows[:50]] == [row["guest_name"] for row in again[:50]]
+
+    per_building = Counter(row["building_id"] for row in rows)
+    assert per_building[1] > per_building[2] > per_building[5]
+    assert all(row["amount_due"] % 10_000 == 0 for row in rows)
+    assert all(row["amount_collected"] <= row["amount_due"] for row in rows)
+    assert Counter(row["payment_method"] for row in rows).most_common(1)[0][0] == "cash"
+
+def test_zipf_zero_skew_is_uniform():
+    assert zipf_weights(3, 0) == [1, 1, 1]
+
+def test_generate_bulk_inserts_into_empty_database():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    summary = generate(engine, buildings=4, users=6, payments=2500, handovers=300, batch_size=1000,
+                       seed=1, verbose=False)
+    assert summary["payments"] == 2500
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count(Payment.id))).scalar() == 2500
+        assert conn.execute(select(func.count(Handover.id))).scalar() == 300
+        assert conn.execute(select(func.count(Building.id))).scalar() == 4
+        assert conn.execute(select(func.count(User.id))).scalar() == 6
+        # Chạy thêm lần nữa không trùng booking_id
+        generate(engine, buildings=0, users=0, payments=100, handovers=0, seed=1, verbose=False)
+        assert conn.execute(select(func.count(func.distinct(Payment.booking_id)))).scalar() == 2600
+
+def clear_ledger_data():
+    """Endpoint sample-data chỉ chạy khi chưa có tòa nhà / khoản thu"""
+    db = SessionLocal()
+    try:
+        for model in (Payment, Handover, Building):
+            db.query(model).delete()
+        db.commit()
+    finally:
+        db.close()
+
+def test_sample_data_is_visible_immediately():
+    with TestClient(main.app) as client:
+        main.invalidation_bus.stop()  # không chờ thread poll: cache phải được xóa ngay khi tạo
+        clear_ledger_data()
+        main.cache.clear()
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        assert client.get("/api/buildings").json()["buildings"] == []
+
+        response = client.post("/api/sample-data/create")
+        assert response.status_code == 200
+        assert response.json()["success"], response.text
+        assert len(client.get("/api/buildings").json()["buildings"]) == 3
+
+    summary = response.json()["summary"]
+    assert summary == {"buildings": 3, "payments": 15, "handovers": 3}
+    with main.engine.connect() as conn:
+        for key, model in (("buildings", Building), ("payments", Payment), ("handovers", Handover)):
+            assert conn.execute(select(func.count(model.id))).scalar() == summary[key]
+        # Insert theo batch vẫn giữ bảng tổng hợp sổ thu và số dư tiền mặt khớp dữ liệu gốc
+        assert ledger_summary.verify(conn) == []
+        assert cash_reconciliation.verify(conn) == []
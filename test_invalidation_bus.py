@@ -0,0 +1,93 @@
+"""
+Test invalidation cache giữa các worker: hai bus dùng chung database, mỗi bus một cache riêng
+"""
+
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from cache import TTLCache
+from database_production import Building, SessionLocal, engine
+from invalidation_bus import InvalidationBus
+
+@pytest.fixture(scope="module", autouse=True)
+def migrated():
+    with TestClient(main.app):
+        pass
+
+def make_worker(name, **kwargs):
+    worker = InvalidationBus(TTLCache(max_entries=100, ttl=300), engine, node_id=name, **kwargs)
+    worker.sync()
+    return worker
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_write_on_one_worker_evicts_cache_on_the_other():
+    worker_a, worker_b = make_worker("a", use_notify=False), make_worker("b", use_notify=False)
+    worker_a.cache.set("buildings", "owner", ["cũ"])
+    worker_b.cache.set("buildings", "owner", ["cũ"])
+    worker_b.cache.set("users", "owner", ["giữ nguyên"])
+
+    version = worker_a.publish("building")
+    assert worker_a.cache.get("buildings", "owner") is None
+    assert worker_b.cache.get("buildings", "owner") == ["cũ"]  # chưa nhận sự kiện
+
+    assert worker_b.poll_once() == ["building"]
+    assert worker_b.cache.get("buildings", "owner") is None
+    assert worker_b.cache.get("users", "owner") == ["giữ nguyên"]
+    assert worker_b.poll_once() == []  # cùng version không xóa lần nữa
+    assert worker_a.poll_once() == []  # sự kiện của chính mình
+    assert worker_b.publish("building") == version + 1
+
+def test_background_polling_picks_up_remote_writes():
+    worker_a = make_worker("a", use_notify=False)
+    worker_b = make_worker("b", poll_interval=0.05, use_notify=False)
+    worker_b.start()
+    try:
+        worker_b.cache.set("recipients", 1, ["cũ"])
+        worker_a.publish("user")
+        assert wait_for(lambda: worker_b.cache.get("recipients", 1) is None)
+        assert worker_b.stats["received"] >= 1
+    finally:
+        worker_b.stop()
+
+def test_app_cache_is_invalidated_by_another_worker():
+    other_worker = make_worker("other", use_notify=False)
+    with TestClient(main.app) as client:
+        main.invalidation_bus.stop()  # poll bằng tay để kiểm soát thời điểm nhận sự kiện
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        client.get("/api/buildings")  # cache của worker này
+
+        name = f"Tòa worker khác {uuid.uuid4().hex[:6]}"
+        with SessionLocal() as db:
+            db.add(Building(name=name, is_active=True))
+            db.commit()
+        other_worker.publish("building")
+        assert name not in {building["name"] for building in client.get("/api/buildings").json()["buildings"]}
+
+        main.invalidation_bus.poll_once()
+        assert name in {building["name"] for building in client.get("/api/buildings").json()["buildings"]}
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="LISTEN/NOTIFY cần PostgreSQL (TEST_DATABASE_URL)")
+def test_notify_reaches_listener_without_polling():
+    worker_a = make_worker("a")
+    worker_b = make_worker("b", poll_interval=0.2)
+    worker_b.start()
+    try:
+        assert wait_for(lambda: any(thread.name == "invalidation-bus" for thread in threading.enumerate()))
+        time.sleep(0.3)  # listener đã LISTEN
+        worker_b.cache.set("buildings", "owner", ["cũ"])
+        worker_a.publish("building")
+        assert wait_for(lambda: worker_b.cache.get("buildings", "owner") is None, timeout=2)
+    finally:
+        worker_b.stop()
@@ -0,0 +1,115 @@
+"""
+Test job định kỳ trong process: đến hạn theo giờ, nhiều worker chỉ một worker chạy, chạy bù sau khi ngủ
+"""
+
+import threading
+import uuid
+from datetime import datetime, time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from database_production import engine
+from job_scheduler import DailyJob, due_at
+
+@pytest.fixture(scope="module", autouse=True)
+def migrated():
+    with TestClient(main.app):
+        pass
+
+def make_workers(count, at="02:30", func=None):
+    name = f"test_job_{uuid.uuid4().hex[:8]}"
+    calls = []
+    func = func or (lambda: calls.append(threading.get_ident()))
+    return [DailyJob(name, at, func, engine) for _ in range(count)], calls
+
+def test_due_at():
+    at = time(2, 30)
+    assert due_at(at, datetime(2026, 3, 10, 2, 30)) == datetime(2026, 3, 10, 2, 30)
+    assert due_at(at, datetime(2026, 3, 10, 23, 0)) == datetime(2026, 3, 10, 2, 30)
+    assert due_at(at, datetime(2026, 3, 10, 1, 0)) == datetime(2026, 3, 9, 2, 30)
+
+def test_only_one_worker_runs_each_day():
+    workers, calls = make_workers(3)
+    now = datetime(2026, 3, 10, 2, 31)
+    assert [worker.run_if_due(now) for worker in workers] == [True, False, False]
+    assert len(calls) == 1
+
+    # Cùng ngày, worker khởi động lại -> không chạy lại
+    assert not DailyJob(workers[0].name, "02:30", calls.append, engine).run_if_due(datetime(2026, 3, 10, 9, 0))
+    assert len(calls) == 1
+
+    # Ngày hôm sau
+    assert workers[1].run_if_due(datetime(2026, 3, 11, 2, 30))
+    assert len(calls) == 2
+
+def test_concurrent_workers_first_run():
+    workers, calls = make_workers(4)
+    now = datetime(2026, 3, 10, 3, 0)
+    barrier = threading.Barrier(len(workers))
+
+    def check(worker):
+        barrier.wait()
+        worker.run_if_due(now)
+
+    threads = [threading.Thread(target=check, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+def test_catches_up_after_sleeping_through_schedule():
+    (worker,), calls = make_workers(1)
+    assert worker.run_if_due(datetime(2026, 3, 10, 2, 30))
+    # Container ngủ từ 23h đến 10h sáng hôm sau: chạy ngay khi thức dậy
+    assert worker.run_if_due(datetime(2026, 3, 11, 10, 0))
+    assert len(calls) == 2
+
+def test_checks_between_due_times_run_no_sql():
+    (worker,), calls = make_workers(1)
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        assert worker.run_if_due(datetime(2026, 3, 10, 2, 31))
+        first_run = len(statements)
+        for hour, minute in ((2, 32), (9, 0), (23, 59)):
+            assert not worker.run_if_due(datetime(2026, 3, 10, hour, minute))
+        assert len(statements) == first_run
+
+        # Worker khởi động lại: một query đọc started_at, sau đó cùng ngày không query nữa
+        restarted = DailyJob(worker.name, "02:30", calls.append, engine)
+        assert restarted.load_last_run() == datetime(2026, 3, 10, 2, 31)
+        assert len(statements) == first_run + 1
+        assert not restarted.run_if_due(datetime(2026, 3, 10, 12, 0))
+        assert len(statements) == first_run + 1
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(calls) == 1
+
+    assert restarted.run_if_due(datetime(2026, 3, 11, 2, 30))
+
+def test_failed_job_is_counted_and_not_retried_same_day():
+    def failing():
+        raise ValueError("lỗi job")
+
+    (worker,), _ = make_workers(1, func=failing)
+    assert worker.run_if_due(datetime(2026, 3, 10, 2, 45))
+    assert not worker.run_if_due(datetime(2026, 3, 10, 2, 46))
+    assert worker.stats == {"runs": 0, "errors": 1}
+    assert 'scheduled_job_errors_total{job="%s"} 1' % worker.name in worker.collector()
+
+def test_anomaly_job_disabled_by_empty_schedule():
+    assert main.ANOMALY_SCHEDULE_TIME == "" and main.anomaly_job is None
+
+@pytest.mark.skipif(not main.ANOMALY_DETECTION_ENABLED, reason="Cần numpy")
+def test_scheduled_anomaly_detection_runs():
+    (worker,), _ = make_workers(1, at="00:00", func=main.run_scheduled_anomaly_detection)
+    assert worker.run_if_due()
+    assert worker.stats == {"runs": 1, "errors": 0}
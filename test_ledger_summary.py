@@ -0,0 +1,83 @@
+"""
+Test bảng tổng hợp ledger_daily_summary: cập nhật cùng transaction khi thêm/sửa/xóa,
+rebuild sau thao tác hàng loạt, verify phát hiện lệch, dashboard đọc từ bảng tổng hợp
+"""
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+import ledger_summary
+import main
+from database_production import Handover, Payment, SessionLocal, engine
+from generate_data import generate
+
+def assert_in_sync():
+    with engine.connect() as conn:
+        assert ledger_summary.verify(conn) == []
+
+def payment_form(**overrides):
+    form = {
+        "booking_id": "LS-1", "guest_name": "Khách tổng hợp", "room_number": "201", "building_id": "",
+        "amount_due": "2000000", "amount_collected": "1500000", "payment_method": "cash", "collected_by": "Lan",
+    }
+    form.update(overrides)
+    return form
+
+def test_crud_keeps_summary_in_sync():
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        first, second = (client.post("/api/buildings", data={"name": name}).json()["building_id"]
+                         for name in ("Tòa tổng hợp A", "Tòa tổng hợp B"))
+        payment_id = client.post("/api/payments", data=payment_form(building_id=str(first))).json()["payment"]["id"]
+        assert_in_sync()
+
+        # Đổi phương thức + tòa nhà -> chuyển sang key khác
+        response = client.put(f"/api/payments/{payment_id}", data=payment_form(
+            building_id=str(second), payment_method="bank_transfer", amount_collected="2000000"))
+        assert response.status_code == 200
+        assert_in_sync()
+
+        handover_id = client.post("/api/handovers", data={
+            "building_id": first, "to_person": "Kế toán", "amount": 300_000}).json()["handover"]["id"]
+        client.put(f"/api/handovers/{handover_id}", data={
+            "from_person": "Admin", "to_person": "Kế toán", "amount": 350_000, "building_id": second})
+        assert_in_sync()
+
+        client.delete(f"/api/handovers/{handover_id}")
+        client.delete(f"/api/payments/{payment_id}")
+        assert_in_sync()
+
+def test_dashboard_matches_source_tables():
+    generate(buildings=2, users=2, payments=500, handovers=50, seed=41, verbose=False)
+    assert_in_sync()
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        dashboard = client.get("/api/dashboard").json()
+
+    with engine.connect() as conn:
+        payment_count, collected = conn.execute(
+            select(func.count(Payment.id), func.sum(Payment.amount_collected))).one()
+        handover_count = conn.execute(select(func.count(Handover.id))).scalar()
+    assert dashboard["total_payments"] == payment_count
+    assert dashboard["total_handovers"] == handover_count
+    assert abs(dashboard["total_collected"] - collected) < 0.01
+
+def test_bulk_delete_rebuilds_before_commit():
+    generate(buildings=1, users=1, payments=50, handovers=5, seed=42, verbose=False)
+    db = SessionLocal()
+    try:
+        db.query(Handover).filter(Handover.amount > 0).delete()
+        db.commit()
+    finally:
+        db.close()
+    assert_in_sync()
+
+def test_verify_detects_drift_and_rebuild_fixes_it():
+    generate(buildings=1, users=1, payments=20, handovers=0, seed=43, verbose=False)
+    with engine.begin() as conn:
+        conn.execute(ledger_summary.summary_table.update().values(amount_collected=0))
+    with engine.connect() as conn:
+        assert ledger_summary.verify(conn)
+    with engine.begin() as conn:
+        ledger_summary.rebuild(conn)
+    assert_in_sync()
@@ -0,0 +1,29 @@
+"""
+Test load test suite: percentile, so sánh baseline, chạy thử in-process quy mô nhỏ
+"""
+
+import asyncio
+
+import load_test
+
+def test_percentile_nearest_rank():
+    values = sorted(range(1, 101))
+    assert load_test.percentile(values, 50) == 50
+    assert load_test.percentile(values, 95) == 95
+    assert load_test.percentile(values, 99) == 99
+    assert load_test.percentile([], 95) == 0.0
+
+def test_compare_with_baseline_flags_slow_p95_and_errors():
+    baseline = {"1000/dashboard/c8": {"p95_ms": 100.0, "error_rate": 0.0}}
+    assert load_test.compare_with_baseline({"1000/dashboard/c8": {"p95_ms": 115.0, "error_rate": 0.0}}, baseline, 0.2) == []
+    regressions = load_test.compare_with_baseline(
+        {"1000/dashboard/c8": {"p95_ms": 130.0, "error_rate": 0.01}}, baseline, 0.2
+    )
+    assert len(regressions) == 2
+
+def test_inprocess_suite_runs_every_flow():
+    results = asyncio.run(load_test.run_suite("inprocess", [50], [2], 4, list(load_test.FLOWS)))
+    assert set(results) == {f"50/{name}/c2" for name in load_test.FLOWS}
+    for result in results.values():
+        assert result["requests"] == 4
+        assert result["error_rate"] == 0.0
@@ -0,0 +1,84 @@
+"""
+Test structured logging: JSON format, request_id, sampling DEBUG, queue không block
+"""
+
+import io
+import json
+import logging
+import queue
+import sys
+
+from fastapi.testclient import TestClient
+
+import log_config
+import main
+
+def make_record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record(username="admin", request_id="abc")
+    entry = json.loads(log_config.JsonFormatter().format(record))
+    assert entry["msg"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "abc"
+    assert entry["username"] == "admin"
+
+def test_debug_sampling_keeps_info_and_drops_debug():
+    sampler = log_config.DebugSamplingFilter(rate=0.0)
+    assert sampler.filter(make_record(level=logging.INFO))
+    assert not sampler.filter(make_record(level=logging.DEBUG))
+    assert sampler.filter(make_record(level=logging.DEBUG, sample_rate=1.0))
+
+def test_queue_handler_drops_when_full():
+    handler = log_config.NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.dropped == 1
+
+def test_queue_handler_renders_exception_before_enqueue():
+    handler = log_config.NonBlockingQueueHandler(queue.Queue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    entry = json.loads(log_config.JsonFormatter().format(queued))
+    assert "ValueError: boom" in entry["exc"]
+
+def test_parse_module_levels():
+    assert log_config.parse_module_levels("query_stats=warning, auth_service_simple=DEBUG") == {
+        "query_stats": "WARNING", "auth_service_simple": "DEBUG"
+    }
+
+def test_request_id_is_echoed_and_attached_to_logs():
+    captured = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            captured.append(record)
+
+    handler = Capture()
+    handler.addFilter(log_config.RequestIdFilter())
+    main.logger.addHandler(handler)
+    try:
+        with TestClient(main.app) as client:
+            response = client.post("/api/login", data={"username": "admin", "password": "admin123"},
+                                   headers={"X-Request-ID": "req-123"})
+            assert response.headers["x-request-id"] == "req-123"
+            assert client.get("/health").headers["x-request-id"]
+    finally:
+        main.logger.removeHandler(handler)
+
+    login_records = [r for r in captured if r.getMessage() == "Login successful"]
+    assert login_records and login_records[0].request_id == "req-123"
+
+def test_text_format_output():
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(log_config.TextFormatter())
+    output.handle(make_record())
+    assert "hello world" in stream.getvalue()
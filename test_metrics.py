@@ -0,0 +1,90 @@
+"""
+Test request metrics: label theo route template, status, histogram latency / số query, /health/detailed
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+
+def metric_lines(client):
+    """{tên metric + labels: giá trị} từ /metrics"""
+    return dict(
+        line.rsplit(" ", 1) for line in client.get("/metrics").text.splitlines()
+        if line and not line.startswith("#")
+    )
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        test_client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        yield test_client
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    lines = histogram.render("latency", 'route="/x"')
+    assert lines == [
+        'latency_bucket{route="/x",le="0.1"} 1',
+        'latency_bucket{route="/x",le="1.0"} 3',
+        'latency_bucket{route="/x",le="+Inf"} 4',
+        'latency_sum{route="/x"} 4.250000',
+        'latency_count{route="/x"} 4',
+    ]
+
+def test_requests_are_labelled_by_route_template_and_status(client):
+    response = client.post("/api/payments", data={
+        "booking_id": "METRICS-1", "guest_name": "Khách metrics", "building_id": 1,
+        "amount_due": 100_000, "amount_collected": 100_000,
+        "payment_method": "cash", "collected_by": "Admin System"
+    })
+    assert response.status_code == 200, response.text
+    payment_id = next(p["id"] for p in client.get("/api/payments").json()["payments"] if p["booking_id"] == "METRICS-1")
+    before = metric_lines(client)
+    client.get(f"/api/payments/{payment_id}")
+    client.get("/api/payments/999999")
+    client.get("/khong-ton-tai")
+    after = metric_lines(client)
+
+    def delta(key):
+        return int(after.get(key, 0)) - int(before.get(key, 0))
+
+    route = 'method="GET",route="/api/payments/{payment_id}"'
+    assert delta(f'http_requests_total{{{route},status="200"}}') == 1
+    assert delta(f'http_requests_total{{{route},status="404"}}') == 1
+    assert delta('http_requests_total{method="GET",route="unmatched",status="404"}') == 1
+    # Không có label theo từng id
+    assert not [key for key in after if f"/api/payments/{payment_id}" in key]
+
+    assert delta(f"http_request_duration_seconds_count{{{route}}}") == 2
+    assert int(after[f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}']) == \
+        int(after[f"http_request_duration_seconds_count{{{route}}}"])
+    assert float(after[f"http_request_duration_seconds_sum{{{route}}}"]) > 0
+    assert delta(f"http_request_db_queries_count{{{route}}}") == 2
+    assert after["http_requests_in_flight"] == "1"  # chính request /metrics
+
+def test_detailed_health_reports_database_pool_and_uploads(client):
+    response = client.get("/health/detailed")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "healthy"
+    assert body["database"]["status"] == "connected"
+    assert body["database"]["dialect"] == main.engine.dialect.name
+    assert body["database"]["round_trip_ms"] >= 0
+    assert body["pool"]["pool_class"] == type(main.engine.pool).__name__
+    assert set(body["uploads"]) == {"files", "bytes", "disk_free_bytes", "disk_used_percent"}
+    assert body["in_flight_requests"] == 1
+
+def test_detailed_health_is_503_when_database_fails(client, monkeypatch):
+    def broken_connect():
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(main.engine, "connect", broken_connect)
+    response = client.get("/health/detailed")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unhealthy"
+    assert response.json()["database"] == {
+        "dialect": main.engine.dialect.name, "status": "error", "error": "database down",
+    }
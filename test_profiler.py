@@ -0,0 +1,84 @@
+"""
+Test runtime profiler: collapsed stacks, tracemalloc diff, quyền owner
+"""
+
+import threading
+import time
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import profiler
+
+def busy_worker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_sampling_profiler_collects_stacks_of_other_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_worker, args=(stop,), name="busy-worker")
+    worker.start()
+    try:
+        result = profiler.SamplingProfiler().sample(0.2, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert result["samples"] > 5
+    worker_stacks = [stack for stack in result["stacks"] if stack.startswith("busy-worker;")]
+    assert any("busy_worker (test_profiler.py:" in stack for stack in worker_stacks)
+    line = profiler.render_collapsed(result["stacks"]).splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+def test_only_one_profile_at_a_time():
+    sampler = profiler.SamplingProfiler()
+    thread = threading.Thread(target=sampler.sample, args=(0.3,))
+    thread.start()
+    time.sleep(0.05)
+    with pytest.raises(profiler.ProfilerBusyError):
+        sampler.sample(0.1)
+    thread.join()
+
+def test_tracemalloc_diff_attributes_growth():
+    tracker = profiler.MemoryTracker()
+    tracker.start()
+    try:
+        retained = [bytearray(1024) for _ in range(2000)]
+        report = tracker.diff(limit=5)
+    finally:
+        tracker.stop()
+    assert report["top"][0]["size_diff_bytes"] >= 1024 * 2000
+    assert "test_profiler.py" in report["top"][0]["location"]
+    assert retained
+
+def test_tracemalloc_diff_ignores_own_allocations():
+    tracker = profiler.MemoryTracker()
+    tracemalloc.start()
+    try:
+        # Snapshot cũ còn sống lúc chụp mốc: cấp phát nằm trong tracemalloc.py
+        held = tracemalloc.take_snapshot()
+        tracker.start()
+        del held
+        report = tracker.diff(limit=1000)
+    finally:
+        tracker.stop()
+    assert not [stat for stat in report["top"] if "tracemalloc.py" in stat["location"]]
+
+def test_profile_endpoints_are_owner_only():
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        assert client.get("/api/admin/profile?seconds=0.1").status_code == 403
+        assert client.post("/api/admin/tracemalloc/start").status_code == 403
+
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        response = client.get("/api/admin/profile?seconds=0.2&interval_ms=5")
+        assert response.status_code == 200
+        assert int(response.headers["x-profile-samples"]) > 0
+        assert "MainThread" in response.text
+
+        assert client.get("/api/admin/tracemalloc/diff").status_code == 400
+        assert client.post("/api/admin/tracemalloc/start").json()["tracing"] is True
+        assert "top" in client.get("/api/admin/tracemalloc/diff?limit=3").json()
+        assert client.post("/api/admin/tracemalloc/stop").json()["tracing"] is False
@@ -0,0 +1,119 @@
+"""
+Test ngân sách query cho từng API route
+Chạy app in-process trên SQLite tạm, bật Server-Timing và kiểm tra số câu SQL mỗi request.
+Số query không được tăng theo số dòng dữ liệu (N+1).
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import query_stats
+from database_production import SessionLocal, Building, Handover, Payment, User
+
+# Số câu SQL tối đa cho mỗi GET route (gồm 1 query xác thực user)
+GET_BUDGETS = {
+    "/api/time-info": 0,
+    "/api/payments": 4,
+    "/api/dashboard": 4,
+    "/api/handovers": 6,
+    "/api/users": 3,
+    "/api/recipients": 3,
+    "/api/buildings": 3,
+    "/api/payments/{payment_id}": 2,
+    "/api/handovers/{handover_id}": 2,
+    "/api/admin/slow-queries": 1,
+    "/api/admin/usage": 1,
+    "/api/reports/timeseries": 3,
+    "/api/reports/breakdown": 4,
+    "/api/cash/balance": 2,
+    "/api/cash/balances": 2,
+    "/api/cash/audit": 5,
+    "/api/admin/anomalies": 3,
+}
+# Route không kiểm tra: không truy cập DB, phụ thuộc dịch vụ ngoài hoặc công cụ chẩn đoán
+SKIPPED_ROUTES = {
+    "/api/logout", "/api/gdrive/backups", "/api/admin/profile", "/api/admin/tracemalloc/diff",
+    "/api/admin/export/parquet",  # quét toàn bộ bảng theo batch, trả file zip
+}
+
+@pytest.fixture(scope="module")
+def client():
+    query_stats.SERVER_TIMING_ENABLED = True
+    with TestClient(main.app) as test_client:
+        seed_data(rows=40)
+        response = test_client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        assert response.status_code == 200, response.text
+        yield test_client
+    query_stats.SERVER_TIMING_ENABLED = False
+
+def seed_data(rows):
+    """Đủ dữ liệu để N+1 lộ ra (mỗi bàn giao khác tòa nhà / người bàn giao)"""
+    db = SessionLocal()
+    try:
+        users = db.query(User).all()
+        buildings = [Building(name=f"Tòa nhà test {i}", is_active=True) for i in range(5)]
+        db.add_all(buildings)
+        db.flush()
+        for i in range(rows):
+            building = buildings[i % len(buildings)]
+            user = users[i % len(users)]
+            db.add(Payment(
+                booking_id=f"QB{i:04d}", guest_name=f"Khách {i}", building_id=building.id,
+                amount_due=1_000_000, amount_collected=900_000, payment_method="cash",
+                collected_by=user.full_name, added_by_user_id=user.id
+            ))
+            db.add(Handover(
+                building_id=building.id, from_person=user.full_name, to_person="Kế toán",
+                amount=500_000, handover_by_user_id=user.id
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+def concrete_path(path):
+    return path.replace("{payment_id}", "1").replace("{handover_id}", "1")
+
+def test_every_get_api_route_has_budget():
+    routes = {
+        route.path for route in main.app.routes
+        if "GET" in getattr(route, "methods", ()) and route.path.startswith("/api/")
+    }
+    missing = routes - set(GET_BUDGETS) - SKIPPED_ROUTES
+    assert not missing, f"Thiếu query budget cho: {sorted(missing)}"
+
+@pytest.mark.parametrize("path,budget", sorted(GET_BUDGETS.items()))
+def test_get_route_query_budget(client, path, budget):
+    response = client.get(concrete_path(path))
+    assert response.status_code == 200, response.text
+    query_stats.assert_query_budget(response, budget, label=path)
+
+def test_write_route_query_budget(client):
+    response = client.post("/api/payments", data={
+        "booking_id": "QB-NEW", "guest_name": "Khách mới", "building_id": 1,
+        "amount_due": 500_000, "amount_collected": 500_000,
+        "payment_method": "cash", "collected_by": "Admin System"
+    })
+    assert response.status_code == 200, response.text
+    # +3: upsert ledger_daily_summary + cash_balances, tăng change_versions
+    query_stats.assert_query_budget(response, 6, label="POST /api/payments")
+
+    response = client.post("/api/handovers", data={"building_id": 1, "to_person": "Kế toán", "amount": 100_000})
+    assert response.status_code == 200, response.text
+    query_stats.assert_query_budget(response, 8, label="POST /api/handovers")
+
+@pytest.mark.parametrize("path", ["/api/payments", "/api/dashboard", "/api/handovers", "/api/buildings"])
+def test_not_modified_query_budget(client, path):
+    etag = client.get(path).headers["ETag"]
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # Xác thực + đọc change_versions, không tải dữ liệu
+    query_stats.assert_query_budget(response, 2, label=f"304 {path}")
+
+def test_repeated_statement_is_flagged():
+    stats = query_stats.QueryStats()
+    for _ in range(6):
+        stats.record("SELECT users.id FROM users\n  WHERE users.id = ?", 0.001)
+    stats.record("SELECT buildings.id FROM buildings WHERE buildings.id IN (?, ?, ?)", 0.001)
+    repeated = stats.repeated_shapes(threshold=5)
+    assert repeated == [("SELECT users.id FROM users WHERE users.id = ?", 6)]
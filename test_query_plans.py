@@ -0,0 +1,143 @@
+"""
+Test query plan - chặn việc một thay đổi biến index lookup thành full scan
+Gọi endpoint thật, ghi lại câu SQL nó chạy rồi EXPLAIN lại từng câu:
+SQLite `EXPLAIN QUERY PLAN`, PostgreSQL `EXPLAIN` (tắt seqscan để planner chọn index nếu dùng được).
+"""
+
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from database_production import engine
+from generate_data import generate
+
+# (route, user) -> {bảng: các cách truy cập mong đợi}
+#   "ix_..."   dùng index này
+#   "pk"       tra theo primary key
+#   "scan"     full scan là chủ ý (danh sách không lọc của owner)
+AUTH = "ix_users_username"
+VERSIONS = {"pk"}  # change_versions cho ETag / key gộp request (conditional_get.py)
+EXPECTED_ACCESS = {
+    ("POST /api/login", "admin"): {"users": {AUTH}},
+    ("GET /api/payments", "admin"): {"users": {AUTH}, "change_versions": VERSIONS, "payments": {"scan"}},
+    ("GET /api/payments", "assistant1"): {
+        "users": {AUTH}, "change_versions": VERSIONS, "payments": {"ix_payments_added_by_created"},
+    },
+    # Dashboard đọc bảng tổng hợp theo ngày, không chạm payments/handovers
+    ("GET /api/dashboard", "admin"): {
+        "users": {AUTH}, "change_versions": VERSIONS, "ledger_daily_summary": {"scan"},
+    },
+    ("GET /api/dashboard", "assistant1"): {
+        "users": {AUTH}, "change_versions": VERSIONS,
+        "ledger_daily_summary": {"ix_ledger_summary_user_day", "scan"}, "cash_balances": {"pk"},
+    },
+    ("GET /api/reports/timeseries", "admin"): {
+        "users": {AUTH}, "change_versions": VERSIONS, "ledger_daily_summary": {"pk"},
+    },
+    ("GET /api/reports/breakdown", "admin"): {
+        "users": {AUTH}, "change_versions": VERSIONS, "ledger_daily_summary": {"pk"}, "buildings": {"pk"},
+    },
+    ("GET /api/handovers", "admin"): {
+        "users": {AUTH, "pk"}, "change_versions": VERSIONS, "handovers": {"scan"}, "buildings": {"pk"},
+    },
+    ("DELETE /api/buildings/{id}", "admin"): {
+        "users": {AUTH}, "buildings": {"pk"}, "payments": {"ix_payments_building_id"},
+    },
+}
+PASSWORDS = {"admin": "admin123", "assistant1": "assistant123"}
+
+_TABLE = re.compile(r"\bFROM\s+(\w+)", re.IGNORECASE)
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        # Thread poll của invalidation bus cũng chạy SELECT change_versions trên engine -> dừng để
+        # `captured` chỉ thấy SQL của request
+        main.invalidation_bus.stop()
+        generate(buildings=5, users=5, payments=3000, handovers=300, seed=40, verbose=False)
+        yield test_client
+
+@pytest.fixture
+def captured():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+def explain(statement, parameters):
+    """Plan dạng list dòng text"""
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            return [row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters)]
+        return [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+def access_path(plan, table):
+    """'scan' / 'pk' / tên index mà plan dùng cho bảng
+
+    SQLite:     "SEARCH payments USING INDEX ix_x (a=?)", "SCAN payments", "SEARCH users USING INTEGER PRIMARY KEY"
+    PostgreSQL: "Index Scan using ix_x on payments", "Seq Scan on payments",
+                "Bitmap Heap Scan on payments" + "Bitmap Index Scan on ix_x"
+    """
+    bitmap_heap = False
+    for line in plan:
+        if re.search(rf"\b(SCAN|SEARCH) {table}\b", line) or re.search(rf"\bon {table}\b", line):
+            # sqlite_autoindex_<bảng>_1: index của primary key nhiều cột
+            if "PRIMARY KEY" in line or f"{table}_pkey" in line or f"sqlite_autoindex_{table}_" in line:
+                return "pk"
+            match = re.search(r"(?:USING (?:COVERING )?INDEX|using) (\w+)", line)
+            if match:
+                return match.group(1)
+            if "Bitmap Heap Scan" in line:
+                bitmap_heap = True
+                continue
+            return "scan"
+        match = re.search(r"Bitmap Index Scan on (\w+)", line)
+        if match and bitmap_heap:
+            return "pk" if match.group(1) == f"{table}_pkey" else match.group(1)
+    return None
+
+def login(client, username):
+    response = client.post("/api/login", data={"username": username, "password": PASSWORDS[username]})
+    assert response.status_code == 200
+
+def issue_request(client, route):
+    """(method, path) cụ thể cho route"""
+    method, path = route.split(" ", 1)
+    if path == "/api/buildings/{id}":
+        # Tạo tòa nhà trống để xóa (request tạo không tính)
+        building_id = client.post("/api/buildings", data={"name": "Tòa nhà xóa thử"}).json()["building_id"]
+        path = f"/api/buildings/{building_id}"
+    return method, path
+
+@pytest.mark.parametrize("route,username", sorted(EXPECTED_ACCESS))
+def test_endpoint_uses_expected_indexes(client, captured, route, username):
+    login(client, username)
+    method, path = issue_request(client, route)
+    data = {"username": username, "password": PASSWORDS[username]} if path == "/api/login" else None
+    captured.clear()
+    response = client.request(method, path, data=data)
+    assert response.status_code == 200, response.text
+
+    expected = EXPECTED_ACCESS[(route, username)]
+    seen = {}
+    for statement, parameters in captured:
+        plan = explain(statement, parameters)
+        plan_text = "\n    ".join(plan)
+        for table in set(_TABLE.findall(statement)):
+            actual = access_path(plan, table)
+            assert table in expected, f"{route}: truy vấn bảng {table} chưa khai báo trong EXPECTED_ACCESS\n{statement}"
+            assert actual in expected[table], (
+                f"{route} ({username}): {table} dùng '{actual}', mong đợi {sorted(expected[table])}\n"
+                f"SQL: {statement}\nPlan:\n    {plan_text}"
+            )
+            seen.setdefault(table, set()).add(actual)
+    assert seen == expected, f"{route}: truy cập thực tế {seen} khác mong đợi {expected}"
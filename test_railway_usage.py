@@ -0,0 +1,101 @@
+"""
+Test usage accounting: active window từ request, awake/idle, ring buffer file, dự báo tháng
+"""
+
+import datetime
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+import railway_monitor
+from railway_monitor import RailwayMonitor, UsageTracker
+
+def make_tracker(tmp_path, start):
+    clock = {"now": start}
+    monitor = RailwayMonitor(str(tmp_path / "usage.json"))
+    tracker = UsageTracker(monitor, sleep_after=600, clock=lambda: clock["now"])
+    return tracker, clock
+
+def at(hour, minute=0):
+    return datetime.datetime(2026, 3, 10, hour, minute).timestamp()
+
+def test_active_window_merges_close_requests(tmp_path):
+    tracker, clock = make_tracker(tmp_path, at(8))
+    tracker.record_request(at(9))
+    tracker.record_request(at(9, 5))    # trong cửa sổ 10 phút -> chỉ kéo dài 5 phút
+    tracker.record_request(at(12))      # sau khi đã ngủ -> cửa sổ mới
+    clock["now"] = at(13)
+    tracker.flush()
+
+    day = tracker.monitor.usage_data["daily_stats"]["2026-03-10"]
+    assert day["requests"] == 3
+    assert day["active_seconds"] == 15 * 60 + 10 * 60
+    assert day["awake_seconds"] == 5 * 3600
+
+    series = tracker.monitor.get_usage_series()
+    assert series[0]["idle_hours"] == round(5 - 25 / 60, 3)
+
+def test_flush_persists_and_reloads(tmp_path):
+    tracker, clock = make_tracker(tmp_path, at(8))
+    tracker.record_request(at(8, 30))
+    clock["now"] = at(9)
+    tracker.flush()
+
+    saved = json.loads((tmp_path / "usage.json").read_text())
+    assert saved["daily_usage"]["2026-03-10"] == round(600 / 3600, 4)
+    reloaded = RailwayMonitor(str(tmp_path / "usage.json"))
+    assert reloaded.usage_data["daily_stats"]["2026-03-10"]["requests"] == 1
+
+def test_history_is_a_ring_buffer(tmp_path, monkeypatch):
+    monkeypatch.setattr(railway_monitor, "USAGE_HISTORY_DAYS", 3)
+    monitor = RailwayMonitor(str(tmp_path / "usage.json"))
+    for day in range(1, 6):
+        monitor.record_activity({f"2026-03-0{day}": {"requests": 1, "active_seconds": 3600, "awake_seconds": 3600}})
+    assert sorted(monitor.usage_data["daily_stats"]) == ["2026-03-03", "2026-03-04", "2026-03-05"]
+    assert sorted(monitor.usage_data["daily_usage"]) == ["2026-03-03", "2026-03-04", "2026-03-05"]
+
+def test_projection_uses_tracked_days(tmp_path):
+    monitor = RailwayMonitor(str(tmp_path / "usage.json"))
+    monitor.usage_data["daily_usage"] = {"2026-12-20": 10, "2026-12-21": 10}
+    # 20 giờ trong 2 ngày -> 10h/ngày cho 10 ngày còn lại của tháng 12
+    assert monitor.get_monthly_projection(datetime.datetime(2026, 12, 21, 12)) == 20 + 10 * 10
+
+def test_concurrent_flushes_do_not_lose_counters(tmp_path):
+    tracker, clock = make_tracker(tmp_path, at(8))
+    monitor = tracker.monitor
+    # Đọc-cộng-ghi chậm: không giữ lock thì flush thread và API flush cùng đọc một giá trị cũ
+    class SlowDay(dict):
+        def get(self, key, default=None):
+            value = super().get(key, default)
+            time.sleep(0.0005)
+            return value
+
+    monitor.usage_data["daily_stats"]["2026-03-10"] = SlowDay(railway_monitor.empty_day())
+
+    def worker():
+        for _ in range(50):
+            tracker.record_request(at(9))
+            tracker.flush()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert monitor.usage_data["daily_stats"]["2026-03-10"]["requests"] == 400
+    with open(monitor.usage_file) as f:
+        assert json.load(f)["daily_stats"]["2026-03-10"]["requests"] == 400
+
+def test_usage_endpoint_counts_requests():
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        client.get("/api/buildings")
+        client.get("/health")
+        report = client.get("/api/admin/usage").json()
+    assert report["free_tier_hours"] == 500
+    assert report["days"][-1]["requests"] >= 2
+    assert report["days"][-1]["active_hours"] > 0
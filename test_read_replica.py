@@ -0,0 +1,64 @@
+"""
+Test routing đọc/ghi giữa primary và read replica
+Dùng 2 file SQLite độc lập để mô phỏng primary + replica trên máy local
+"""
+
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database_production import Base, Building, ReplicaRouter, RoutingSession, build_sqlite_engine
+
+def make_cluster(tmp_path, max_staleness=0.2):
+    """Tạo primary + replica, mỗi bên có một tòa nhà với tên khác nhau để nhận biết"""
+    primary = build_sqlite_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = build_sqlite_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine, name in ((primary, "primary"), (replica, "replica")):
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(Building.__table__.insert(), [{"name": name, "is_active": True}])
+
+    router = ReplicaRouter(primary, [replica], max_staleness=max_staleness)
+    Session = sessionmaker(autoflush=False, bind=primary, class_=RoutingSession, router=router)
+    return router, Session
+
+def read_building_names(Session, router):
+    db = Session(read_engine=router.pick_read_engine())
+    try:
+        return [b.name for b in db.query(Building).order_by(Building.id).all()]
+    finally:
+        db.close()
+
+def test_reads_go_to_replica(tmp_path):
+    router, Session = make_cluster(tmp_path)
+    assert read_building_names(Session, router) == ["replica"]
+
+def test_writes_go_to_primary_and_pin_reads(tmp_path):
+    router, Session = make_cluster(tmp_path)
+
+    # Ghi qua session đọc vẫn phải vào primary
+    db = Session(read_engine=router.pick_read_engine())
+    db.add(Building(name="new", is_active=True))
+    db.commit()
+    db.close()
+
+    # Read-after-write: trong staleness bound, đọc từ primary
+    assert read_building_names(Session, router) == ["primary", "new"]
+
+    # Hết staleness bound -> quay lại replica
+    time.sleep(router.max_staleness + 0.05)
+    assert read_building_names(Session, router) == ["replica"]
+
+def test_bulk_delete_counts_as_write(tmp_path):
+    router, Session = make_cluster(tmp_path)
+    db = Session()
+    db.query(Building).filter(Building.name == "nothing").delete()
+    db.commit()
+    db.close()
+    assert not router.replicas_fresh()
+
+def test_no_replica_uses_primary(tmp_path):
+    router, Session = make_cluster(tmp_path)
+    router.replicas = []
+    assert router.pick_read_engine() is router.primary
+    assert read_building_names(Session, router) == ["primary"]
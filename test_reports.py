@@ -0,0 +1,94 @@
+"""
+Test API báo cáo: gom theo ngày/tuần/tháng, breakdown theo nhóm, phạm vi theo vai trò, kiểm tra khoảng thời gian
+"""
+
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+import main
+import reports
+from database_production import Payment, User, engine, get_vietnam_time
+from generate_data import generate
+
+PASSWORDS = {"admin": "admin123", "assistant1": "assistant123"}
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as test_client:
+        generate(buildings=3, users=3, payments=1500, handovers=100, days=120, seed=42, verbose=False)
+        yield test_client
+
+def login(client, username):
+    client.post("/api/login", data={"username": username, "password": PASSWORDS[username]})
+
+def source_collected(start, end, user_id=None):
+    """Tổng đã thu tính thẳng từ payments"""
+    query = select(func.count(Payment.id), func.coalesce(func.sum(Payment.amount_collected), 0)).where(
+        Payment.created_at >= start, Payment.created_at < end + timedelta(days=1))
+    if user_id is not None:
+        query = query.where(Payment.added_by_user_id == user_id)
+    with engine.connect() as conn:
+        return conn.execute(query).one()
+
+def test_monthly_timeseries_matches_payments(client):
+    login(client, "admin")
+    end = get_vietnam_time().date()
+    start = end - timedelta(days=119)
+    response = client.get("/api/reports/timeseries", params={"start": start, "end": end, "bucket": "month"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("private, max-age=")
+
+    report = response.json()
+    assert [row["period"] for row in report["series"]] == sorted({
+        (start + timedelta(days=offset)).strftime("%Y-%m") for offset in range(120)})
+    count, collected = source_collected(start, end)
+    assert report["totals"]["payment_count"] == count
+    assert abs(report["totals"]["amount_collected"] - collected) < 1
+
+def test_week_buckets_start_on_monday_and_include_empty_weeks(client):
+    login(client, "admin")
+    report = client.get("/api/reports/timeseries", params={
+        "start": "2020-01-01", "end": "2020-01-31", "bucket": "week"}).json()
+    starts = [date.fromisoformat(row["start"]) for row in report["series"]]
+    assert all(day.weekday() == 0 for day in starts)
+    assert len(starts) == 5 and report["totals"]["payment_count"] == 0
+
+def test_breakdowns_add_up_to_timeseries_totals(client):
+    login(client, "admin")
+    params = {"start": get_vietnam_time().date() - timedelta(days=89)}
+    totals = client.get("/api/reports/timeseries", params=params).json()["totals"]
+    for by in ("building", "payment_method", "collector"):
+        breakdown = client.get("/api/reports/breakdown", params=dict(params, by=by)).json()
+        assert breakdown["totals"]["payment_count"] == totals["payment_count"]
+        assert abs(breakdown["totals"]["amount_collected"] - totals["amount_collected"]) < 1
+        assert all(row["label"] for row in breakdown["rows"])
+
+def test_assistant_only_sees_own_payments(client):
+    login(client, "assistant1")
+    end = get_vietnam_time().date()
+    start = end - timedelta(days=119)
+    report = client.get("/api/reports/timeseries", params={"start": start, "end": end}).json()
+    with engine.connect() as conn:
+        user_id = conn.execute(select(User.id).where(User.username == "assistant1")).scalar()
+    assert report["totals"]["payment_count"] == source_collected(start, end, user_id)[0]
+
+@pytest.mark.parametrize("params", [
+    {"start": "2026-02-01", "end": "2026-01-01"},
+    {"start": "2020-01-01", "end": "2026-01-01"},
+    {"bucket": "hour"},
+])
+def test_invalid_ranges_are_rejected(client, params):
+    login(client, "admin")
+    assert client.get("/api/reports/timeseries", params=params).status_code == 400
+
+def test_invalid_breakdown_dimension_is_rejected(client):
+    login(client, "admin")
+    assert client.get("/api/reports/breakdown", params={"by": "guest"}).status_code == 400
+
+def test_default_range_is_recent_days():
+    start, end = reports.resolve_range(today=date(2026, 3, 31))
+    assert end == date(2026, 3, 31)
+    assert (end - start).days + 1 == reports.REPORT_DEFAULT_DAYS
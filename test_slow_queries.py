@@ -0,0 +1,101 @@
+"""
+Test slow query log: ngưỡng, dạng tham số, EXPLAIN QUERY PLAN trên SQLite, endpoint owner
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import main
+import query_stats
+from slow_queries import SlowQueryLog, explain, parameters_shape, slow_query_log
+
+@pytest.fixture
+def capture_all():
+    """Ngưỡng 0.000001ms -> mọi câu SQL đều bị coi là chậm"""
+    original = slow_query_log.threshold_ms
+    slow_query_log.threshold_ms = 0.000001
+    slow_query_log.clear()
+    yield slow_query_log
+    slow_query_log.threshold_ms = original
+    slow_query_log.clear()
+
+def test_parameters_shape_hides_values():
+    assert parameters_shape(("Nguyễn Văn A", 500000)) == ["str", "int"]
+    assert parameters_shape({"guest": "A", "amount": 1.5}) == {"guest": "str", "amount": "float"}
+    assert parameters_shape([(1, "a"), (2, "b")], executemany=True) == {"executemany": 2, "row": ["int", "str"]}
+
+def test_sqlite_plan_is_captured(capture_all):
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE payments (id INTEGER PRIMARY KEY, guest_name TEXT)"))
+        conn.execute(text("CREATE INDEX ix_guest ON payments (guest_name)"))
+        conn.execute(text("SELECT id FROM payments WHERE guest_name = :guest"), {"guest": "Khách"}).all()
+
+    entry = capture_all.recent(1)[0]
+    assert entry["statement"].startswith("SELECT id FROM payments")
+    assert entry["parameters"] == ["str"]
+    assert any("ix_guest" in line for line in entry["plan"])
+    # DDL không EXPLAIN
+    ddl = [e for e in capture_all.recent() if e["statement"].startswith("CREATE TABLE")]
+    assert ddl and ddl[0]["plan"] is None
+
+def test_explain_is_cached_per_statement_shape():
+    log = SlowQueryLog(threshold_ms=0.000001, explain_ttl=300)
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        for value in range(3):
+            log.record(conn, "SELECT :v", {"v": value}, 1.0, "SELECT ?")
+    assert len(log.recent()) == 3
+    assert len(log._explained) == 1
+
+class FakePostgresConnection:
+    """DBAPI giả lập hành vi PostgreSQL: câu lỗi trong transaction -> mọi câu sau lỗi đến khi rollback"""
+
+    autocommit = False
+
+    def __init__(self):
+        self.executed = []
+        self.aborted = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, parameters=None):
+        self.executed.append(sql.split(" (")[0] if sql.startswith("EXPLAIN") else sql)
+        if sql.startswith("ROLLBACK TO SAVEPOINT"):
+            self.aborted = False
+            return
+        if self.aborted:
+            raise RuntimeError("current transaction is aborted")
+        if sql.startswith("EXPLAIN"):
+            self.aborted = True
+            raise RuntimeError("EXPLAIN lỗi")
+
+    def close(self):
+        pass
+
+def test_failed_postgres_explain_does_not_abort_request_transaction():
+    conn = FakePostgresConnection()
+    with pytest.raises(RuntimeError, match="EXPLAIN lỗi"):
+        explain(conn, "postgresql", "SELECT * FROM payments WHERE id = %(id)s", {"id": 1})
+    assert conn.executed == ["SAVEPOINT slow_query_explain", "EXPLAIN", "ROLLBACK TO SAVEPOINT slow_query_explain"]
+    conn.execute("SELECT 1")  # câu tiếp theo của request vẫn chạy được
+
+def test_threshold_disables_log():
+    assert not SlowQueryLog(threshold_ms=0).is_slow(10)
+    assert SlowQueryLog(threshold_ms=100).is_slow(0.2)
+    assert not SlowQueryLog(threshold_ms=100).is_slow(0.05)
+
+def test_slow_queries_endpoint_reports_route(capture_all):
+    with TestClient(main.app) as client:
+        client.post("/api/login", data={"username": "assistant1", "password": "assistant123"})
+        assert client.get("/api/admin/slow-queries").status_code == 403
+
+        client.post("/api/login", data={"username": "admin", "password": "admin123"})
+        client.get("/api/payments")
+        entries = client.get("/api/admin/slow-queries").json()["entries"]
+        payment_queries = [e for e in entries if e["route"] == "GET /api/payments"]
+        assert payment_queries and payment_queries[0]["plan"]
+
+        assert client.delete("/api/admin/slow-queries").json()["success"] is True
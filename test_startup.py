@@ -0,0 +1,63 @@
+"""
+Test khởi động: BootTimer, bootstrap database theo version (chỉ seed user khi có migration), /health/boot
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import init_railway_users
+import main
+import migrations
+from database_production import engine
+from startup import BootTimer, bootstrap_database
+
+@pytest.fixture
+def seed_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(init_railway_users, "init_production_users", lambda: calls.append("seed"))
+    return calls
+
+def test_boot_timer_records_steps():
+    timer = BootTimer()
+    timer.mark("import")
+    assert timer.measure("work", lambda value: value * 2, 21) == 42
+    report = timer.report()
+    assert list(report["steps"]) == ["import", "work"]
+    assert report["total_seconds"] == round(sum(report["steps"].values()), 4)
+    assert timer.summary_line().startswith("⏱️ Boot ")
+    assert "work " in timer.summary_line()
+
+def test_bootstrap_seeds_users_only_after_migration(monkeypatch, seed_calls):
+    monkeypatch.setattr(migrations, "run_migrations", lambda verbose=True: [])
+    assert bootstrap_database() == []
+    assert seed_calls == []
+
+    monkeypatch.setattr(migrations, "run_migrations", lambda verbose=True: [migrations.LATEST_VERSION])
+    assert bootstrap_database() == [migrations.LATEST_VERSION]
+    assert seed_calls == ["seed"]
+
+def test_lifespan_bootstrap_follows_schema_version(seed_calls):
+    migrations.run_migrations(verbose=False)
+    with TestClient(main.app):
+        pass
+    assert seed_calls == []
+
+    # Database đang ở version trước -> lúc khởi động áp dụng migration cuối và seed user
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {migrations.SCHEMA_VERSION_TABLE} WHERE version = :v"),
+                     {"v": migrations.LATEST_VERSION})
+    with TestClient(main.app):
+        pass
+    assert seed_calls == ["seed"]
+    assert migrations.get_schema_version() == migrations.LATEST_VERSION
+
+def test_health_boot_reports_recorded_steps():
+    with TestClient(main.app) as client:
+        report = client.get("/health/boot").json()
+    steps = report["steps"]
+    for step in ("import_framework", "import_database", "import_auth", "import_app",
+                 "database_bootstrap", "startup"):
+        assert step in steps and steps[step] >= 0
+    assert report["total_seconds"] == round(sum(steps.values()), 4)
+    assert steps == main.boot_timer.report()["steps"]
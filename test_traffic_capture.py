@@ -0,0 +1,79 @@
+"""
+Test traffic capture: trace ẩn danh (route template, nhóm quyền, form bị che, bỏ ảnh) và phát lại
+"""
+
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+import load_test
+import main
+import traffic_capture
+
+class ListWriter:
+    def __init__(self):
+        self.entries = []
+
+    def write(self, entry):
+        self.entries.append(entry)
+
+def capture(requests):
+    writer = ListWriter()
+    app = traffic_capture.TrafficCaptureMiddleware(main.app, writer=writer)
+    with TestClient(app) as client:
+        client.post("/api/login", data={"username": "manager1", "password": "manager123"})
+        requests(client)
+    return writer.entries
+
+def test_mask_form_hides_values_and_images():
+    body = (
+        b'--b\r\nContent-Disposition: form-data; name="guest_name"\r\n\r\nNguyen Van A\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="amount_due"\r\n\r\n1500000\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="receipt_image"; filename="r.png"\r\n'
+        b'Content-Type: image/png\r\n\r\n\x89PNG...\r\n--b--\r\n'
+    )
+    assert traffic_capture.mask_form("multipart/form-data; boundary=b", body) == {
+        "guest_name": "text:12", "amount_due": "int", "receipt_image": "file"
+    }
+    assert traffic_capture.mask_form("application/x-www-form-urlencoded", b"username=admin&password=") == {
+        "username": "text:5", "password": "empty"
+    }
+
+def test_trace_is_anonymized():
+    uploaded = []
+
+    def requests(client):
+        client.get("/api/payments")
+        response = client.post("/api/payments", data={
+            "booking_id": "SECRET-1", "guest_name": "Khách Bí Mật", "amount_due": "1500000",
+            "amount_collected": "1500000", "payment_method": "cash", "collected_by": "Quản lý",
+        }, files={"receipt_image": ("r.png", load_test.TINY_PNG, "image/png")})
+        uploaded.append(response.json()["payment"]["receipt_image"])
+
+    entries = capture(requests)
+    load_test.remove_uploads(uploaded)
+    listing = next(e for e in entries if e["method"] == "GET" and e["route"] == "/api/payments")
+    assert listing["role"] == "manager"
+    assert listing["status"] == 200 and listing["response_bytes"] > 0
+
+    created = next(e for e in entries if e["method"] == "POST" and e["route"] == "/api/payments")
+    assert created["form"]["receipt_image"] == "file"
+    assert created["form"]["guest_name"].startswith("text:")
+    assert "SECRET" not in str(entries) and "Bí Mật" not in str(entries)
+    login = next(e for e in entries if e["route"] == "/api/login")
+    assert login["role"] == "anonymous" and login["form"]["password"].startswith("text:")
+
+
+def test_replay_reissues_trace_and_compares():
+    entries = capture(lambda client: [client.get("/api/dashboard") for _ in range(3)])
+    with TestClient(main.app):
+        results = asyncio.run(traffic_capture.replay(
+            entries, "http://replay", speed=100, transport=httpx.ASGITransport(app=main.app)
+        ))
+    assert len(results) == 3 and all(status == 200 for _, _, status in results)
+    report = traffic_capture.compare_distributions(
+        [e for e in entries if e["route"] != "/api/login"], results
+    )
+    assert report["GET /api/dashboard"]["count"] == 3
+    assert report["GET /api/dashboard"]["replay_p95_ms"] > 0
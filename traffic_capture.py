@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Traffic Capture & Replay
+Ghi lại traffic thật (đã ẩn danh) ra file NDJSON, sau đó phát lại vào bản build mới
+để so sánh phân bố latency.
+
+Mỗi dòng trace gồm: thời điểm, method, route template (+ path params dạng số),
+status, thời gian xử lý, kích thước request/response và nhóm quyền (owner/manager/
+assistant/anonymous) - không ghi user, giá trị form hay nội dung ảnh.
+
+Bật ghi bằng TRAFFIC_CAPTURE_FILE=traces.ndjson (TRAFFIC_CAPTURE_SAMPLE_RATE để lấy mẫu).
+
+Phát lại:
+    python traffic_capture.py replay traces.ndjson --target http://localhost:8000 --speed 2
+    python traffic_capture.py replay traces.ndjson --login owner=admin:admin123,assistant=assistant1:assistant123
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl
+
+TRAFFIC_CAPTURE_FILE = os.getenv("TRAFFIC_CAPTURE_FILE", "")
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1.0"))
+# Chỉ giữ phần đầu body để đọc tên field, phần còn lại (ảnh) chỉ đếm byte
+BODY_PEEK_BYTES = 64 * 1024
+SKIPPED_PREFIXES = ("/uploads", "/static", "/health", "/metrics", "/favicon")
+DEFAULT_LOGINS = "owner=admin:admin123,manager=manager1:manager123,assistant=assistant1:assistant123"
+
+_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+_PART_HEADER = re.compile(rb'Content-Disposition:\s*form-data;\s*name="([^"]*)"(;\s*filename="([^"]*)")?', re.IGNORECASE)
+
+def value_kind(value):
+    """Loại giá trị thay cho giá trị thật: int / float / text:<độ dài> / empty"""
+    if value == "":
+        return "empty"
+    if _NUMBER.match(value):
+        return "float" if "." in value else "int"
+    return f"text:{len(value)}"
+
+def mask_form(content_type, body):
+    """Tên field -> loại giá trị; file upload chỉ ghi 'file'"""
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {name: value_kind(value) for name, value in parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)}
+    if content_type.startswith("multipart/form-data"):
+        fields = {}
+        for part in body.split(b"\r\n--"):
+            match = _PART_HEADER.search(part)
+            if not match:
+                continue
+            name = match.group(1).decode("utf-8", "replace")
+            if match.group(2):
+                fields[name] = "file"
+            else:
+                value = part.split(b"\r\n\r\n", 1)[1] if b"\r\n\r\n" in part else b""
+                fields[name] = value_kind(value.rstrip(b"\r\n").decode("utf-8", "replace"))
+        return fields
+    return None
+
+def path_params(scope):
+    """Path params số (id) - đủ để phát lại, không chứa dữ liệu cá nhân"""
+    return {
+        name: value for name, value in (scope.get("path_params") or {}).items()
+        if isinstance(value, int) or _NUMBER.match(str(value))
+    }
+
+class TraceWriter:
+    """Ghi NDJSON trên thread riêng - request chỉ đẩy dict vào queue"""
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def write(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+class TrafficCaptureMiddleware:
+    """ASGI middleware ghi trace ẩn danh (opt-in qua TRAFFIC_CAPTURE_FILE)
+
+    Nhóm quyền đọc từ scope["state"]["user_role"] do get_current_user gắn vào.
+    """
+
+    def __init__(self, app, path=None, sample_rate=None, writer=None):
+        self.app = app
+        self.sample_rate = TRAFFIC_CAPTURE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.writer = writer or TraceWriter(path or TRAFFIC_CAPTURE_FILE)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"].startswith(SKIPPED_PREFIXES)
+                or (self.sample_rate < 1 and random.random() >= self.sample_rate)):
+            await self.app(scope, receive, send)
+            return
+
+        sizes = {"request": 0, "response": 0, "status": 500}
+        peek = bytearray()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                sizes["request"] += len(chunk)
+                if len(peek) < BODY_PEEK_BYTES:
+                    peek.extend(chunk[:BODY_PEEK_BYTES - len(peek)])
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                sizes["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            headers = dict(scope.get("headers") or [])
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            route = getattr(scope.get("route"), "path", None)
+            self.writer.write({
+                "t": round(started_at, 3),
+                "method": scope["method"],
+                "route": route or "unmatched",
+                "params": path_params(scope),
+                "query": {name: value_kind(value) for name, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"))},
+                "form": mask_form(content_type, bytes(peek)) if peek else None,
+                "role": scope.get("state", {}).get("user_role", "anonymous"),
+                "status": sizes["status"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "request_bytes": sizes["request"],
+                "response_bytes": sizes["response"],
+            })
+
+# --- Replay ---
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def synthetic_value(kind):
+    """Giá trị giả cùng loại với giá trị đã ẩn"""
+    if kind == "int":
+        return "1"
+    if kind == "float":
+        return "100000.0"
+    if kind == "empty":
+        return ""
+    length = int(kind.split(":", 1)[1]) if kind.startswith("text:") else 8
+    return ("x" * length)[:max(length, 1)]
+
+def build_request(entry):
+    """(method, url, data, files) từ một dòng trace"""
+    from load_test import TINY_PNG
+
+    url = entry["route"]
+    for name, value in entry.get("params", {}).items():
+        url = url.replace("{" + name + "}", str(value))
+    if entry.get("query"):
+        url += "?" + "&".join(f"{name}={synthetic_value(kind)}" for name, kind in entry["query"].items())
+    data, files = None, None
+    if entry.get("form"):
+        data = {name: synthetic_value(kind) for name, kind in entry["form"].items() if kind != "file"}
+        files = {name: ("replay.png", TINY_PNG, "image/png") for name, kind in entry["form"].items() if kind == "file"} or None
+    return entry["method"], url, data, files
+
+def parse_logins(spec):
+    """'owner=admin:admin123,...' -> {'owner': ('admin', 'admin123')}"""
+    logins = {}
+    for item in spec.split(","):
+        role, credentials = item.split("=", 1)
+        username, password = credentials.split(":", 1)
+        logins[role.strip()] = (username, password)
+    return logins
+
+def compare_distributions(trace, replayed):
+    """Theo route: p50/p95 lúc ghi vs lúc phát lại"""
+    from load_test import percentile
+
+    recorded_by_route, replayed_by_route = {}, {}
+    for entry in trace:
+        recorded_by_route.setdefault(f"{entry['method']} {entry['route']}", []).append(entry["duration_ms"])
+    for key, duration_ms, _ in replayed:
+        replayed_by_route.setdefault(key, []).append(duration_ms)
+
+    report = {}
+    for key, recorded in recorded_by_route.items():
+        recorded = sorted(recorded)
+        now = sorted(replayed_by_route.get(key, []))
+        report[key] = {
+            "count": len(recorded),
+            "recorded_p50_ms": percentile(recorded, 50), "recorded_p95_ms": percentile(recorded, 95),
+            "replay_p50_ms": round(percentile(now, 50), 2), "replay_p95_ms": round(percentile(now, 95), 2),
+            "p95_ratio": round(percentile(now, 95) / percentile(recorded, 95), 2) if now and percentile(recorded, 95) else None,
+        }
+    return report
+
+async def replay(trace, target, speed=1.0, logins=None, concurrency_limit=100, transport=None):
+    """Phát lại trace theo đúng nhịp (chia cho speed), trả về [(route, duration_ms, status)]
+
+    transport: httpx transport tùy chọn (vd ASGITransport để phát lại vào app in-process)
+    """
+    import httpx
+
+    logins = logins or parse_logins(DEFAULT_LOGINS)
+    trace = [entry for entry in trace if entry["route"] != "/api/login"]
+    if not trace:
+        return []
+    clients = {}
+    for role in {entry["role"] for entry in trace}:
+        client = httpx.AsyncClient(base_url=target, timeout=30, transport=transport)
+        if role in logins:
+            username, password = logins[role]
+            await client.post("/api/login", data={"username": username, "password": password})
+        clients[role] = client
+
+    results = []
+    semaphore = asyncio.Semaphore(concurrency_limit)
+    first = trace[0]["t"]
+    started = time.perf_counter()
+
+    async def issue(entry):
+        delay = (entry["t"] - first) / speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        method, url, data, files = build_request(entry)
+        async with semaphore:
+            request_started = time.perf_counter()
+            try:
+                response = await clients[entry["role"]].request(method, url, data=data, files=files)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            results.append((f"{entry['method']} {entry['route']}", (time.perf_counter() - request_started) * 1000, status))
+
+    try:
+        await asyncio.gather(*(issue(entry) for entry in sorted(trace, key=lambda e: e["t"])))
+    finally:
+        for client in clients.values():
+            await client.aclose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Phát lại traffic đã ghi")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay_parser = sub.add_parser("replay")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--target", default="http://localhost:8000")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="1 = nhịp thật, 5 = nhanh gấp 5")
+    replay_parser.add_argument("--login", default=DEFAULT_LOGINS, help="Tài khoản cho từng nhóm quyền")
+    replay_parser.add_argument("--tolerance", type=float, help="Exit 1 nếu p95 của route nào > (1+tolerance) lần lúc ghi")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace)
+    print(f"🔁 Phát lại {len(trace)} request vào {args.target} (x{args.speed})")
+    results = asyncio.run(replay(trace, args.target, args.speed, parse_logins(args.login)))
+    report = compare_distributions(trace, results)
+
+    errors = sum(1 for _, _, status in results if status == 0 or status >= 500)
+    print(f"{'route':<45} {'n':>5} {'p50 ghi':>9} {'p50 mới':>9} {'p95 ghi':>9} {'p95 mới':>9} {'x p95':>6}")
+    for key, row in sorted(report.items(), key=lambda item: -item[1]["count"]):
+        print(f"{key:<45} {row['count']:>5} {row['recorded_p50_ms']:>9.1f} {row['replay_p50_ms']:>9.1f} "
+              f"{row['recorded_p95_ms']:>9.1f} {row['replay_p95_ms']:>9.1f} {row['p95_ratio'] or '-':>6}")
+    print(f"\nLỗi 5xx/kết nối: {errors}/{len(results)}")
+
+    if args.tolerance is not None:
+        slower = [key for key, row in report.items() if row["p95_ratio"] and row["p95_ratio"] > 1 + args.tolerance]
+        if slower:
+            print("🔴 Chậm hơn lúc ghi: " + ", ".join(slower))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())